@@ -0,0 +1,187 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:
+    AESGCM = None
+
+# Bytes of plaintext encrypted and decrypted to measure bulk throughput
+BULK_BYTES = 1024 * 1024
+# Bytes of authenticated header data in a typical message
+HEADER_BYTES = 200
+DATA_KEY_BYTES = 32
+
+
+def _time_operation(operation, iterations, repeat):
+    """Measure the fastest time of a single call of an operation, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        elapsed = (time.perf_counter() - start) / iterations
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000.0
+
+
+def _message_operation():
+    """Derive a data key and authenticate a header, once to encrypt and once to decrypt."""
+    data_key = os.urandom(DATA_KEY_BYTES)
+    header = os.urandom(HEADER_BYTES)
+    nonce = bytes(12)
+
+    def _operation():
+        for _ in range(2):
+            derived = HKDF(
+                algorithm=hashes.SHA384(),
+                length=DATA_KEY_BYTES,
+                salt=None,
+                info=header[:20],
+                backend=default_backend(),
+            ).derive(data_key)
+            AESGCM(derived).encrypt(nonce, b"", header)
+
+    return _operation
+
+
+def _bulk_operation():
+    """Encrypt and decrypt a large plaintext with AES-GCM."""
+    cipher = AESGCM(os.urandom(DATA_KEY_BYTES))
+    plaintext = os.urandom(BULK_BYTES)
+    nonce = bytes(12)
+
+    def _operation():
+        cipher.decrypt(nonce, cipher.encrypt(nonce, plaintext, None), None)
+
+    return _operation
+
+
+def _aes_operation():
+    """Wrap and unwrap a data key with a raw AES key."""
+    cipher = AESGCM(os.urandom(DATA_KEY_BYTES))
+    data_key = os.urandom(DATA_KEY_BYTES)
+    nonce = bytes(12)
+
+    def _operation():
+        cipher.decrypt(nonce, cipher.encrypt(nonce, data_key, b""), b"")
+
+    return _operation
+
+
+def _rsa_operation():
+    """Wrap and unwrap a data key with a 2048-bit raw RSA key."""
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
+    )
+    public_key = private_key.public_key()
+    oaep = padding.OAEP(
+        mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+    )
+    data_key = os.urandom(DATA_KEY_BYTES)
+
+    def _operation():
+        private_key.decrypt(public_key.encrypt(data_key, oaep), oaep)
+
+    return _operation
+
+
+def _signature_operation():
+    """Sign and verify a message with ECDSA on P-384, as the signed algorithm suites do."""
+    private_key = ec.generate_private_key(ec.SECP384R1(), default_backend())
+    public_key = private_key.public_key()
+    message = os.urandom(HEADER_BYTES)
+    algorithm = ec.ECDSA(hashes.SHA384())
+
+    def _operation():
+        public_key.verify(private_key.sign(message, algorithm), message, algorithm)
+
+    return _operation
+
+
+def calibrate(iterations, repeat):
+    """Measure the cost weights of local operations.
+
+    :param int iterations: Number of times to call each operation per measurement
+    :param int repeat: Number of measurements of each operation, of which the fastest is kept
+    :returns: Map of cost weight names to milliseconds
+    """
+    weights = {
+        "message": _time_operation(_message_operation(), iterations, repeat),
+        "kib": _time_operation(_bulk_operation(), max(1, iterations // 100), repeat)
+        / (BULK_BYTES / 1024.0),
+        "aes": _time_operation(_aes_operation(), iterations, repeat),
+        "rsa-2048": _time_operation(_rsa_operation(), max(1, iterations // 10), repeat),
+        "signature": _time_operation(_signature_operation(), max(1, iterations // 10), repeat),
+    }
+    return {name: round(weight, 6) for name, weight in weights.items()}
+
+
+def main(args=None):
+    """Entry point for CLI"""
+    parser = argparse.ArgumentParser(
+        description="Measure the cost weights used to estimate the cost of generated manifests."
+    )
+    parser.add_argument(
+        "--output", default="-", help="Write the cost weights to this file (default: stdout)"
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=1000,
+        help="Number of times to call each fast operation per measurement (default: 1000)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of measurements to take (default: 5)"
+    )
+    parser.add_argument(
+        "--kms-latency",
+        type=float,
+        metavar="MILLISECONDS",
+        help="Round-trip time to AWS KMS to record for encrypting and decrypting a data key, "
+        "which cannot be measured locally",
+    )
+
+    parsed = parser.parse_args(args)
+    if AESGCM is None:
+        parser.error("Calibration requires the cryptography package")
+    if parsed.iterations < 1 or parsed.repeat < 1:
+        parser.error("--iterations and --repeat must be at least 1")
+
+    weights = calibrate(parsed.iterations, parsed.repeat)
+    if parsed.kms_latency is not None:
+        weights["aws-kms"] = parsed.kms_latency
+
+    report = json.dumps(weights, indent=4, sort_keys=True)
+    if parsed.output == "-":
+        print(report)
+    else:
+        with open(parsed.output, "w") as weights_file:
+            weights_file.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+FEATURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "features")
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+GENERATORS = {
+    "0002": "0002-keys-generate",
+    "0003": "0003-awses-message-encryption-generate",
+    "0006": "0006-awses-message-decryption-generation-generate",
+}
+DEFAULT_KEY_COUNTS = (10, 100, 1000)
+
+# Key spec entry and fraction of synthetic keys of each kind; one encrypt-only key of each
+# asymmetric kind is always added, so that every kind of provider set is built
+# without the number of provider sets growing quadratically
+SYNTHETIC_KEY_MIX = (
+    ({"algorithm": "aes", "bits": 256}, 0.4),
+    ({"algorithm": "rsa", "bits": 2048}, 0.3),
+    ({"algorithm": "aws-kms"}, 0.3),
+)
+SYNTHETIC_ENCRYPT_ONLY_KEYS = (
+    {"algorithm": "rsa", "bits": 2048, "role": "encrypt-only", "count": 1},
+    {"algorithm": "aws-kms", "role": "encrypt-only", "count": 1},
+)
+
+# Relative increase in wall time or peak RSS over the baseline that is reported as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def _load_generator(name):
+    """Import one of the hyphenated generator scripts as a module."""
+    if FEATURES_DIRECTORY not in sys.path:
+        sys.path.insert(0, FEATURES_DIRECTORY)
+    spec = importlib.util.spec_from_file_location(
+        name.replace("-", "_"), os.path.join(FEATURES_DIRECTORY, name + ".py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_key_spec(key_count):
+    """Build a key spec (see :func:`synthetic_key_utils.load_key_spec`) for roughly the
+    requested number of keys.
+
+    :param int key_count: Number of keys
+    """
+    spec = [
+        dict(entry, count=max(1, int(round(key_count * fraction))))
+        for entry, fraction in SYNTHETIC_KEY_MIX
+    ]
+    spec.extend(SYNTHETIC_ENCRYPT_ONLY_KEYS)
+    return {"keys": spec}
+
+
+def write_synthetic_keys(key_count, directory, cache_directory=None):
+    """Write a synthetic keys manifest, as built by ``0002-keys-generate.py --spec``.
+
+    :param int key_count: Number of keys
+    :param str directory: Directory in which to write the key spec and keys manifest
+    :param str cache_directory: Directory in which to cache generated RSA keys (optional)
+    :returns: Name of the keys manifest file
+    """
+    spec_filename = os.path.join(directory, "spec-{}.json".format(key_count))
+    with open(spec_filename, "w") as spec_file:
+        json.dump(synthetic_key_spec(key_count), spec_file)
+    keys = _load_generator(GENERATORS["0002"]).build_synthetic_manifest(
+        spec_filename, cache_directory=cache_directory
+    )
+    keys_filename = os.path.join(directory, "keys-{}.json".format(key_count))
+    with open(keys_filename, "w") as keys_file:
+        json.dump(keys, keys_file)
+    return keys_filename
+
+
+class _CountingStream(object):
+    """Text stream that discards everything written to it, counting the UTF-8 encoded bytes."""
+
+    def __init__(self):
+        self.byte_count = 0
+
+    def write(self, data):
+        self.byte_count += len(data.encode("utf-8"))
+
+
+def _scale_matrix(modules, matrix_scale):
+    """Add frame sizes to the scenario matrix to give it ``matrix_scale`` times as many cells."""
+    utils = sys.modules["awses_message_encryption_utils"]
+    frame_sizes = tuple(utils.FRAME_SIZES)
+    extra = tuple(
+        frame_size + step for step in range(1, matrix_scale) for frame_size in frame_sizes
+    )
+    for module in [utils] + modules:
+        if hasattr(module, "FRAME_SIZES"):
+            module.FRAME_SIZES = frame_sizes + extra
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes; macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(case):
+    """Run a single benchmark case in this process.
+
+    :param dict case: ``generator``, ``keys`` (number of synthetic keys), ``keys-manifest``
+        (name of the synthetic keys manifest file) and ``matrix-scale``
+    :returns: Wall time, peak RSS and bytes emitted
+    """
+    module = _load_generator(GENERATORS[case["generator"]])
+    stream = _CountingStream()
+
+    if case["generator"] == "0002":
+        start = time.perf_counter()
+        stream.write(json.dumps(module.build_manifest()))
+        elapsed = time.perf_counter() - start
+    else:
+        _scale_matrix([module], case["matrix-scale"])
+        start = time.perf_counter()
+        module.stream_manifest(case["keys-manifest"], stream)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "wall-seconds": elapsed,
+        "peak-rss-bytes": _peak_rss_bytes(),
+        "bytes": stream.byte_count,
+    }
+
+
+def case_name(case):
+    """Build the name under which to record the results of a benchmark case."""
+    if case["generator"] == "0002":
+        return "0002"
+    return "{generator}/{keys}-keys/matrix-x{scale}".format(
+        generator=case["generator"], keys=case["keys"], scale=case["matrix-scale"]
+    )
+
+
+def _run_case_in_subprocesses(case, repeat):
+    """Run a benchmark case in fresh interpreters, so that each peak RSS is its own,
+    keeping the fastest wall time and largest peak RSS of all runs."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)]
+        )
+        runs.append(json.loads(output.decode("utf-8")))
+    return {
+        "wall-seconds": min(run["wall-seconds"] for run in runs),
+        "peak-rss-bytes": max(run["peak-rss-bytes"] for run in runs),
+        "bytes": runs[0]["bytes"],
+    }
+
+
+def compare(results, baselines, tolerance=DEFAULT_TOLERANCE):
+    """Compare benchmark results against stored baselines.
+
+    :param dict results: Map of case names to results
+    :param dict baselines: Map of case names to baseline results
+    :param float tolerance: Relative increase that is reported as a regression
+    :returns: List of descriptions of regressions, including cases without a baseline
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            regressions.append(
+                "{}: no baseline; record one with --update-baselines".format(name)
+            )
+            continue
+        for metric in ("wall-seconds", "peak-rss-bytes"):
+            if result[metric] > baseline[metric] * (1 + tolerance):
+                regressions.append(
+                    "{name}: {metric} regressed from {baseline:.6g} to {result:.6g}".format(
+                        name=name, metric=metric, baseline=baseline[metric], result=result[metric]
+                    )
+                )
+        if result["bytes"] != baseline["bytes"]:
+            regressions.append(
+                "{name}: output changed from {baseline} to {result} bytes".format(
+                    name=name, baseline=baseline["bytes"], result=result["bytes"]
+                )
+            )
+    return regressions
+
+
+def main(args=None):
+    """Entry point for CLI"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the manifest generators against synthetic keys manifests."
+    )
+    parser.add_argument(
+        "--generators",
+        default=",".join(sorted(GENERATORS)),
+        help="Comma-separated generators to benchmark (default: all)",
+    )
+    parser.add_argument(
+        "--keys",
+        default=",".join(str(count) for count in DEFAULT_KEY_COUNTS),
+        help="Comma-separated synthetic keys manifest sizes",
+    )
+    parser.add_argument(
+        "--matrix-scale",
+        default="1",
+        help="Comma-separated factors by which to grow the scenario matrix",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of times to run each case (default: 3)"
+    )
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES, help="Baselines file")
+    parser.add_argument(
+        "--update-baselines", action="store_true", help="Store these results as the baselines"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Relative increase in wall time or peak RSS that is reported as a regression",
+    )
+    parser.add_argument(
+        "--key-cache",
+        help="Directory in which to cache the RSA keys of synthetic keys manifests between runs",
+    )
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+
+    parsed = parser.parse_args(args)
+
+    if parsed.run_case:
+        print(json.dumps(run_case(json.loads(parsed.run_case))))
+        return 0
+
+    baselines = {}
+    if not parsed.update_baselines:
+        try:
+            with open(parsed.baselines, "r") as baselines_file:
+                baselines = json.load(baselines_file)
+        except FileNotFoundError:
+            parser.error(
+                "Baselines file {} does not exist; record baselines with --update-baselines".format(
+                    parsed.baselines
+                )
+            )
+
+    cases = []
+    for generator in parsed.generators.split(","):
+        if generator not in GENERATORS:
+            parser.error("Unknown generator: {}".format(generator))
+        if generator == "0002":
+            cases.append({"generator": generator, "keys": None, "matrix-scale": 1})
+            continue
+        for key_count in parsed.keys.split(","):
+            for matrix_scale in parsed.matrix_scale.split(","):
+                cases.append(
+                    {
+                        "generator": generator,
+                        "keys": int(key_count),
+                        "matrix-scale": int(matrix_scale),
+                    }
+                )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        keys_manifests = {}
+        for case in cases:
+            if case["keys"] is not None:
+                if case["keys"] not in keys_manifests:
+                    keys_manifests[case["keys"]] = write_synthetic_keys(
+                        case["keys"], directory, parsed.key_cache
+                    )
+                case["keys-manifest"] = keys_manifests[case["keys"]]
+            name = case_name(case)
+            results[name] = _run_case_in_subprocesses(case, parsed.repeat)
+            print(
+                "{name}: {wall:.3f} s, {rss:.1f} MiB peak RSS, {size} bytes".format(
+                    name=name,
+                    wall=results[name]["wall-seconds"],
+                    rss=results[name]["peak-rss-bytes"] / (1024.0 * 1024),
+                    size=results[name]["bytes"],
+                )
+            )
+
+    if parsed.update_baselines:
+        try:
+            with open(parsed.baselines, "r") as baselines_file:
+                baselines = json.load(baselines_file)
+        except FileNotFoundError:
+            pass
+        baselines.update(results)
+        with open(parsed.baselines, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=4, sort_keys=True)
+        return 0
+
+    regressions = compare(results, baselines, parsed.tolerance)
+    for regression in regressions:
+        print("REGRESSION {}".format(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
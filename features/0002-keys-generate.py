@@ -16,6 +16,8 @@ import argparse
 import base64
 import json
 import sys
+from profile_utils import Profiler
+from synthetic_key_utils import DEFAULT_SEED, generate_synthetic_keys, load_key_spec
 
 VERSION = 3
 AES_KEYS = (
@@ -126,6 +128,41 @@ AWS_KMS_KEYS = (
 )
 
 
+def _aes_key(key_name, key_bits, key_bytes):
+    return {
+        "key-id": key_name,
+        "encrypt": True,
+        "decrypt": True,
+        "algorithm": "aes",
+        "type": "symmetric",
+        "bits": key_bits,
+        "encoding": "base64",
+        "material": base64.b64encode(key_bytes).decode("utf-8"),
+    }
+
+
+def _rsa_key(key_name, key_bits, key_type, pem_key):
+    return {
+        "key-id": key_name,
+        "encrypt": True,
+        "decrypt": key_type == "private",
+        "algorithm": "rsa",
+        "type": key_type,
+        "bits": key_bits,
+        "encoding": "pem",
+        "material": pem_key,
+    }
+
+
+def _aws_kms_key(key_arn, decryptable):
+    return {
+        "type": "aws-kms",
+        "key-id": key_arn,
+        "encrypt": True,
+        "decrypt": decryptable,
+    }
+
+
 def build_manifest():
     """Build the manifest dictionary from the above key material definitions."""
     manifest = {"manifest": {"type": "keys", "version": VERSION}}
@@ -133,37 +170,43 @@ def build_manifest():
 
     for key_bits, key_bytes in AES_KEYS:
         key_name = "aes-%s" % key_bits
-        keys[key_name] = {
-            "key-id": key_name,
-            "encrypt": True,
-            "decrypt": True,
-            "algorithm": "aes",
-            "type": "symmetric",
-            "bits": key_bits,
-            "encoding": "base64",
-            "material": base64.b64encode(key_bytes).decode("utf-8"),
-        }
+        keys[key_name] = _aes_key(key_name, key_bits, key_bytes)
 
     for key_bits, key_type, pem_key in RSA_KEYS:
         key_name = "rsa-%s-%s" % (key_bits, key_type)
-        keys[key_name] = {
-            "key-id": key_name,
-            "encrypt": True,
-            "decrypt": key_type == "private",
-            "algorithm": "rsa",
-            "type": key_type,
-            "bits": key_bits,
-            "encoding": "pem",
-            "material": pem_key,
-        }
+        keys[key_name] = _rsa_key(key_name, key_bits, key_type, pem_key)
 
     for key_name, key_arn, decryptable in AWS_KMS_KEYS:
-        keys[key_name] = {
-            "type": "aws-kms",
-            "key-id": key_arn,
-            "encrypt": True,
-            "decrypt": decryptable,
-        }
+        keys[key_name] = _aws_kms_key(key_arn, decryptable)
+
+    manifest["keys"] = keys
+    return manifest
+
+
+def build_synthetic_manifest(spec_filename, seed=DEFAULT_SEED, jobs=None, cache_directory=None):
+    """Build a manifest of synthetic keys for scale testing, as described by a key spec,
+    instead of the above key material definitions.
+
+    :param str spec_filename: Name of file containing the key spec
+    :param seed: Seed that identifies the generated key material
+    :param int jobs: Number of worker processes for RSA key generation (default: number of CPUs)
+    :param str cache_directory: Directory in which to cache generated RSA keys (optional)
+    """
+    manifest = {"manifest": {"type": "keys", "version": VERSION}}
+    keys = {}
+
+    synthetic_keys = generate_synthetic_keys(
+        load_key_spec(spec_filename), seed, jobs, cache_directory
+    )
+    for key in synthetic_keys:
+        decryptable = key.role == "encrypt-decrypt"
+        if key.algorithm == "aes":
+            keys[key.name] = _aes_key(key.name, key.bits, key.material)
+        elif key.algorithm == "rsa":
+            key_type = "private" if decryptable else "public"
+            keys[key.name] = _rsa_key(key.name, key.bits, key_type, key.material)
+        else:
+            keys[key.name] = _aws_kms_key(key.material, decryptable)
 
     manifest["keys"] = keys
     return manifest
@@ -179,23 +222,83 @@ def _test_manifest(manifest):
             raise ValueError("Invalid key specification: \"{}\" does not define key ID.".format(key))
 
 
+def _key_provider_types(key):
+    """Identify the provider type of a key: ``aes``, ``rsa`` or ``aws-kms``.
+
+    :param dict key: Key from the keys manifest
+    """
+    return (key.get("algorithm", key["type"]),)
+
+
 def main(args=None):
     """Entry point for CLI"""
     parser = argparse.ArgumentParser(description="Build a keys manifest.")
     parser.add_argument(
         "--human", action="store_true", help="Print human-readable JSON"
     )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write the wall time and memory allocations of each generation phase and the "
+        "number of keys for each provider type to this file",
+    )
+    parser.add_argument(
+        "--spec",
+        metavar="FILE",
+        help="Generate synthetic keys for scale testing, as described by this key spec, "
+        "instead of the canonical keys",
+    )
+    parser.add_argument(
+        "--seed",
+        help="With --spec, seed that identifies the generated key material "
+        "(default: {})".format(DEFAULT_SEED),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="With --spec, generate RSA keys on N worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIRECTORY",
+        help="With --spec, reuse RSA keys generated with the same seed from this directory",
+    )
 
     parsed = parser.parse_args(args)
+    if not parsed.spec and (
+        parsed.seed is not None or parsed.jobs is not None or parsed.cache is not None
+    ):
+        parser.error("--seed, --jobs and --cache require --spec")
+    if parsed.jobs is not None and parsed.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    profiler = Profiler("keys", _key_provider_types, enabled=bool(parsed.profile)).start()
 
-    manifest = build_manifest()
-    _test_manifest(manifest)
+    with profiler.phase("build-manifest"):
+        if parsed.spec:
+            manifest = build_synthetic_manifest(
+                parsed.spec,
+                parsed.seed if parsed.seed is not None else DEFAULT_SEED,
+                parsed.jobs,
+                parsed.cache,
+            )
+        else:
+            manifest = build_manifest()
+    with profiler.phase("validate"):
+        _test_manifest(manifest)
+    if profiler.enabled:
+        for key in manifest["keys"].values():
+            profiler.add(key)
 
     kwargs = {}
     if parsed.human:
         kwargs["indent"] = 4
 
-    return json.dumps(manifest, **kwargs)
+    with profiler.phase("write-manifest"):
+        output = json.dumps(manifest, **kwargs)
+    if parsed.profile:
+        profiler.write(parsed.profile)
+    return output
 
 
 if __name__ == "__main__":
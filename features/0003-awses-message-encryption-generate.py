@@ -14,137 +14,414 @@
 # Only Python 3.6+ compatibility is guaranteed.
 
 import argparse
-import os
+import contextlib
+import functools
 import json
 import sys
-from urllib.parse import urlunparse
 from awses_message_encryption_utils import (
     PLAINTEXTS,
     RAW_RSA_PADDING_ALGORITHMS,
     ALGORITHM_SUITES,
     FRAME_SIZES,
     ENCRYPTION_CONTEXTS,
+    PERFORMANCE_PLAINTEXTS,
+    CoverageValidator,
+    KeysManifest,
+    TEST_ID_BUILDERS,
+    build_covering_tests,
+    build_performance_tests,
     build_tests,
-    _keys_for_algorithm,
-    _keys_for_decryptval,
-    _keys_for_type
+    write_tests_in_parallel,
+    _coverage_factors,
+    _load_profiled_keys,
+    _random_test_id,
+    _test_key_kinds
+)
+from compact_manifest_utils import write_compact_manifest
+from cost_model_utils import CostModel, CostReport, load_cost_weights
+from manifest_utils import (
+    diff_tests,
+    load_manifest,
+    output_stream,
+    shard_filenames,
+    write_manifest,
+    write_sharded_manifests
+)
+from profile_utils import Profiler
+from self_check_utils import (
+    COVERING_ARRAY_FACTOR_SIZES,
+    check_compact_round_trip,
+    check_covering_arrays,
+    check_fragment_encoder,
+    check_reader_filters,
+    run_checks
 )
 
 MANIFEST_VERSION = 2
 
 
-def _tests_for_type(type_name, tests):
-    """Filter encrypt manifest keys by type.
-
-    :param str type_name: Key type name for which to filter
-    :param dict keys: Parsed keys manifest
-    """
-    for _name, test in tests["tests"].items():
-        for master_key in test["master-keys"]:
-            if master_key["type"] == type_name:
-                yield test
-                break
-
+def _key_combination_count(key_count, black_hole_key_count):
+    """Count the master key combinations built from a set of keys: each decryptable key
+    alone and each decryptable key paired with each black-hole key.
 
-def _tests_for_algorithm(algorithm_name, tests):
-    """Filter encrypt manifest keys by algorithm name.
-
-    :param str algorithm_name: Key algorithm name for which to filter
-    :param dict tests: Full message encrypt manifest to test
+    :param int key_count: Total number of keys
+    :param int black_hole_key_count: Number of keys that cannot decrypt
     """
-    for _name, test in tests["tests"].items():
-        for master_key in test["master-keys"]:
-            if master_key["key"].startswith(algorithm_name + "-"):
-                yield test
-                break
+    decryptable_key_count = key_count - black_hole_key_count
+    return decryptable_key_count + (decryptable_key_count * black_hole_key_count)
 
 
-def _test_manifest(keys_filename, manifest):
-    """Test that the manifest is actually complete.
+def _expected_test_counts(keys):
+    """Calculate the number of tests that a complete manifest must contain for each kind of key,
+    directly from the keys manifest.
 
-    :param str keys_file: Name of file containing the keys manifest
-    :param dict manifest: Full message encrypt manifest to test
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :returns: Map of key kind (``aes``, ``rsa``, ``aws-kms``) to expected test count
     """
-    with open(keys_filename, "r") as keys_file:
-        keys = json.load(keys_file)
+    keys = KeysManifest.wrap(keys)
 
-    aes_key_count = len(list(_keys_for_algorithm("aes", keys)))
-    black_hole_aes_key_count = len([value for value in list(_keys_for_algorithm("aes", keys)) if value in list(_keys_for_decryptval(False, keys))])
-    aes_key_combination_count = (aes_key_count-black_hole_aes_key_count+((aes_key_count-black_hole_aes_key_count)*black_hole_aes_key_count))
+    aes_keys = keys.keys_for_algorithm("aes")
+    black_hole_aes_key_count = sum(1 for _name, key in aes_keys if not key["decrypt"])
 
     cycleable_rsa_key_count = 0
     black_hole_rsa_key_count = 0
-    for _name, rsa_key in _keys_for_algorithm("rsa", keys):
+    for _name, rsa_key in keys.keys_for_algorithm("rsa"):
         if rsa_key["encrypt"]:
             if rsa_key["decrypt"]:
                 cycleable_rsa_key_count += 1
             else:
                 black_hole_rsa_key_count += 1
 
+    kms_keys = keys.keys_for_type("aws-kms")
+    black_hole_kms_key_count = sum(1 for _name, key in kms_keys if not key["decrypt"])
+
     cycleable_rsa_combination_count = cycleable_rsa_key_count * len(
         RAW_RSA_PADDING_ALGORITHMS
     )
-    black_hole_rsa_combination_count = (
-        cycleable_rsa_combination_count * black_hole_rsa_key_count
-    )
-    rsa_key_combination_count = (
-        cycleable_rsa_combination_count + black_hole_rsa_combination_count
-    )
+    rsa_key_combination_count = cycleable_rsa_combination_count * (1 + black_hole_rsa_key_count)
 
-    kms_key_count = len(list(_keys_for_type("aws-kms", keys)))
-    black_hole_kms_key_count = len([value for value in list(_keys_for_type("aws-kms", keys)) if value in list(_keys_for_decryptval(False, keys))])
-    kms_key_combination_count = (kms_key_count-black_hole_kms_key_count+((kms_key_count-black_hole_kms_key_count)*black_hole_kms_key_count))
+    iterations = len(ALGORITHM_SUITES) * len(FRAME_SIZES) * len(ENCRYPTION_CONTEXTS)
+    return {
+        "aes": _key_combination_count(len(aes_keys), black_hole_aes_key_count) * iterations,
+        "rsa": rsa_key_combination_count * iterations,
+        "aws-kms": _key_combination_count(len(kms_keys), black_hole_kms_key_count) * iterations,
+    }
 
-    aes_test_count = len(list(_tests_for_algorithm("aes", manifest)))
-    rsa_test_count = len(list(_tests_for_algorithm("rsa", manifest)))
-    kms_test_count = len(list(_tests_for_type("aws-kms", manifest)))
 
-    iterations = len(ALGORITHM_SUITES) * len(FRAME_SIZES) * len(ENCRYPTION_CONTEXTS)
-    expected_aes_test_count = aes_key_combination_count * iterations
-    expected_rsa_test_count = rsa_key_combination_count * iterations
-    expected_kms_test_count = kms_key_combination_count * iterations
+class _TestCountValidator(object):
+    """Validate that a manifest is complete by counting tests as they are generated,
+    in a single pass and without keeping the tests.
 
-    if not all(
-        [
-            0 < expected_aes_test_count == aes_test_count,
-            0 < expected_rsa_test_count == rsa_test_count,
-            0 < expected_kms_test_count == kms_test_count,
-        ]
-    ):
-        raise ValueError(
-            "Unexpected test count: \nAES: {aes}\nRSA: {rsa}\nAWS-KMS: {kms}".format(
-                aes="Expected: {expected} Actual: {actual}".format(
-                    expected=expected_aes_test_count, actual=aes_test_count
-                ),
-                rsa="Expected: {expected} Actual: {actual}".format(
-                    expected=expected_rsa_test_count, actual=rsa_test_count
-                ),
-                kms="Expected: {expected} Actual: {actual}".format(
-                    expected=expected_kms_test_count, actual=kms_test_count
-                ),
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    """
+
+    def __init__(self, keys):
+        self.keys = KeysManifest.wrap(keys)
+        self.expected = _expected_test_counts(self.keys)
+        self.actual = dict.fromkeys(self.expected, 0)
+
+    def add(self, test):
+        """Count a single test.
+
+        :param dict test: Encrypt test description
+        """
+        self.add_key_kinds(_test_key_kinds(test, self.keys))
+
+    def add_key_kinds(self, key_kinds):
+        """Count a single test by the kinds of key that it uses.
+
+        :param key_kinds: Key kinds used by the test, as identified by :func:`_test_key_kinds`
+        """
+        for kind in key_kinds:
+            self.actual[kind] += 1
+
+    def observe(self, tests):
+        """Count tests while passing them through unchanged.
+
+        :param tests: Iterable of ``(test_id, test)`` pairs
+        """
+        for test_id, test in tests:
+            self.add(test)
+            yield test_id, test
+
+    def check(self):
+        """Raise an error if the tests counted so far do not make up a complete manifest."""
+        # Kinds of key that the keys manifest does not contain are expected to have no tests,
+        # but the manifest as a whole must not be empty
+        if not any(self.expected.values()) or self.actual != self.expected:
+            raise ValueError(
+                "Unexpected test count: \nAES: {aes}\nRSA: {rsa}\nAWS-KMS: {kms}".format(
+                    aes="Expected: {expected} Actual: {actual}".format(
+                        expected=self.expected["aes"], actual=self.actual["aes"]
+                    ),
+                    rsa="Expected: {expected} Actual: {actual}".format(
+                        expected=self.expected["rsa"], actual=self.actual["rsa"]
+                    ),
+                    kms="Expected: {expected} Actual: {actual}".format(
+                        expected=self.expected["aws-kms"], actual=self.actual["aws-kms"]
+                    ),
+                )
             )
-        )
 
 
-def build_manifest(keys_filename):
-    """Build the test-case manifest which directs the behavior of cross-compatibility clients.
+def _validator(keys, coverage=None):
+    """Build the validator for a full manifest, or for a covering-array manifest.
 
-    :param str keys_file: Name of file containing the keys manifest
+    :param dict keys: Parsed keys manifest
+    :param int coverage: Coverage strength of a covering-array manifest (optional)
     """
-    with open(keys_filename, "r") as keys_file:
-        keys = json.load(keys_file)
+    if coverage is None:
+        return _TestCountValidator(keys)
+    return CoverageValidator(keys, coverage)
+
+
+def _tests(keys, test_id_builder, coverage=None):
+    """Build the tests of a full manifest, or of a covering-array manifest.
+
+    :param dict keys: Parsed keys manifest
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param int coverage: Coverage strength of a covering-array manifest (optional)
+    """
+    if coverage is None:
+        return build_tests(keys, test_id_builder)
+    return build_covering_tests(keys, coverage, test_id_builder)
+
 
-    keys_path = "/".join(keys_filename.split(os.path.sep))
-    keys_uri = urlunparse(("file", keys_path, "", "", "", ""))
+def _test_manifest(keys, manifest, coverage=None):
+    """Test that the manifest is actually complete: that it contains every test or,
+    for a covering-array manifest, that it covers every combination of scenario parameters.
 
+    :param keys: :class:`KeysManifest` from which the manifest was built
+    :param dict manifest: Full message encrypt manifest to test
+    :param int coverage: Coverage strength of a covering-array manifest (optional)
+    """
+    validator = _validator(keys, coverage)
+    for test in manifest["tests"].values():
+        validator.add(test)
+    validator.check()
+
+
+def _manifest_header(keys_uri, plaintexts=PLAINTEXTS):
+    """Build all manifest members other than the tests.
+
+    :param str keys_uri: URI identifying the keys manifest
+    :param dict plaintexts: Map of plaintext names to size in bytes
+    """
     return {
         "manifest": {"type": "awses-encrypt", "version": MANIFEST_VERSION},
         "keys": keys_uri,
-        "plaintexts": PLAINTEXTS,
-        "tests": dict(build_tests(keys)),
+        "plaintexts": plaintexts,
     }
 
 
+def build_manifest(keys, test_id_builder=_random_test_id, coverage=None, profiler=None):
+    """Build the test-case manifest which directs the behavior of cross-compatibility clients.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param int coverage: Only build a covering array of the scenario matrix in which every
+        combination of values of this many scenario parameters appears (optional)
+    :param profiler: :class:`Profiler` with which to record each phase (optional)
+    """
+    profiler = Profiler.wrap(profiler)
+    keys = _load_profiled_keys(keys, profiler)
+
+    manifest = _manifest_header(keys.uri)
+    tests = _tests(keys, profiler.timed(test_id_builder, "test-ids"), coverage)
+    manifest["tests"] = dict(profiler.iterate(tests, "build-tests"))
+    return manifest
+
+
+def build_performance_manifest(keys, test_id_builder=_random_test_id):
+    """Build a manifest containing only the performance scenario family, which exercises
+    streaming encryption and decryption of large, many-frame messages.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    """
+    keys = KeysManifest.load(keys)
+
+    manifest = _manifest_header(keys.uri, PERFORMANCE_PLAINTEXTS)
+    manifest["tests"] = dict(build_performance_tests(keys, test_id_builder))
+    return manifest
+
+
+def stream_manifest(
+    keys,
+    stream,
+    indent=None,
+    test_id_builder=_random_test_id,
+    compact=False,
+    coverage=None,
+    cost_report=None,
+    profiler=None,
+):
+    """Write the test-case manifest to a stream as each test is built,
+    without holding the full set of tests in memory.
+
+    Tests are validated as they are written; an incomplete manifest raises an error
+    once all tests have been written.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param stream: Text stream to which to write the manifest, or binary stream if ``compact``
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param bool compact: Write the compact binary encoding instead of JSON
+    :param int coverage: Only build a covering array of the scenario matrix in which every
+        combination of values of this many scenario parameters appears (optional)
+    :param cost_report: :class:`CostReport` to which to add each test (optional)
+    :param profiler: :class:`Profiler` with which to record each phase and count each test
+        (optional)
+    :returns: Number of tests written
+    """
+    profiler = Profiler.wrap(profiler)
+    keys = _load_profiled_keys(keys, profiler)
+
+    with profiler.phase("validate"):
+        validator = _validator(keys, coverage)
+    tests = _tests(keys, profiler.timed(test_id_builder, "test-ids"), coverage)
+    tests = profiler.iterate(profiler.observe(tests), "build-tests")
+    tests = profiler.iterate(validator.observe(tests), "validate")
+    if cost_report is not None:
+        tests = profiler.iterate(cost_report.observe(tests), "cost-estimates")
+    with profiler.phase("write-manifest"):
+        if compact:
+            test_count = write_compact_manifest(stream, _manifest_header(keys.uri), tests)
+        else:
+            test_count = write_manifest(stream, _manifest_header(keys.uri), tests, indent)
+    with profiler.phase("validate"):
+        validator.check()
+    return test_count
+
+
+def stream_manifest_in_parallel(
+    keys, stream, jobs, indent=None, test_id_builder=_random_test_id, ordered=False
+):
+    """Write the test-case manifest to a stream, building and serializing tests on a pool
+    of worker processes.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param stream: Text stream to which to write the manifest
+    :param int jobs: Number of worker processes
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param bool ordered: Write tests in the same stable order as :func:`stream_manifest`
+    :returns: Number of tests written
+    """
+    keys = KeysManifest.load(keys)
+
+    return write_tests_in_parallel(
+        stream,
+        _manifest_header(keys.uri),
+        keys,
+        jobs,
+        indent,
+        test_id_builder,
+        ordered=ordered,
+        validator=_TestCountValidator(keys),
+    )
+
+
+def stream_sharded_manifests(
+    keys,
+    output_filename,
+    shard_count,
+    indent=None,
+    test_id_builder=_random_test_id,
+    cost_weights=None,
+):
+    """Write the test-case manifest as several shard manifests of roughly equal estimated cost,
+    so that the shards can be processed in parallel and finish at about the same time.
+
+    Shard files are named after ``output_filename``, with ``.shard-N-of-M`` before the extension.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param str output_filename: Name of the file that would contain the whole manifest
+    :param int shard_count: Number of shards
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param dict cost_weights: Cost weights with which to balance the shards (optional)
+    :returns: Total estimated cost of each shard
+    """
+    keys = KeysManifest.load(keys)
+    cost_model = CostModel(keys, PLAINTEXTS, cost_weights)
+
+    validators = []
+
+    def _build_tests():
+        validators.append(_TestCountValidator(keys))
+        return validators[-1].observe(build_tests(keys, test_id_builder))
+
+    with contextlib.ExitStack() as stack:
+        streams = [
+            stack.enter_context(output_stream(filename))
+            for filename in shard_filenames(output_filename, shard_count)
+        ]
+        costs = write_sharded_manifests(
+            streams, _manifest_header(keys.uri), _build_tests, cost_model.test_cost, indent
+        )
+    for validator in validators:
+        validator.check()
+    return costs
+
+
+def build_delta_manifest(keys, baseline_filename, test_id_builder=_random_test_id):
+    """Build a manifest containing only the tests that differ from an existing manifest,
+    such as one of the canonical generated manifests. Tests are matched by their descriptions,
+    so test IDs in the existing manifest do not need to be reproducible.
+
+    The ``tests`` member contains only the added tests, so the result can be processed like
+    any other manifest of this type. Tests from the existing manifest that are no longer
+    generated are listed, with their original IDs, in an additional ``removed-tests`` member.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param str baseline_filename: Name of file containing the existing manifest
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    """
+    keys = KeysManifest.load(keys)
+    baseline = load_manifest(baseline_filename, "awses-encrypt")
+
+    validator = _TestCountValidator(keys)
+    added, removed = diff_tests(
+        validator.observe(build_tests(keys, test_id_builder)), baseline["tests"]
+    )
+    validator.check()
+
+    manifest = _manifest_header(keys.uri)
+    manifest["removed-tests"] = removed
+    manifest["tests"] = dict(added)
+    return manifest
+
+
+def _self_check(keys, test_id_builder):
+    """Check that the manifest tooling handles the manifest built from a keys manifest
+    correctly, printing the outcome of each check.
+
+    :param KeysManifest keys: Loaded keys manifest
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :returns: Exit status: 0 if every check passed, otherwise 1
+    """
+    manifest = build_manifest(keys, test_id_builder)
+    scenario_factor_sizes = tuple(len(values) for values in _coverage_factors(keys))
+    lines, passed = run_checks(
+        [
+            ("compact-round-trip", lambda: check_compact_round_trip(manifest)),
+            ("reader-filters", lambda: check_reader_filters(manifest, keys.manifest)),
+            ("fragment-encoder", lambda: check_fragment_encoder(manifest)),
+        ]
+        + [
+            (
+                "covering-array {}".format(list(factor_sizes)),
+                functools.partial(check_covering_arrays, factor_sizes),
+            )
+            for factor_sizes in [scenario_factor_sizes] + list(COVERING_ARRAY_FACTOR_SIZES)
+        ]
+    )
+    for line in lines:
+        print(line)
+    return 0 if passed else 1
+
+
 def main(args=None):
     """Entry point for CLI"""
     parser = argparse.ArgumentParser(
@@ -154,18 +431,259 @@ def main(args=None):
         "--human", action="store_true", help="Print human-readable JSON"
     )
     parser.add_argument("--keys", required=True, help="Keys manifest to use")
+    parser.add_argument(
+        "--output",
+        help="Write the manifest to this file (- for stdout) as tests are generated",
+    )
+    parser.add_argument(
+        "--test-ids",
+        choices=sorted(TEST_ID_BUILDERS),
+        default="random",
+        help="Generate random test IDs or IDs derived from each test description",
+    )
+    parser.add_argument(
+        "--diff-against",
+        metavar="MANIFEST",
+        help="Only include tests that are added or removed relative to this existing manifest",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        metavar="N",
+        help="Split the manifest written to --output into N manifests of balanced estimated cost",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="Build and serialize the manifest written to --output on N worker processes",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="With --jobs, write tests in a stable order instead of as soon as they are built",
+    )
+    parser.add_argument(
+        "--performance",
+        action="store_true",
+        help="Build only the large-plaintext performance scenarios",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write the manifest to --output in the compact binary encoding instead of JSON",
+    )
+    parser.add_argument(
+        "--coverage",
+        type=int,
+        metavar="T",
+        help="Build only a covering array of the scenario matrix in which every combination "
+        "of values of any T scenario parameters appears (2 for pairwise)",
+    )
+    parser.add_argument(
+        "--cost-estimates",
+        action="store_true",
+        help="Add the estimated CPU-seconds and network calls of each test to the test",
+    )
+    parser.add_argument(
+        "--cost-report",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Write the estimated CPU-seconds and network calls of the manifest, by algorithm "
+        "suite and key type, to this file (default: stderr, which requires --output)",
+    )
+    parser.add_argument(
+        "--cost-weights",
+        metavar="FILE",
+        help="Estimate costs with the weights in this file, as measured by "
+        "benchmarks/cost_weights.py",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Write the wall time and memory allocations of each generation phase and the "
+        "number of tests for each provider type to this file (default: stderr, which "
+        "requires --output)",
+    )
+    parser.add_argument(
+        "--self-check",
+        action="store_true",
+        help="Check that the manifest tooling handles the manifest built from --keys correctly, "
+        "instead of writing it",
+    )
 
     parsed = parser.parse_args(args)
+    if parsed.self_check and (
+        parsed.output
+        or parsed.diff_against
+        or parsed.shards is not None
+        or parsed.jobs is not None
+        or parsed.performance
+        or parsed.compact
+        or parsed.coverage is not None
+        or parsed.cost_estimates
+        or parsed.cost_report
+        or parsed.profile
+    ):
+        parser.error("--self-check can only be combined with --keys, --test-ids and --human")
+    test_id_builder = TEST_ID_BUILDERS[parsed.test_ids]
+    if parsed.shards is not None:
+        if parsed.shards < 1:
+            parser.error("--shards must be at least 1")
+        if not parsed.output or parsed.output == "-":
+            parser.error("--shards requires --output to name a file")
+        if parsed.diff_against:
+            parser.error("--shards cannot be combined with --diff-against")
+    if parsed.jobs is not None:
+        if parsed.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        if not parsed.output:
+            parser.error("--jobs requires --output")
+        if parsed.diff_against or parsed.shards is not None:
+            parser.error("--jobs cannot be combined with --diff-against or --shards")
+    elif parsed.ordered:
+        parser.error("--ordered requires --jobs")
+    if parsed.performance and (
+        parsed.diff_against or parsed.shards is not None or parsed.jobs is not None
+    ):
+        parser.error("--performance cannot be combined with --diff-against, --shards or --jobs")
+    if parsed.compact:
+        if not parsed.output:
+            parser.error("--compact requires --output")
+        if parsed.human or parsed.jobs is not None or parsed.shards is not None:
+            parser.error("--compact cannot be combined with --human, --jobs or --shards")
+
+    if parsed.coverage is not None:
+        if parsed.coverage < 1:
+            parser.error("--coverage must be at least 1")
+        if (
+            parsed.diff_against
+            or parsed.shards is not None
+            or parsed.jobs is not None
+            or parsed.performance
+        ):
+            parser.error(
+                "--coverage cannot be combined with --diff-against, --shards, --jobs "
+                "or --performance"
+            )
 
-    manifest = build_manifest(parsed.keys)
-
-    _test_manifest(parsed.keys, manifest)
+    if (parsed.cost_estimates or parsed.cost_report) and (
+        parsed.jobs is not None or parsed.shards is not None
+    ):
+        parser.error(
+            "--cost-estimates and --cost-report cannot be combined with --jobs or --shards"
+        )
+    if parsed.profile and (parsed.jobs is not None or parsed.shards is not None):
+        parser.error("--profile cannot be combined with --jobs or --shards")
+    # Without --output, the manifest itself is written to stderr
+    if parsed.cost_report == "-" and not parsed.output:
+        parser.error("--cost-report requires a FILE unless --output is given")
+    if parsed.profile == "-" and not parsed.output:
+        parser.error("--profile requires a FILE unless --output is given")
+
+    # Tests are only counted by key kind once the keys manifest below has been loaded
+    profiler = Profiler(
+        kinds=lambda test: _test_key_kinds(test, keys), enabled=bool(parsed.profile)
+    ).start()
+    keys = _load_profiled_keys(parsed.keys, profiler)
+    if parsed.self_check:
+        return _self_check(keys, test_id_builder)
+    cost_weights = load_cost_weights(parsed.cost_weights) if parsed.cost_weights else None
+    cost_report = None
+    if parsed.cost_estimates or parsed.cost_report:
+        cost_report = CostReport(
+            CostModel(
+                keys, PERFORMANCE_PLAINTEXTS if parsed.performance else PLAINTEXTS, cost_weights
+            ),
+            attach=parsed.cost_estimates,
+        )
 
     kwargs = {}
     if parsed.human:
         kwargs["indent"] = 4
 
-    return json.dumps(manifest, **kwargs)
+    if parsed.jobs is not None:
+        with output_stream(parsed.output) as stream:
+            stream_manifest_in_parallel(
+                keys,
+                stream,
+                parsed.jobs,
+                test_id_builder=test_id_builder,
+                ordered=parsed.ordered,
+                **kwargs
+            )
+        return None
+
+    if parsed.shards is not None:
+        stream_sharded_manifests(
+            keys,
+            parsed.output,
+            parsed.shards,
+            test_id_builder=test_id_builder,
+            cost_weights=cost_weights,
+            **kwargs
+        )
+        return None
+
+    if parsed.output and not (parsed.diff_against or parsed.performance):
+        with output_stream(parsed.output, binary=parsed.compact) as stream:
+            stream_manifest(
+                keys,
+                stream,
+                test_id_builder=test_id_builder,
+                compact=parsed.compact,
+                coverage=parsed.coverage,
+                cost_report=cost_report,
+                profiler=profiler,
+                **kwargs
+            )
+        if parsed.cost_report:
+            cost_report.write(parsed.cost_report)
+        if parsed.profile:
+            profiler.write(parsed.profile)
+        return None
+
+    if parsed.performance:
+        with profiler.phase("build-tests"):
+            manifest = build_performance_manifest(
+                keys, profiler.timed(test_id_builder, "test-ids")
+            )
+    elif parsed.diff_against:
+        with profiler.phase("build-tests"):
+            manifest = build_delta_manifest(
+                keys, parsed.diff_against, profiler.timed(test_id_builder, "test-ids")
+            )
+    else:
+        manifest = build_manifest(keys, test_id_builder, parsed.coverage, profiler)
+
+        with profiler.phase("validate"):
+            _test_manifest(keys, manifest, parsed.coverage)
+    if profiler.enabled:
+        for test in manifest["tests"].values():
+            profiler.add(test)
+
+    if cost_report is not None:
+        with profiler.phase("cost-estimates"):
+            manifest["tests"] = dict(cost_report.observe(manifest["tests"].items()))
+        if parsed.cost_report:
+            cost_report.write(parsed.cost_report)
+
+    output = None
+    with profiler.phase("write-manifest"):
+        if parsed.output:
+            with output_stream(parsed.output, binary=parsed.compact) as stream:
+                if parsed.compact:
+                    write_compact_manifest(stream, manifest, manifest["tests"].items())
+                else:
+                    stream.write(json.dumps(manifest, **kwargs))
+        else:
+            output = json.dumps(manifest, **kwargs)
+    if parsed.profile:
+        profiler.write(parsed.profile)
+    return output
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import argparse
+import json
+import sys
+import time
+from aws_kms_stand_in import KMSStandIn
+from awses_message_decryption_utils import DEFAULT_GROUP_SIZE, run_tests, summarize_results
+from manifest_reader_utils import ManifestReader
+from result_cache_utils import ResultCache
+from self_check_utils import check_result_cache_eviction, check_tampered_vectors, run_checks
+
+# Seconds in a day, the unit of --result-cache-max-age
+_DAY = 24 * 60 * 60
+
+
+def main(args=None):
+    """Entry point for CLI"""
+    parser = argparse.ArgumentParser(
+        description="Run an AWS Encryption SDK decrypt message manifest against a client."
+    )
+    parser.add_argument("--manifest", help="Decrypt manifest to run")
+    parser.add_argument(
+        "--handler",
+        help="Client handler class to use, as module:attribute "
+        "(for example awses_sdk_decrypt_handler:AwsEncryptionSdkDecryptHandler)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Number of workers to use (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--processes", action="store_true", help="Run tests on worker processes instead of threads"
+    )
+    parser.add_argument(
+        "--group-size",
+        type=int,
+        default=DEFAULT_GROUP_SIZE,
+        help="Maximum number of tests with the same master keys to schedule on a worker at once",
+    )
+    parser.add_argument(
+        "--key-type",
+        action="append",
+        dest="key_types",
+        help="Only run tests that use a key of this keys manifest type (can be repeated)",
+    )
+    parser.add_argument("--test-id-prefix", help="Only run tests whose ID starts with this prefix")
+    parser.add_argument(
+        "--kms-endpoint", help="Endpoint URL to use for AWS KMS, such as a local stand-in"
+    )
+    parser.add_argument(
+        "--kms-stand-in",
+        action="store_true",
+        help="Serve AWS KMS requests from a local stand-in for the manifest's aws-kms keys",
+    )
+    parser.add_argument(
+        "--key-cache", help="Directory in which to cache parsed RSA keys between runs"
+    )
+    parser.add_argument("--report", help="Write the result and latency of every test to this file")
+    parser.add_argument(
+        "--result-cache",
+        metavar="DIRECTORY",
+        help="Skip tests that already passed with the same client, keys, scenario and "
+        "ciphertext, as recorded in this directory",
+    )
+    parser.add_argument(
+        "--result-cache-max-age",
+        type=float,
+        metavar="DAYS",
+        help="Evict cached results that have not been used for this many days",
+    )
+    parser.add_argument(
+        "--result-cache-max-size",
+        type=float,
+        metavar="MIB",
+        help="Evict the least recently used cached results beyond this total size",
+    )
+    parser.add_argument(
+        "--self-check",
+        action="store_true",
+        help="Check that the runner's own tooling, such as the result cache and tampered "
+        "vector descriptors, works correctly, instead of running a manifest",
+    )
+
+    parsed = parser.parse_args(args)
+    if parsed.self_check:
+        if parsed.manifest or parsed.handler:
+            parser.error("--self-check cannot be combined with --manifest or --handler")
+        lines, passed = run_checks(
+            [
+                ("result-cache-eviction", check_result_cache_eviction),
+                ("tampered-vectors", check_tampered_vectors),
+            ]
+        )
+        for line in lines:
+            print(line)
+        return 0 if passed else 1
+    if not parsed.manifest or not parsed.handler:
+        parser.error("--manifest and --handler are required")
+    if parsed.kms_endpoint and parsed.kms_stand_in:
+        parser.error("--kms-endpoint cannot be combined with --kms-stand-in")
+    if (
+        parsed.result_cache_max_age is not None or parsed.result_cache_max_size is not None
+    ) and not parsed.result_cache:
+        parser.error("--result-cache-max-age and --result-cache-max-size require --result-cache")
+
+    config = {}
+    if parsed.kms_endpoint:
+        config["kms-endpoint"] = parsed.kms_endpoint
+    stand_in = None
+    if parsed.kms_stand_in:
+        with ManifestReader(parsed.manifest, "awses-decrypt") as reader:
+            stand_in = KMSStandIn(reader.keys).start()
+        config["kms-endpoint"] = stand_in.endpoint
+    if parsed.key_cache:
+        config["key-cache-directory"] = parsed.key_cache
+    if parsed.result_cache:
+        config["result-cache-directory"] = parsed.result_cache
+
+    start = time.perf_counter()
+    try:
+        results = list(
+            run_tests(
+                parsed.manifest,
+                parsed.handler,
+                workers=parsed.workers,
+                use_processes=parsed.processes,
+                config=config,
+                group_size=parsed.group_size,
+                key_types=parsed.key_types,
+                test_id_prefix=parsed.test_id_prefix,
+            )
+        )
+    finally:
+        if stand_in is not None:
+            stand_in.shutdown()
+    summary = summarize_results(results, time.perf_counter() - start)
+
+    if parsed.result_cache:
+        ResultCache(parsed.result_cache).evict(
+            max_age=(
+                parsed.result_cache_max_age * _DAY
+                if parsed.result_cache_max_age is not None
+                else None
+            ),
+            max_bytes=(
+                int(parsed.result_cache_max_size * 1024 * 1024)
+                if parsed.result_cache_max_size is not None
+                else None
+            ),
+        )
+
+    if parsed.report:
+        with open(parsed.report, "w") as report_file:
+            json.dump({"summary": summary, "results": results}, report_file, indent=4)
+
+    for result in results:
+        if not result["passed"]:
+            print(
+                "FAILED {test_id}: {error}".format(test_id=result["test-id"], error=result["error"])
+            )
+    print(json.dumps(summary, indent=4))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,21 +14,41 @@
 # Only Python 3.6+ compatibility is guaranteed.
 
 import argparse
-import uuid
+import contextlib
+import functools
 import json
-import os
 import sys
-from urllib.parse import urlunparse
 from awses_message_encryption_utils import (
     PLAINTEXTS,
     RAW_RSA_PADDING_ALGORITHMS,
     ALGORITHM_SUITES,
     FRAME_SIZES,
     ENCRYPTION_CONTEXTS,
+    PERFORMANCE_PLAINTEXTS,
     UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
-    _providers,
-    _raw_aes_providers
+    KeysManifest,
+    TEST_ID_BUILDERS,
+    build_performance_tests,
+    write_tests_in_parallel,
+    _cell_test_descriptions,
+    _covering_test_descriptions,
+    _load_profiled_keys,
+    _random_test_id,
+    _raw_aes_providers,
+    _scenario_matrix,
+    _test_key_kinds
 )
+from compact_manifest_utils import write_compact_manifest
+from cost_model_utils import CostModel, CostReport, load_cost_weights
+from manifest_utils import (
+    diff_tests,
+    load_manifest,
+    output_stream,
+    shard_filenames,
+    write_manifest,
+    write_sharded_manifests
+)
+from profile_utils import Profiler
 
 MANIFEST_VERSION = 2
 
@@ -38,120 +58,293 @@ TAMPERINGS = (
     "half-sign",
 )
 
-def _build_tests(keys):
-    """Build all tests to define in manifest, building from current rules and provided keys manifest.
+def _test_descriptions(keys, coverage=None):
+    """Build all test descriptions to define in manifest, building from current rules and provided keys manifest.
 
-    :param dict keys: Parsed keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param int coverage: Only build a covering array of the scenario matrix in which every
+        combination of values of this many scenario parameters appears (optional)
     """
-    for algorithm in ALGORITHM_SUITES:
-        for frame_size in FRAME_SIZES:
-            for ec in ENCRYPTION_CONTEXTS:
-                for provider_set in _providers(keys):
-                    yield (
-                        str(uuid.uuid4()),
-                        {
-                            "encryption-scenario": {
-                                "plaintext": "small",
-                                "algorithm": algorithm,
-                                "frame-size": frame_size,
-                                "encryption-context": ec,
-                                "master-keys": provider_set,
-                            }
-                        },
-                    )
-
-    yield (
-        str(uuid.uuid4()),
-        {
-            "encryption-scenario": {
-                "plaintext": "tiny",
-                "algorithm": "0178",
-                "frame-size": 512,
-                "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
-                "master-keys": next(_raw_aes_providers(keys)),
-            },
-            "decryption-method": "streaming-unsigned-only"
+    keys = KeysManifest.wrap(keys)
+    if coverage is not None:
+        for test in _covering_test_descriptions(keys, coverage, "encryption-scenario"):
+            yield test
+    else:
+        for cell in _scenario_matrix():
+            for test in _cell_test_descriptions(keys, cell, "encryption-scenario"):
+                yield test
+
+    for test in _additional_test_descriptions(keys):
+        yield test
+
+
+def _additional_test_descriptions(keys):
+    """Build the test descriptions that are not part of the scenario matrix.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    """
+    keys = KeysManifest.wrap(keys)
+    # Every additional test encrypts with a raw AES key
+    if not keys.keys_for_algorithm("aes"):
+        return
+
+    yield {
+        "encryption-scenario": {
+            "plaintext": "tiny",
+            "algorithm": "0178",
+            "frame-size": 512,
+            "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
+            "master-keys": next(_raw_aes_providers(keys)),
         },
-    )
+        "decryption-method": "streaming-unsigned-only"
+    }
 
-    yield (
-        str(uuid.uuid4()),
-        {
-            "encryption-scenario": {
-                "plaintext": "tiny",
-                "algorithm": "0378",
-                "frame-size": 512,
-                "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
-                "master-keys": next(_raw_aes_providers(keys)),
-            },
-            "decryption-method": "streaming-unsigned-only",
-            "result": {
-                "error": {
-                    "error-description": "Signed message input to streaming unsigned-only decryption method"
-                }
+    yield {
+        "encryption-scenario": {
+            "plaintext": "tiny",
+            "algorithm": "0378",
+            "frame-size": 512,
+            "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
+            "master-keys": next(_raw_aes_providers(keys)),
+        },
+        "decryption-method": "streaming-unsigned-only",
+        "result": {
+            "error": {
+                "error-description": "Signed message input to streaming unsigned-only decryption method"
             }
         }
-    )
+    }
 
     for tampering in TAMPERINGS:
-        yield (
-            str(uuid.uuid4()),
-            {
-                "encryption-scenario": {
-                    "plaintext": "tiny",
-                    "algorithm": "0478" if tampering == "half-sign" else "0578",
-                    "frame-size": 512,
-                    "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
-                    "master-keys": next(_raw_aes_providers(keys)),
-                },
-                "tampering": tampering
-            }
-        )
-
-    yield (
-        str(uuid.uuid4()),
-        {
+        yield {
             "encryption-scenario": {
                 "plaintext": "tiny",
-                "algorithm": "0578",
+                "algorithm": "0478" if tampering == "half-sign" else "0578",
                 "frame-size": 512,
                 "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
                 "master-keys": next(_raw_aes_providers(keys)),
             },
-            "tampering": {
-                "change-edk-provider-info": [
-                    "arn:aws:kms:us-west-2:658956600833:alias/EncryptOnly"
-                ]
-            },
-            "decryption-master-keys": [
-                {
-                    "type": "aws-kms",
-                    "key": "us-west-2-encrypt-only"
-                }
+            "tampering": tampering
+        }
+
+    # Relabels the data key as encrypted by an encrypt-only AWS KMS key, which the keys
+    # manifest must contain
+    encrypt_only_kms_keys = [
+        (name, key) for name, key in keys.keys_for_type("aws-kms") if not key["decrypt"]
+    ]
+    if not encrypt_only_kms_keys:
+        return
+    name, key = encrypt_only_kms_keys[0]
+    yield {
+        "encryption-scenario": {
+            "plaintext": "tiny",
+            "algorithm": "0578",
+            "frame-size": 512,
+            "encryption-context": UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT,
+            "master-keys": next(_raw_aes_providers(keys)),
+        },
+        "tampering": {
+            "change-edk-provider-info": [
+                key["key-id"]
             ]
         },
-    )
+        "decryption-master-keys": [
+            {
+                "type": "aws-kms",
+                "key": name
+            }
+        ]
+    }
 
 
-def build_manifest(keys_filename):
-    """Build the test-case manifest which directs the behavior of cross-compatibility clients.
+def _build_tests(keys, test_id_builder=_random_test_id, coverage=None):
+    """Build all tests to define in manifest, building from current rules and provided keys manifest.
 
-    :param str keys_file: Name of file containing the keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param int coverage: Only build a covering array of the scenario matrix in which every
+        combination of values of this many scenario parameters appears (optional)
     """
-    with open(keys_filename, "r") as keys_file:
-        keys = json.load(keys_file)
+    for test in _test_descriptions(keys, coverage):
+        yield test_id_builder(test), test
+
 
-    keys_path = "/".join(keys_filename.split(os.path.sep))
-    keys_uri = urlunparse(("file", keys_path, "", "", "", ""))
+def _manifest_header(keys_uri, plaintexts=PLAINTEXTS):
+    """Build all manifest members other than the tests.
 
+    :param str keys_uri: URI identifying the keys manifest
+    :param dict plaintexts: Map of plaintext names to size in bytes
+    """
     return {
         "manifest": {"type": "awses-decrypt-generate", "version": MANIFEST_VERSION},
         "keys": keys_uri,
-        "plaintexts": PLAINTEXTS,
-        "tests": dict(_build_tests(keys)),
+        "plaintexts": plaintexts,
     }
 
 
+def build_manifest(keys, test_id_builder=_random_test_id, coverage=None, profiler=None):
+    """Build the test-case manifest which directs the behavior of cross-compatibility clients.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param int coverage: Only build a covering array of the scenario matrix in which every
+        combination of values of this many scenario parameters appears (optional)
+    :param profiler: :class:`Profiler` with which to record each phase (optional)
+    """
+    profiler = Profiler.wrap(profiler)
+    keys = _load_profiled_keys(keys, profiler)
+
+    manifest = _manifest_header(keys.uri)
+    tests = _build_tests(keys, profiler.timed(test_id_builder, "test-ids"), coverage)
+    manifest["tests"] = dict(profiler.iterate(tests, "build-tests"))
+    return manifest
+
+
+def build_performance_manifest(keys, test_id_builder=_random_test_id):
+    """Build a manifest containing only the performance scenario family, which exercises
+    streaming encryption and decryption of large, many-frame messages.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    """
+    keys = KeysManifest.load(keys)
+
+    manifest = _manifest_header(keys.uri, PERFORMANCE_PLAINTEXTS)
+    manifest["tests"] = dict(
+        build_performance_tests(keys, test_id_builder, scenario_member="encryption-scenario")
+    )
+    return manifest
+
+
+def stream_manifest(
+    keys,
+    stream,
+    indent=None,
+    test_id_builder=_random_test_id,
+    compact=False,
+    coverage=None,
+    cost_report=None,
+    profiler=None,
+):
+    """Write the test-case manifest to a stream as each test is built,
+    without holding the full set of tests in memory.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param stream: Text stream to which to write the manifest, or binary stream if ``compact``
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param bool compact: Write the compact binary encoding instead of JSON
+    :param int coverage: Only build a covering array of the scenario matrix in which every
+        combination of values of this many scenario parameters appears (optional)
+    :param cost_report: :class:`CostReport` to which to add each test (optional)
+    :param profiler: :class:`Profiler` with which to record each phase and count each test
+        (optional)
+    :returns: Number of tests written
+    """
+    profiler = Profiler.wrap(profiler)
+    keys = _load_profiled_keys(keys, profiler)
+
+    tests = _build_tests(keys, profiler.timed(test_id_builder, "test-ids"), coverage)
+    tests = profiler.iterate(profiler.observe(tests), "build-tests")
+    if cost_report is not None:
+        tests = profiler.iterate(cost_report.observe(tests), "cost-estimates")
+    with profiler.phase("write-manifest"):
+        if compact:
+            return write_compact_manifest(stream, _manifest_header(keys.uri), tests)
+        return write_manifest(stream, _manifest_header(keys.uri), tests, indent)
+
+
+def stream_manifest_in_parallel(
+    keys, stream, jobs, indent=None, test_id_builder=_random_test_id, ordered=False
+):
+    """Write the test-case manifest to a stream, building and serializing the scenario matrix
+    on a pool of worker processes.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param stream: Text stream to which to write the manifest
+    :param int jobs: Number of worker processes
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param bool ordered: Write tests in the same stable order as :func:`stream_manifest`
+    :returns: Number of tests written
+    """
+    keys = KeysManifest.load(keys)
+
+    return write_tests_in_parallel(
+        stream,
+        _manifest_header(keys.uri),
+        keys,
+        jobs,
+        indent,
+        test_id_builder,
+        "encryption-scenario",
+        ordered,
+        _additional_test_descriptions(keys),
+    )
+
+
+def stream_sharded_manifests(
+    keys,
+    output_filename,
+    shard_count,
+    indent=None,
+    test_id_builder=_random_test_id,
+    cost_weights=None,
+):
+    """Write the test-case manifest as several shard manifests of roughly equal estimated cost,
+    so that the shards can be processed in parallel and finish at about the same time.
+
+    Shard files are named after ``output_filename``, with ``.shard-N-of-M`` before the extension.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param str output_filename: Name of the file that would contain the whole manifest
+    :param int shard_count: Number of shards
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param dict cost_weights: Cost weights with which to balance the shards (optional)
+    :returns: Total estimated cost of each shard
+    """
+    keys = KeysManifest.load(keys)
+    cost_model = CostModel(keys, PLAINTEXTS, cost_weights)
+
+    with contextlib.ExitStack() as stack:
+        streams = [
+            stack.enter_context(output_stream(filename))
+            for filename in shard_filenames(output_filename, shard_count)
+        ]
+        return write_sharded_manifests(
+            streams,
+            _manifest_header(keys.uri),
+            functools.partial(_build_tests, keys, test_id_builder),
+            cost_model.test_cost,
+            indent,
+        )
+
+
+def build_delta_manifest(keys, baseline_filename, test_id_builder=_random_test_id):
+    """Build a manifest containing only the tests that differ from an existing manifest,
+    such as one of the canonical generated manifests. Tests are matched by their descriptions,
+    so test IDs in the existing manifest do not need to be reproducible.
+
+    The ``tests`` member contains only the added tests, so the result can be processed like
+    any other manifest of this type. Tests from the existing manifest that are no longer
+    generated are listed, with their original IDs, in an additional ``removed-tests`` member.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+    :param str baseline_filename: Name of file containing the existing manifest
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    """
+    keys = KeysManifest.load(keys)
+    baseline = load_manifest(baseline_filename, "awses-decrypt-generate")
+
+    added, removed = diff_tests(_build_tests(keys, test_id_builder), baseline["tests"])
+
+    manifest = _manifest_header(keys.uri)
+    manifest["removed-tests"] = removed
+    manifest["tests"] = dict(added)
+    return manifest
+
+
 def main(args=None):
     """Entry point for CLI"""
     parser = argparse.ArgumentParser(
@@ -161,16 +354,235 @@ def main(args=None):
         "--human", action="store_true", help="Print human-readable JSON"
     )
     parser.add_argument("--keys", required=True, help="Keys manifest to use")
+    parser.add_argument(
+        "--output",
+        help="Write the manifest to this file (- for stdout) as tests are generated",
+    )
+    parser.add_argument(
+        "--test-ids",
+        choices=sorted(TEST_ID_BUILDERS),
+        default="random",
+        help="Generate random test IDs or IDs derived from each test description",
+    )
+    parser.add_argument(
+        "--diff-against",
+        metavar="MANIFEST",
+        help="Only include tests that are added or removed relative to this existing manifest",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        metavar="N",
+        help="Split the manifest written to --output into N manifests of balanced estimated cost",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="Build and serialize the manifest written to --output on N worker processes",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="With --jobs, write tests in a stable order instead of as soon as they are built",
+    )
+    parser.add_argument(
+        "--performance",
+        action="store_true",
+        help="Build only the large-plaintext performance scenarios",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write the manifest to --output in the compact binary encoding instead of JSON",
+    )
+    parser.add_argument(
+        "--coverage",
+        type=int,
+        metavar="T",
+        help="Build only a covering array of the scenario matrix in which every combination "
+        "of values of any T scenario parameters appears (2 for pairwise)",
+    )
+    parser.add_argument(
+        "--cost-estimates",
+        action="store_true",
+        help="Add the estimated CPU-seconds and network calls of each test to the test",
+    )
+    parser.add_argument(
+        "--cost-report",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Write the estimated CPU-seconds and network calls of the manifest, by algorithm "
+        "suite and key type, to this file (default: stderr, which requires --output)",
+    )
+    parser.add_argument(
+        "--cost-weights",
+        metavar="FILE",
+        help="Estimate costs with the weights in this file, as measured by "
+        "benchmarks/cost_weights.py",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Write the wall time and memory allocations of each generation phase and the "
+        "number of tests for each provider type to this file (default: stderr, which "
+        "requires --output)",
+    )
 
     parsed = parser.parse_args(args)
+    test_id_builder = TEST_ID_BUILDERS[parsed.test_ids]
+    if parsed.shards is not None:
+        if parsed.shards < 1:
+            parser.error("--shards must be at least 1")
+        if not parsed.output or parsed.output == "-":
+            parser.error("--shards requires --output to name a file")
+        if parsed.diff_against:
+            parser.error("--shards cannot be combined with --diff-against")
+    if parsed.jobs is not None:
+        if parsed.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        if not parsed.output:
+            parser.error("--jobs requires --output")
+        if parsed.diff_against or parsed.shards is not None:
+            parser.error("--jobs cannot be combined with --diff-against or --shards")
+    elif parsed.ordered:
+        parser.error("--ordered requires --jobs")
+    if parsed.performance and (
+        parsed.diff_against or parsed.shards is not None or parsed.jobs is not None
+    ):
+        parser.error("--performance cannot be combined with --diff-against, --shards or --jobs")
+    if parsed.compact:
+        if not parsed.output:
+            parser.error("--compact requires --output")
+        if parsed.human or parsed.jobs is not None or parsed.shards is not None:
+            parser.error("--compact cannot be combined with --human, --jobs or --shards")
+
+    if parsed.coverage is not None:
+        if parsed.coverage < 1:
+            parser.error("--coverage must be at least 1")
+        if (
+            parsed.diff_against
+            or parsed.shards is not None
+            or parsed.jobs is not None
+            or parsed.performance
+        ):
+            parser.error(
+                "--coverage cannot be combined with --diff-against, --shards, --jobs "
+                "or --performance"
+            )
+
+    if (parsed.cost_estimates or parsed.cost_report) and (
+        parsed.jobs is not None or parsed.shards is not None
+    ):
+        parser.error(
+            "--cost-estimates and --cost-report cannot be combined with --jobs or --shards"
+        )
+    if parsed.profile and (parsed.jobs is not None or parsed.shards is not None):
+        parser.error("--profile cannot be combined with --jobs or --shards")
+    # Without --output, the manifest itself is written to stderr
+    if parsed.cost_report == "-" and not parsed.output:
+        parser.error("--cost-report requires a FILE unless --output is given")
+    if parsed.profile == "-" and not parsed.output:
+        parser.error("--profile requires a FILE unless --output is given")
 
-    manifest = build_manifest(parsed.keys)
+    # Tests are only counted by key kind once the keys manifest below has been loaded
+    profiler = Profiler(
+        kinds=lambda test: _test_key_kinds(test, keys), enabled=bool(parsed.profile)
+    ).start()
+    keys = _load_profiled_keys(parsed.keys, profiler)
+    cost_weights = load_cost_weights(parsed.cost_weights) if parsed.cost_weights else None
+    cost_report = None
+    if parsed.cost_estimates or parsed.cost_report:
+        cost_report = CostReport(
+            CostModel(
+                keys, PERFORMANCE_PLAINTEXTS if parsed.performance else PLAINTEXTS, cost_weights
+            ),
+            attach=parsed.cost_estimates,
+        )
 
     kwargs = {}
     if parsed.human:
         kwargs["indent"] = 4
 
-    return json.dumps(manifest, **kwargs)
+    if parsed.jobs is not None:
+        with output_stream(parsed.output) as stream:
+            stream_manifest_in_parallel(
+                keys,
+                stream,
+                parsed.jobs,
+                test_id_builder=test_id_builder,
+                ordered=parsed.ordered,
+                **kwargs
+            )
+        return None
+
+    if parsed.shards is not None:
+        stream_sharded_manifests(
+            keys,
+            parsed.output,
+            parsed.shards,
+            test_id_builder=test_id_builder,
+            cost_weights=cost_weights,
+            **kwargs
+        )
+        return None
+
+    if parsed.output and not (parsed.diff_against or parsed.performance):
+        with output_stream(parsed.output, binary=parsed.compact) as stream:
+            stream_manifest(
+                keys,
+                stream,
+                test_id_builder=test_id_builder,
+                compact=parsed.compact,
+                coverage=parsed.coverage,
+                cost_report=cost_report,
+                profiler=profiler,
+                **kwargs
+            )
+        if parsed.cost_report:
+            cost_report.write(parsed.cost_report)
+        if parsed.profile:
+            profiler.write(parsed.profile)
+        return None
+
+    if parsed.performance:
+        with profiler.phase("build-tests"):
+            manifest = build_performance_manifest(
+                keys, profiler.timed(test_id_builder, "test-ids")
+            )
+    elif parsed.diff_against:
+        with profiler.phase("build-tests"):
+            manifest = build_delta_manifest(
+                keys, parsed.diff_against, profiler.timed(test_id_builder, "test-ids")
+            )
+    else:
+        manifest = build_manifest(keys, test_id_builder, parsed.coverage, profiler)
+    if profiler.enabled:
+        for test in manifest["tests"].values():
+            profiler.add(test)
+
+    if cost_report is not None:
+        with profiler.phase("cost-estimates"):
+            manifest["tests"] = dict(cost_report.observe(manifest["tests"].items()))
+        if parsed.cost_report:
+            cost_report.write(parsed.cost_report)
+
+    output = None
+    with profiler.phase("write-manifest"):
+        if parsed.output:
+            with output_stream(parsed.output, binary=parsed.compact) as stream:
+                if parsed.compact:
+                    write_compact_manifest(stream, manifest, manifest["tests"].items())
+                else:
+                    stream.write(json.dumps(manifest, **kwargs))
+        else:
+            output = json.dumps(manifest, **kwargs)
+    if parsed.profile:
+        profiler.write(parsed.profile)
+    return output
 
 
 if __name__ == "__main__":
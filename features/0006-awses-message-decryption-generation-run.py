@@ -0,0 +1,119 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import argparse
+import json
+import sys
+from aws_kms_stand_in import KMSStandIn
+from awses_message_decryption_generation_utils import DEFAULT_QUEUE_SIZE, generate_vectors
+from manifest_reader_utils import ManifestReader
+
+
+def main(args=None):
+    """Entry point for CLI"""
+    parser = argparse.ArgumentParser(
+        description="Generate AWS Encryption SDK decrypt test vectors and their decrypt manifest "
+        "from a decrypt generation manifest."
+    )
+    parser.add_argument("--manifest", required=True, help="Decrypt generation manifest to process")
+    parser.add_argument(
+        "--handler",
+        required=True,
+        help="Client handler class to use, as module:attribute "
+        "(for example awses_sdk_encrypt_handler:AwsEncryptionSdkEncryptHandler)",
+    )
+    parser.add_argument(
+        "--output", required=True, help="Directory to which to write the generated vectors"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Number of encrypt worker threads (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Maximum number of items waiting between two pipeline stages",
+    )
+    parser.add_argument(
+        "--container",
+        action="store_true",
+        help="Write all ciphertexts to a single container file instead of one file each",
+    )
+    parser.add_argument(
+        "--tampered-descriptors",
+        action="store_true",
+        help="Write each truncated or mutated message once, with compact descriptors of the "
+        "vectors derived from it, instead of writing every derived vector",
+    )
+    parser.add_argument(
+        "--plaintext-seed", type=int, default=0, help="Seed from which to generate plaintext content"
+    )
+    parser.add_argument(
+        "--human", action="store_true", help="Write a human-readable decrypt manifest"
+    )
+    parser.add_argument(
+        "--kms-endpoint", help="Endpoint URL to use for AWS KMS, such as a local stand-in"
+    )
+    parser.add_argument(
+        "--kms-stand-in",
+        action="store_true",
+        help="Serve AWS KMS requests from a local stand-in for the manifest's aws-kms keys",
+    )
+    parser.add_argument(
+        "--key-cache", help="Directory in which to cache parsed RSA keys between runs"
+    )
+
+    parsed = parser.parse_args(args)
+    if parsed.kms_endpoint and parsed.kms_stand_in:
+        parser.error("--kms-endpoint cannot be combined with --kms-stand-in")
+    if parsed.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+
+    config = {}
+    if parsed.kms_endpoint:
+        config["kms-endpoint"] = parsed.kms_endpoint
+    if parsed.key_cache:
+        config["key-cache-directory"] = parsed.key_cache
+    stand_in = None
+    if parsed.kms_stand_in:
+        with ManifestReader(parsed.manifest, "awses-decrypt-generate") as reader:
+            stand_in = KMSStandIn(reader.keys).start()
+        config["kms-endpoint"] = stand_in.endpoint
+
+    try:
+        summary = generate_vectors(
+            parsed.manifest,
+            parsed.handler,
+            parsed.output,
+            workers=parsed.workers,
+            config=config,
+            queue_size=parsed.queue_size,
+            container=parsed.container,
+            plaintext_seed=parsed.plaintext_seed,
+            indent=4 if parsed.human else None,
+            describe_tampered=parsed.tampered_descriptors,
+        )
+    finally:
+        if stand_in is not None:
+            stand_in.shutdown()
+
+    for test_id, reason in sorted(summary["skipped-tests"].items()):
+        print("SKIPPED {test_id}: {reason}".format(test_id=test_id, reason=reason))
+    print(json.dumps(summary, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
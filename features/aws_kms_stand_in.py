@@ -0,0 +1,468 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import argparse
+import base64
+import binascii
+import collections
+import hashlib
+import hmac
+import http.server
+import json
+import os
+import random
+import socketserver
+import struct
+import sys
+import threading
+import time
+import uuid
+
+# Secret from which key material is derived unless another is given, so that ciphertexts
+# produced by one run of the stand-in can be decrypted by later runs
+DEFAULT_SECRET = "aws-crypto-tools-test-vectors"
+
+DATA_KEY_SPECS = {"AES_128": 16, "AES_256": 32}
+
+_BLOB_VERSION = 1
+_BLOB_HEADER = struct.Struct(">BH")
+_NONCE_LENGTH = 16
+_TAG_LENGTH = 32
+
+_CONTENT_TYPE = "application/x-amz-json-1.1"
+_TARGET_PREFIX = "TrentService."
+
+
+class KMSError(Exception):
+    """Error returned to a client in the AWS JSON protocol.
+
+    :param str error_type: AWS KMS exception name, such as ``AccessDeniedException``
+    :param str message: Description of the error
+    """
+
+    def __init__(self, error_type, message):
+        super(KMSError, self).__init__(message)
+        self.error_type = error_type
+
+
+def key_identifiers(key_id):
+    """List the identifiers by which a request may refer to an AWS KMS key.
+
+    :param str key_id: Key ID from a keys manifest entry, usually a key or alias ARN
+    :returns: The key ID itself and, for ARNs, the ``alias/name`` or bare key ID
+    """
+    identifiers = [key_id]
+    if key_id.startswith("arn:"):
+        resource = key_id.split(":", 5)[-1]
+        if resource.startswith("key/"):
+            resource = resource[len("key/"):]
+        identifiers.append(resource)
+    return identifiers
+
+
+class _Key(object):
+    """Key material and permissions of a single ``aws-kms`` keys manifest entry.
+
+    Ciphertexts are encrypted with an HMAC-SHA256 keystream and authenticated with
+    HMAC-SHA256 over the key ID, the nonce, the ciphertext and the encryption context.
+    This keeps the stand-in free of dependencies; it is not meant to protect real data.
+    """
+
+    def __init__(self, key_id, entry, secret):
+        self.key_id = key_id
+        self.encrypt = entry.get("encrypt", False)
+        self.decrypt = entry.get("decrypt", False)
+        root = hmac.new(secret, key_id.encode("utf-8"), hashlib.sha256).digest()
+        self._cipher_key = hmac.new(root, b"cipher", hashlib.sha256).digest()
+        self._mac_key = hmac.new(root, b"mac", hashlib.sha256).digest()
+
+    def _keystream(self, nonce, length):
+        blocks = []
+        for counter in range((length + 31) // 32):
+            blocks.append(
+                hmac.new(self._cipher_key, nonce + struct.pack(">I", counter), hashlib.sha256)
+                .digest()
+            )
+        return b"".join(blocks)[:length]
+
+    def _tag(self, prefix, ciphertext, context):
+        encoded_context = json.dumps(context, sort_keys=True, separators=(",", ":"))
+        return hmac.new(
+            self._mac_key, prefix + ciphertext + encoded_context.encode("utf-8"), hashlib.sha256
+        ).digest()
+
+    def seal(self, plaintext, context):
+        """Encrypt a plaintext into a ciphertext blob that identifies this key."""
+        encoded_key_id = self.key_id.encode("utf-8")
+        nonce = os.urandom(_NONCE_LENGTH)
+        prefix = _BLOB_HEADER.pack(_BLOB_VERSION, len(encoded_key_id)) + encoded_key_id + nonce
+        ciphertext = bytes(
+            a ^ b for a, b in zip(plaintext, self._keystream(nonce, len(plaintext)))
+        )
+        return prefix + ciphertext + self._tag(prefix, ciphertext, context)
+
+    def open(self, blob, context):
+        """Decrypt a ciphertext blob sealed by this key.
+
+        :raises KMSError: if the blob was not sealed by this key with this encryption context
+        """
+        prefix_length = _BLOB_HEADER.size + len(self.key_id.encode("utf-8")) + _NONCE_LENGTH
+        prefix = blob[:prefix_length]
+        ciphertext = blob[prefix_length:-_TAG_LENGTH]
+        if not hmac.compare_digest(self._tag(prefix, ciphertext, context), blob[-_TAG_LENGTH:]):
+            raise KMSError("InvalidCiphertextException", "Ciphertext failed authentication")
+        nonce = prefix[-_NONCE_LENGTH:]
+        return bytes(a ^ b for a, b in zip(ciphertext, self._keystream(nonce, len(ciphertext))))
+
+
+def _blob_key_id(blob):
+    """Read the key ID that a ciphertext blob was sealed under."""
+    if len(blob) < _BLOB_HEADER.size + _NONCE_LENGTH + _TAG_LENGTH:
+        raise KMSError("InvalidCiphertextException", "Ciphertext is too short")
+    version, key_id_length = _BLOB_HEADER.unpack_from(blob)
+    if version != _BLOB_VERSION:
+        raise KMSError("InvalidCiphertextException", "Ciphertext was not produced by this service")
+    try:
+        return blob[_BLOB_HEADER.size:_BLOB_HEADER.size + key_id_length].decode("utf-8")
+    except UnicodeDecodeError:
+        raise KMSError("InvalidCiphertextException", "Ciphertext was not produced by this service")
+
+
+def _decode_blob(request, member):
+    try:
+        return base64.b64decode(request[member], validate=True)
+    except KeyError:
+        raise KMSError("ValidationException", "{} is required".format(member))
+    except (binascii.Error, TypeError):
+        raise KMSError("ValidationException", "{} is not valid base64".format(member))
+
+
+def _request_string(request, member):
+    try:
+        value = request[member]
+    except KeyError:
+        raise KMSError("ValidationException", "{} is required".format(member))
+    if not isinstance(value, str):
+        raise KMSError("ValidationException", "{} must be a string".format(member))
+    return value
+
+
+def _encryption_context(request):
+    context = request.get("EncryptionContext", {})
+    if not isinstance(context, dict) or not all(
+        isinstance(name, str) and isinstance(value, str) for name, value in context.items()
+    ):
+        raise KMSError("ValidationException", "EncryptionContext must map strings to strings")
+    return context
+
+
+def _encode_blob(data):
+    return base64.b64encode(data).decode("utf-8")
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serve AWS JSON protocol requests, keeping connections alive between requests."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        target = self.headers.get("X-Amz-Target", "")
+        operation = target[len(_TARGET_PREFIX):] if target.startswith(_TARGET_PREFIX) else target
+        try:
+            try:
+                request = json.loads(body.decode("utf-8")) if body else {}
+            except ValueError:
+                raise KMSError("SerializationException", "Request body is not valid JSON")
+            if not isinstance(request, dict):
+                raise KMSError("ValidationException", "Request body must be a JSON object")
+            status, response = 200, stand_in.handle(operation, request)
+        except KMSError as error:
+            status, response = 400, {"__type": error.error_type, "message": str(error)}
+        except (TypeError, ValueError) as error:
+            # Any other malformed request must still get an answer, so the connection survives
+            status, response = 400, {"__type": "ValidationException", "message": str(error)}
+        encoded = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", _CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        if self.server.stand_in.verbose:
+            super(_RequestHandler, self).log_message(format, *args)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class KMSStandIn(object):
+    """Local stand-in for AWS KMS that serves the ``aws-kms`` keys of a keys manifest.
+
+    The stand-in answers ``Encrypt``, ``GenerateDataKey``, ``GenerateDataKeyWithoutPlaintext``
+    and ``Decrypt`` in the AWS JSON protocol used by the AWS SDKs, so clients only need their
+    KMS endpoint pointed at :attr:`endpoint`. Requests are not authenticated. Each key may only
+    be used for the operations that its keys manifest entry allows with ``encrypt`` and
+    ``decrypt``; other requests fail with ``AccessDeniedException``. Ciphertexts can only be
+    decrypted by a stand-in with the same secret.
+
+    Each connection is served on its own thread and kept alive between requests. Latency can
+    be injected into every response, and a fraction of requests can be throttled, to test how
+    clients handle a slow or overloaded KMS.
+
+    :param dict keys: Parsed keys manifest
+    :param str host: Address on which to listen
+    :param int port: Port on which to listen (default: any free port)
+    :param float latency: Seconds to wait before answering each request
+    :param float jitter: Maximum additional seconds, chosen uniformly, to wait for each request
+    :param float throttle_rate: Fraction of requests to fail with ``ThrottlingException``
+    :param str secret: Secret from which to derive key material
+    :param bool verbose: Log each request to stderr
+    """
+
+    def __init__(
+        self,
+        keys,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        throttle_rate=0.0,
+        secret=DEFAULT_SECRET,
+        verbose=False,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.verbose = verbose
+        self._random = random.Random()
+        self._keys = {}
+        for entry in keys["keys"].values():
+            if entry["type"] != "aws-kms":
+                continue
+            key = _Key(entry["key-id"], entry, secret.encode("utf-8"))
+            for identifier in key_identifiers(entry["key-id"]):
+                self._keys[identifier] = key
+        self._counts = collections.Counter()
+        self._counts_lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((host, port), _RequestHandler)
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        """Endpoint URL at which the stand-in listens."""
+        host, port = self._server.server_address[:2]
+        return "http://{host}:{port}".format(host=host, port=port)
+
+    @property
+    def request_counts(self):
+        """Number of requests served for each operation and outcome."""
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def _key(self, key_id, permission):
+        try:
+            key = self._keys[key_id]
+        except KeyError:
+            raise KMSError("NotFoundException", "Key '{}' does not exist".format(key_id))
+        if not getattr(key, permission):
+            raise KMSError(
+                "AccessDeniedException",
+                "Key '{key_id}' does not allow {permission}".format(
+                    key_id=key.key_id, permission=permission
+                ),
+            )
+        return key
+
+    def _data_key_length(self, request):
+        if "NumberOfBytes" in request:
+            length = request["NumberOfBytes"]
+            if not isinstance(length, int) or not 1 <= length <= 1024:
+                raise KMSError("ValidationException", "NumberOfBytes must be from 1 to 1024")
+            return length
+        try:
+            return DATA_KEY_SPECS[request["KeySpec"]]
+        except KeyError:
+            raise KMSError("ValidationException", "KeySpec or NumberOfBytes is required")
+
+    def _request_key(self, request, permission):
+        return self._key(_request_string(request, "KeyId"), permission)
+
+    def _encrypt(self, request):
+        key = self._request_key(request, "encrypt")
+        blob = key.seal(_decode_blob(request, "Plaintext"), _encryption_context(request))
+        return {"CiphertextBlob": _encode_blob(blob), "KeyId": key.key_id}
+
+    def _generate_data_key(self, request, include_plaintext=True):
+        key = self._request_key(request, "encrypt")
+        data_key = os.urandom(self._data_key_length(request))
+        response = {
+            "CiphertextBlob": _encode_blob(key.seal(data_key, _encryption_context(request))),
+            "KeyId": key.key_id,
+        }
+        if include_plaintext:
+            response["Plaintext"] = _encode_blob(data_key)
+        return response
+
+    def _decrypt(self, request):
+        blob = _decode_blob(request, "CiphertextBlob")
+        key = self._key(_blob_key_id(blob), "decrypt")
+        if "KeyId" in request:
+            key_id = _request_string(request, "KeyId")
+            if self._keys.get(key_id) is not key:
+                raise KMSError(
+                    "IncorrectKeyException",
+                    "Ciphertext was not encrypted under key '{}'".format(key_id),
+                )
+        plaintext = key.open(blob, _encryption_context(request))
+        return {"KeyId": key.key_id, "Plaintext": _encode_blob(plaintext)}
+
+    def handle(self, operation, request):
+        """Answer a single request, after any injected latency.
+
+        :param str operation: Operation name, such as ``Decrypt``
+        :param dict request: Parsed request body
+        :returns: Response body
+        :raises KMSError: if the request fails
+        """
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        outcome = "error"
+        try:
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                outcome = "throttled"
+                raise KMSError("ThrottlingException", "Rate exceeded")
+            if operation == "Encrypt":
+                response = self._encrypt(request)
+            elif operation == "GenerateDataKey":
+                response = self._generate_data_key(request)
+            elif operation == "GenerateDataKeyWithoutPlaintext":
+                response = self._generate_data_key(request, include_plaintext=False)
+            elif operation == "Decrypt":
+                response = self._decrypt(request)
+            else:
+                raise KMSError(
+                    "UnsupportedOperationException",
+                    "Operation '{}' is not supported".format(operation),
+                )
+            outcome = "ok"
+            return response
+        finally:
+            with self._counts_lock:
+                self._counts["{}:{}".format(operation, outcome)] += 1
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve requests on the calling thread until :meth:`shutdown` is called."""
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop serving requests and close the listening socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+def main(args=None):
+    """Entry point for CLI"""
+    parser = argparse.ArgumentParser(
+        description="Serve the aws-kms keys of a keys manifest from a local AWS KMS stand-in."
+    )
+    parser.add_argument("--keys", required=True, help="Keys manifest to use")
+    parser.add_argument("--host", default="127.0.0.1", help="Address on which to listen")
+    parser.add_argument(
+        "--port", type=int, default=0, help="Port on which to listen (default: any free port)"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="MILLISECONDS",
+        help="Latency to add to every response",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        metavar="MILLISECONDS",
+        help="Maximum random latency to add to every response, on top of --latency",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests to fail with ThrottlingException",
+    )
+    parser.add_argument(
+        "--secret",
+        default=DEFAULT_SECRET,
+        help="Secret from which to derive key material; ciphertexts only decrypt with the "
+        "same secret",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log every request to stderr")
+
+    parsed = parser.parse_args(args)
+    if parsed.latency < 0 or parsed.jitter < 0:
+        parser.error("--latency and --jitter cannot be negative")
+    if not 0 <= parsed.throttle_rate <= 1:
+        parser.error("--throttle-rate must be from 0 to 1")
+
+    with open(parsed.keys, "r") as keys_file:
+        keys = json.load(keys_file)
+
+    stand_in = KMSStandIn(
+        keys,
+        host=parsed.host,
+        port=parsed.port,
+        latency=parsed.latency / 1000.0,
+        jitter=parsed.jitter / 1000.0,
+        throttle_rate=parsed.throttle_rate,
+        secret=parsed.secret,
+        verbose=parsed.verbose,
+    )
+    print(stand_in.endpoint)
+    sys.stdout.flush()
+    try:
+        stand_in.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stand_in.shutdown()
+        print(json.dumps(stand_in.request_counts, indent=4, sort_keys=True), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,498 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import io
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from awses_message_decryption_utils import _master_keys_signature, _shared, load_handler
+from container_utils import ContainerWriter
+from key_material_utils import KeyMaterialCache
+from manifest_reader_utils import ManifestReader
+from manifest_utils import ManifestWriter
+from plaintext_utils import PlaintextStore
+from tampering_utils import (
+    BULK_TAMPERINGS,
+    TRUNCATED,
+    tampered_descriptors,
+    tampered_parts,
+    write_descriptors
+)
+
+DECRYPT_MANIFEST_VERSION = 3
+
+# Default maximum number of items waiting between two pipeline stages
+DEFAULT_QUEUE_SIZE = 64
+
+# Names of the files and directories written to the output directory
+KEYS_FILENAME = "keys.json"
+MANIFEST_FILENAME = "manifest.json"
+PLAINTEXTS_DIRECTORY = "plaintexts"
+CIPHERTEXTS_DIRECTORY = "ciphertexts"
+CONTAINER_FILENAME = "ciphertexts.bin"
+# Suffix of the name under which the descriptors of a message's tampered vectors are written
+DESCRIPTORS_SUFFIX = ".tvd"
+
+# Seconds to wait on a full or empty queue before checking whether the pipeline is stopping
+_POLL_INTERVAL = 0.1
+
+
+class EncryptHandler(object):
+    """Interface between the decrypt generation pipeline and a client implementation.
+
+    The pipeline creates one handler for each encrypt worker thread and loads each distinct
+    master key description through it at most once per worker. Handlers should get raw key
+    material from ``key_material``, which is shared by every worker, rather than parsing it
+    themselves.
+
+    :param dict config: Pipeline configuration, such as ``kms-endpoint``
+    :param key_material: :class:`KeyMaterialCache` to use (optional)
+    """
+
+    def __init__(self, config, key_material=None):
+        self.config = config
+        self.key_material = key_material if key_material is not None else KeyMaterialCache()
+
+    def client(self):
+        """Identify the client, as the ``client`` member of the decrypt manifest.
+
+        :returns: ``name`` and ``version`` of the client
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def load_master_key(self, master_key, key):
+        """Build the client object for a master key description.
+
+        :param dict master_key: Master key description from the encryption scenario
+        :param dict key: Entry for the referenced key from the keys manifest
+        """
+        raise NotImplementedError
+
+    def encrypt(self, plaintext, master_keys, scenario):
+        """Encrypt a message.
+
+        :param memoryview plaintext: Plaintext to encrypt
+        :param list master_keys: Objects returned by :meth:`load_master_key` for each master key
+        :param dict scenario: Encryption scenario, for its algorithm suite, frame size
+            and encryption context
+        :returns: Encrypted message
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def tamper(self, plaintext, master_keys, scenario, tampering):
+        """Encrypt messages that must fail to decrypt, using a tampering method that needs
+        the client's cooperation, such as ``half-sign`` or ``change-edk-provider-info``.
+        Tests with tampering methods that a handler does not support are skipped.
+
+        :param memoryview plaintext: Plaintext to encrypt
+        :param list master_keys: Objects returned by :meth:`load_master_key` for each master key
+        :param dict scenario: Encryption scenario
+        :param tampering: Tampering method from the test
+        :returns: Tampered messages
+        :rtype: list of bytes
+        :raises NotImplementedError: if the handler does not support the tampering method
+        """
+        raise NotImplementedError
+
+
+class _Stopped(Exception):
+    """Raised in a pipeline stage when another stage has failed."""
+
+
+# Marks the end of the items on a queue
+_DONE = object()
+
+
+class _Pipeline(object):
+    """Threads connected by bounded queues, stopping every stage as soon as one of them fails."""
+
+    def __init__(self):
+        self.stopping = threading.Event()
+        self.error = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def fail(self, error):
+        with self._lock:
+            if self.error is None:
+                self.error = error
+        self.stopping.set()
+
+    def start(self, target, *args):
+        def _run():
+            try:
+                target(*args)
+            except _Stopped:
+                pass
+            except BaseException as error:
+                self.fail(error)
+
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def put(self, stage_queue, item):
+        while True:
+            if self.stopping.is_set():
+                raise _Stopped()
+            try:
+                stage_queue.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, stage_queue):
+        while True:
+            if self.stopping.is_set():
+                raise _Stopped()
+            try:
+                return stage_queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    def items(self, stage_queue, producer_count=1):
+        """Iterate over the items on a queue until every producer has finished."""
+        remaining = producer_count
+        while remaining:
+            item = self.get(stage_queue)
+            if item is _DONE:
+                remaining -= 1
+            else:
+                yield item
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+
+def _tampering_name(tampering):
+    if isinstance(tampering, dict):
+        return ", ".join(sorted(tampering))
+    return tampering
+
+
+def _record(test, result, description=None):
+    """Build the decrypt test description for a vector, without its ciphertext URI."""
+    record = {}
+    if description is not None:
+        record["description"] = description
+    record["master-keys"] = test.get(
+        "decryption-master-keys", test["encryption-scenario"]["master-keys"]
+    )
+    if "decryption-method" in test:
+        record["decryption-method"] = test["decryption-method"]
+    record["result"] = result
+    return record
+
+
+def _error_result(description):
+    return {"error": {"error-description": description}}
+
+
+def _bulk_description(tampering, offset, bit):
+    if bit == TRUNCATED:
+        return "Message truncated to {} bytes".format(offset)
+    return "Bit {bit} of byte {offset} flipped".format(bit=bit, offset=offset)
+
+
+_BULK_SET_DESCRIPTIONS = {
+    "truncate": "Message truncated to every length shorter than the message",
+    "mutate": "Each bit of the message flipped in turn",
+}
+
+
+def _encoded_descriptors(tampering, length):
+    """Encode the descriptors of every vector that a bulk tampering method derives from
+    a single message."""
+    stream = io.BytesIO()
+    write_descriptors(stream, [(tampering, length)])
+    return stream.getvalue()
+
+
+class _EncryptWorker(object):
+    """State of a single encrypt worker thread."""
+
+    def __init__(self, handler_spec, config, keys, plaintexts):
+        key_material = _shared(KeyMaterialCache, config.get("key-cache-directory", None))
+        self.handler = load_handler(handler_spec)(config, key_material)
+        self.keys = keys
+        self.plaintexts = plaintexts
+        self.master_keys = {}
+
+    def load_master_keys(self, master_keys):
+        loaded = []
+        for master_key in master_keys:
+            signature = _master_keys_signature(master_key)
+            if signature not in self.master_keys:
+                key = self.keys["keys"][master_key["key"]]
+                self.master_keys[signature] = self.handler.load_master_key(master_key, key)
+            loaded.append(self.master_keys[signature])
+        return loaded
+
+    def encrypt(self, test):
+        """Encrypt the messages for a single test.
+
+        :returns: Encrypted messages, each with the name of the bulk tampering method
+            to expand it with, or None
+        """
+        scenario = test["encryption-scenario"]
+        master_keys = self.load_master_keys(scenario["master-keys"])
+        tampering = test.get("tampering", None)
+        with self.plaintexts[scenario["plaintext"]] as plaintext:
+            if tampering is None or tampering in BULK_TAMPERINGS:
+                return [(self.handler.encrypt(plaintext, master_keys, scenario), tampering)]
+            return [
+                (ciphertext, None)
+                for ciphertext in self.handler.tamper(plaintext, master_keys, scenario, tampering)
+            ]
+
+
+def _feed_stage(pipeline, tests, encrypt_queue, worker_count, counts):
+    for item in tests:
+        pipeline.put(encrypt_queue, item)
+        counts["tests"] += 1
+    for _ in range(worker_count):
+        pipeline.put(encrypt_queue, _DONE)
+
+
+def _encrypt_stage(pipeline, worker, encrypt_queue, expand_queue, skipped):
+    for test_id, test in pipeline.items(encrypt_queue):
+        try:
+            ciphertexts = worker.encrypt(test)
+        except NotImplementedError:
+            skipped[test_id] = "Tampering method is not supported by the handler: {}".format(
+                _tampering_name(test.get("tampering", None))
+            )
+            continue
+        except Exception as error:
+            raise RuntimeError("Could not encrypt test {}: {}".format(test_id, error))
+        pipeline.put(expand_queue, (test_id, test, ciphertexts))
+    pipeline.put(expand_queue, _DONE)
+
+
+def _expand_stage(
+    pipeline, expand_queue, write_queue, worker_count, plaintext_uris, describe_tampered=False
+):
+    """Turn each encrypted test into one or more vectors to write, deriving tampered
+    vectors from each base message one at a time, or describing them if ``describe_tampered``
+    is set."""
+    for test_id, test, ciphertexts in pipeline.items(expand_queue, worker_count):
+        tampering = test.get("tampering", None)
+        for index, (ciphertext, bulk_tampering) in enumerate(ciphertexts):
+            vector_id = test_id if len(ciphertexts) == 1 else "{}-{}".format(test_id, index)
+
+            if bulk_tampering is not None and describe_tampered:
+                description = _BULK_SET_DESCRIPTIONS[bulk_tampering]
+                pipeline.put(
+                    write_queue,
+                    (
+                        "{id}-{tampering}".format(id=vector_id, tampering=bulk_tampering),
+                        (ciphertext,),
+                        _record(test, _error_result(description), description),
+                        _encoded_descriptors(bulk_tampering, len(ciphertext)),
+                    ),
+                )
+                continue
+
+            if bulk_tampering is not None:
+                base = memoryview(ciphertext)
+                for offset, bit in tampered_descriptors(bulk_tampering, len(base)):
+                    description = _bulk_description(bulk_tampering, offset, bit)
+                    pipeline.put(
+                        write_queue,
+                        (
+                            "{id}-{tampering}-{offset}{bit}".format(
+                                id=vector_id,
+                                tampering=bulk_tampering,
+                                offset=offset,
+                                bit="" if bit == TRUNCATED else "-{}".format(bit),
+                            ),
+                            tampered_parts(base, offset, bit),
+                            _record(test, _error_result(description), description),
+                            None,
+                        ),
+                    )
+                continue
+
+            if tampering is not None:
+                result = _error_result(
+                    "Message tampered with by {}".format(_tampering_name(tampering))
+                )
+            elif "result" in test:
+                result = test["result"]
+            else:
+                plaintext_uri = plaintext_uris[test["encryption-scenario"]["plaintext"]]
+                result = {"output": {"plaintext": plaintext_uri}}
+            pipeline.put(write_queue, (vector_id, (ciphertext,), _record(test, result), None))
+    pipeline.put(write_queue, _DONE)
+
+
+def _write_stage(pipeline, write_queue, record_queue, store):
+    for vector_id, parts, record, descriptors in pipeline.items(write_queue):
+        test = {}
+        if "description" in record:
+            test["description"] = record["description"]
+        test["ciphertext"] = store(vector_id, parts)
+        if descriptors is not None:
+            test["tampered-vectors"] = store(vector_id + DESCRIPTORS_SUFFIX, (descriptors,))
+        test.update((name, value) for name, value in record.items() if name != "description")
+        pipeline.put(record_queue, (vector_id, test))
+    pipeline.put(record_queue, _DONE)
+
+
+def _ciphertext_file_store(output_directory):
+    """Build a function that writes each ciphertext to its own file and returns its URI."""
+    directory = os.path.join(output_directory, CIPHERTEXTS_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+
+    def _store(vector_id, parts):
+        with open(os.path.join(directory, vector_id), "wb") as ciphertext_file:
+            for part in parts:
+                ciphertext_file.write(part)
+        return "file://{}/{}".format(CIPHERTEXTS_DIRECTORY, vector_id)
+
+    return _store
+
+
+def generate_vectors(
+    manifest_filename,
+    handler_spec,
+    output_directory,
+    workers=None,
+    config=None,
+    queue_size=DEFAULT_QUEUE_SIZE,
+    container=False,
+    plaintext_seed=0,
+    indent=None,
+    describe_tampered=False,
+):
+    """Process an AWS Encryption SDK message decryption generation (0006) manifest, writing
+    plaintexts, ciphertexts, the keys manifest and a message decryption (0004) manifest
+    to an output directory.
+
+    Tests flow through a pipeline of stages connected by bounded queues: encryption on a pool
+    of worker threads, expansion of tampered messages into individual vectors, ciphertext
+    writes, and recording of each vector in the decrypt manifest, which is written as each
+    vector is recorded. Only a bounded number of tests and vectors are in flight at once, so
+    memory use does not grow with the manifest, and encryption overlaps with disk writes.
+
+    :param str manifest_filename: Name of file containing the decrypt generation manifest
+    :param str handler_spec: ``module:attribute`` identifying an :class:`EncryptHandler` class
+    :param str output_directory: Directory to which to write the generated files
+    :param int workers: Number of encrypt worker threads (default: number of CPUs)
+    :param dict config: Configuration to pass to each handler (optional)
+    :param int queue_size: Maximum number of items waiting between two stages
+    :param bool container: Write all ciphertexts to a single container file instead of
+        one file each
+    :param plaintext_seed: Seed from which to generate plaintext content
+    :param int indent: Optional indent to use for the human-readable decrypt manifest
+    :param bool describe_tampered: Instead of writing every truncated or mutated vector, write
+        each base message once with the descriptors of the vectors derived from it, as a single
+        test with a ``tampered-vectors`` member
+    :returns: Summary of the generated vectors
+    :rtype: dict
+    """
+    config = config or {}
+    workers = workers or multiprocessing.cpu_count()
+    os.makedirs(output_directory, exist_ok=True)
+    start = time.perf_counter()
+
+    with ManifestReader(manifest_filename, "awses-decrypt-generate") as reader:
+        keys = reader.keys
+        with open(os.path.join(output_directory, KEYS_FILENAME), "w") as keys_file:
+            json.dump(keys, keys_file, indent=4)
+
+        plaintexts = PlaintextStore.from_manifest(
+            reader.header, os.path.join(output_directory, PLAINTEXTS_DIRECTORY), plaintext_seed
+        )
+        plaintext_uris = {
+            name: "file://{}/{}".format(PLAINTEXTS_DIRECTORY, name)
+            for name in reader.header["plaintexts"]
+        }
+        handler = load_handler(handler_spec)(config)
+        header = {
+            "manifest": {"type": "awses-decrypt", "version": DECRYPT_MANIFEST_VERSION},
+            "client": handler.client(),
+            "keys": "file://{}".format(KEYS_FILENAME),
+        }
+
+        if container:
+            ciphertexts = ContainerWriter(os.path.join(output_directory, CONTAINER_FILENAME))
+
+            def store(vector_id, parts):
+                return ciphertexts.add(parts, vector_id)
+
+        else:
+            ciphertexts = None
+            store = _ciphertext_file_store(output_directory)
+
+        pipeline = _Pipeline()
+        encrypt_queue = queue.Queue(queue_size)
+        expand_queue = queue.Queue(queue_size)
+        write_queue = queue.Queue(queue_size)
+        record_queue = queue.Queue(queue_size)
+        counts = {"tests": 0}
+        skipped = {}
+        try:
+            pipeline.start(
+                _feed_stage, pipeline, reader.tests(), encrypt_queue, workers, counts
+            )
+            for _ in range(workers):
+                worker = _EncryptWorker(handler_spec, config, keys, plaintexts)
+                pipeline.start(
+                    _encrypt_stage, pipeline, worker, encrypt_queue, expand_queue, skipped
+                )
+            pipeline.start(
+                _expand_stage,
+                pipeline,
+                expand_queue,
+                write_queue,
+                workers,
+                plaintext_uris,
+                describe_tampered,
+            )
+            pipeline.start(_write_stage, pipeline, write_queue, record_queue, store)
+
+            with open(os.path.join(output_directory, MANIFEST_FILENAME), "w") as manifest_file:
+                writer = ManifestWriter(manifest_file, header, indent)
+                try:
+                    for vector_id, test in pipeline.items(record_queue):
+                        writer.add(vector_id, test)
+                except _Stopped:
+                    pass
+                except BaseException as error:
+                    pipeline.fail(error)
+                if pipeline.error is None:
+                    writer.close()
+            pipeline.join()
+        finally:
+            pipeline.stopping.set()
+            if ciphertexts is not None:
+                ciphertexts.close()
+            plaintexts.close()
+
+    if pipeline.error is not None:
+        raise pipeline.error
+    return {
+        "tests": counts["tests"],
+        "vectors": writer.test_count,
+        "skipped-tests": skipped,
+        "elapsed-seconds": time.perf_counter() - start,
+    }
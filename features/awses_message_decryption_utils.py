@@ -0,0 +1,388 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import collections
+import importlib
+import io
+import json
+import multiprocessing.pool
+import threading
+import time
+from awses_message_encryption_utils import KeysManifest
+from container_utils import ContainerReader
+from key_material_utils import KeyMaterialCache
+from manifest_reader_utils import ManifestReader
+from result_cache_utils import (
+    ResultCache,
+    cache_context,
+    cache_key,
+    data_digest,
+    scenario_digest,
+)
+from tampering_utils import TRUNCATED, read_descriptors, tampered_parts
+
+# Default number of tests with the same master keys to schedule on a worker at once
+DEFAULT_GROUP_SIZE = 32
+
+
+class DecryptHandler(object):
+    """Interface between the decrypt manifest runner and a client implementation.
+
+    The runner creates one handler in each worker and loads each distinct master key
+    description through it at most once per worker. Handlers should get raw key material
+    from ``key_material``, which is shared by every worker in a process, rather than
+    parsing it themselves.
+
+    :param dict config: Runner configuration, such as ``kms-endpoint``
+    :param key_material: :class:`KeyMaterialCache` to use (optional)
+    """
+
+    def __init__(self, config, key_material=None):
+        self.config = config
+        self.key_material = key_material if key_material is not None else KeyMaterialCache()
+
+    def client(self):
+        """Identify the client, so that cached results are only reused for the same client
+        version. Handlers that do not identify their client cannot use a result cache.
+
+        :returns: ``name`` and ``version`` of the client, or None
+        :rtype: dict
+        """
+        return None
+
+    def load_master_key(self, master_key, key):
+        """Build the client object for a master key description.
+
+        :param dict master_key: Master key description from the test
+        :param dict key: Entry for the referenced key from the keys manifest
+        """
+        raise NotImplementedError
+
+    def decrypt(self, ciphertext, master_keys, decryption_method=None):
+        """Decrypt a message.
+
+        :param ciphertext: Message to decrypt, as bytes or, for ranges of a container, a memoryview
+        :param list master_keys: Objects returned by :meth:`load_master_key` for each master key
+        :param str decryption_method: Decryption method from the test (optional)
+        :returns: Decrypted plaintext
+        :raises Exception: if decryption fails
+        """
+        raise NotImplementedError
+
+
+def load_handler(spec):
+    """Import a handler class from a ``module:attribute`` specification.
+
+    :param str spec: Module and attribute name
+    """
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError("Handler must be specified as \"module:attribute\": \"{}\"".format(spec))
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _master_keys_signature(master_keys):
+    """Build a key that identifies a list of master key descriptions by value."""
+    return json.dumps(master_keys, sort_keys=True)
+
+
+def group_tests(tests, group_size=DEFAULT_GROUP_SIZE):
+    """Group tests that use the same master keys, so that each worker loads few distinct keys.
+
+    Each group is yielded as soon as it is full, so tests can be scheduled while they are
+    still being read; partial groups are yielded once all tests have been read.
+
+    :param tests: Iterable of ``(test_id, test)`` pairs
+    :param int group_size: Maximum number of tests in each group
+    :returns: Iterator of lists of ``(test_id, test)`` pairs
+    """
+    groups = collections.OrderedDict()
+    for test_id, test in tests:
+        signature = _master_keys_signature(test["master-keys"])
+        group = groups.setdefault(signature, [])
+        group.append((test_id, test))
+        if len(group) >= group_size:
+            yield groups.pop(signature)
+
+    for group in groups.values():
+        yield group
+
+
+_WORKER_STATE = threading.local()
+_SHARED_STATE = {}
+_SHARED_STATE_LOCK = threading.Lock()
+
+
+def _shared(factory, argument):
+    """Get the object built by a factory that is shared by every worker in this process."""
+    with _SHARED_STATE_LOCK:
+        if (factory, argument) not in _SHARED_STATE:
+            _SHARED_STATE[(factory, argument)] = factory(argument)
+        return _SHARED_STATE[(factory, argument)]
+
+
+def _init_worker(handler_spec, config, keys, manifest_directory, result_cache_context=None):
+    """Prepare a worker thread or process to run tests."""
+    key_material = _shared(KeyMaterialCache, config.get("key-cache-directory", None))
+    _WORKER_STATE.handler = load_handler(handler_spec)(config, key_material)
+    _WORKER_STATE.keys = keys
+    _WORKER_STATE.reader = _shared(ContainerReader, manifest_directory)
+    _WORKER_STATE.master_keys = {}
+    _WORKER_STATE.result_cache = None
+    if result_cache_context is not None:
+        _WORKER_STATE.result_cache = _shared(ResultCache, config["result-cache-directory"])
+        _WORKER_STATE.cache_context = result_cache_context
+        _WORKER_STATE.plaintext_digests = {}
+
+
+def _result_cache_context(handler_spec, config, header, keys):
+    """Digest what determines the results of every test in a run, or None without a cache.
+
+    :raises ValueError: if the handler does not identify its client
+    """
+    if config.get("result-cache-directory", None) is None:
+        return None
+    decrypting_client = load_handler(handler_spec)(config).client()
+    if decrypting_client is None:
+        raise ValueError("Result caching requires a handler that identifies its client")
+    return cache_context(header.get("client", None), decrypting_client, KeysManifest(keys).digest)
+
+
+def _read_uri(uri):
+    """Read a resource, without copying it if it is a range of a container."""
+    return _WORKER_STATE.reader.read(uri)
+
+
+def _load_master_keys(master_keys):
+    """Load master key objects through the worker's handler, at most once per description."""
+    loaded = []
+    for master_key in master_keys:
+        signature = _master_keys_signature(master_key)
+        if signature not in _WORKER_STATE.master_keys:
+            key = _WORKER_STATE.keys["keys"][master_key["key"]]
+            _WORKER_STATE.master_keys[signature] = _WORKER_STATE.handler.load_master_key(
+                master_key, key
+            )
+        loaded.append(_WORKER_STATE.master_keys[signature])
+    return loaded
+
+
+def _read_tampered_vectors(uri):
+    """Read the descriptors of the vectors derived from the ciphertext of a test.
+
+    :returns: Encoded descriptors and a list of ``(offset, bit)`` pairs
+    :raises ValueError: if a descriptor refers to any other ciphertext
+    """
+    encoded = _read_uri(uri)
+    descriptors = []
+    for base_index, offset, bit in read_descriptors(io.BytesIO(encoded)):
+        if base_index != 0:
+            raise ValueError("Tampered vector descriptors must all derive from the test ciphertext")
+        descriptors.append((offset, bit))
+    return encoded, descriptors
+
+
+def _result_cache_key(test, ciphertext, encoded_descriptors=None):
+    """Build the result cache key of a test in a worker."""
+    plaintext_digest = None
+    if "output" in test["result"]:
+        uri = test["result"]["output"]["plaintext"]
+        if uri not in _WORKER_STATE.plaintext_digests:
+            _WORKER_STATE.plaintext_digests[uri] = data_digest(_read_uri(uri))
+        plaintext_digest = _WORKER_STATE.plaintext_digests[uri]
+    descriptors_digest = None
+    if encoded_descriptors is not None:
+        descriptors_digest = data_digest(encoded_descriptors)
+    scenario = scenario_digest(test, plaintext_digest, descriptors_digest)
+    return cache_key(_WORKER_STATE.cache_context, scenario, data_digest(ciphertext))
+
+
+def _run_test(test_id, test):
+    """Run a single decrypt test in a worker, unless it has already passed with the same
+    client, keys and ciphertext according to the result cache.
+
+    :returns: Test result, including the decryption latency in seconds
+    """
+    result = {"test-id": test_id, "passed": False}
+    key = None
+    try:
+        ciphertext = _read_uri(test["ciphertext"])
+        encoded_descriptors = descriptors = None
+        if "tampered-vectors" in test:
+            encoded_descriptors, descriptors = _read_tampered_vectors(test["tampered-vectors"])
+        if _WORKER_STATE.result_cache is not None:
+            key = _result_cache_key(test, ciphertext, encoded_descriptors)
+            cached = _WORKER_STATE.result_cache.get(key)
+            # Failures are run again, since they may have been caused by the environment
+            if cached is not None and cached["passed"]:
+                result.update(passed=True, latency=cached["latency"], cached=True)
+                if descriptors is not None:
+                    result["vectors"] = len(descriptors)
+                return result
+        master_keys = _load_master_keys(test["master-keys"])
+        expected = test["result"]
+    except Exception as error:
+        result["error"] = "Could not prepare test: {}".format(error)
+        return result
+
+    if descriptors is None:
+        _run_decryption(result, test, ciphertext, master_keys, expected)
+    else:
+        _run_tampered_decryptions(result, test, ciphertext, descriptors, master_keys, expected)
+    if key is not None:
+        _WORKER_STATE.result_cache.put(key, result)
+    return result
+
+
+def _run_decryption(result, test, ciphertext, master_keys, expected):
+    """Decrypt the ciphertext of a test and check the outcome, updating its result."""
+    start = time.perf_counter()
+    try:
+        plaintext = _WORKER_STATE.handler.decrypt(
+            ciphertext, master_keys, test.get("decryption-method", None)
+        )
+    except Exception as error:
+        result["latency"] = time.perf_counter() - start
+        if "error" in expected:
+            result["passed"] = True
+        else:
+            result["error"] = "Decryption failed: {}".format(error)
+        return result
+    result["latency"] = time.perf_counter() - start
+
+    if "error" in expected:
+        result["error"] = "Decryption succeeded but must fail: {}".format(
+            expected["error"].get("error-description", "")
+        )
+    elif bytes(plaintext) != _read_uri(expected["output"]["plaintext"]):
+        result["error"] = "Decrypted plaintext does not match expected plaintext"
+    else:
+        result["passed"] = True
+    return result
+
+
+def _run_tampered_decryptions(result, test, base, descriptors, master_keys, expected):
+    """Decrypt every vector derived from the ciphertext of a test and check each outcome,
+    updating the result of the test, which passes only if every vector does."""
+    result["vectors"] = len(descriptors)
+    result["latency"] = 0.0
+    for offset, bit in descriptors:
+        vector_result = {"passed": False}
+        vector = b"".join(tampered_parts(base, offset, bit))
+        _run_decryption(vector_result, test, vector, master_keys, expected)
+        result["latency"] += vector_result["latency"]
+        if not vector_result["passed"]:
+            if bit == TRUNCATED:
+                vector_name = "truncated to {} bytes".format(offset)
+            else:
+                vector_name = "with bit {bit} of byte {offset} flipped".format(
+                    bit=bit, offset=offset
+                )
+            result["error"] = "Message {name}: {error}".format(
+                name=vector_name, error=vector_result["error"]
+            )
+            return result
+    result["passed"] = True
+    return result
+
+
+def _run_test_group(group):
+    return [_run_test(test_id, test) for test_id, test in group]
+
+
+def run_tests(
+    manifest_filename,
+    handler_spec,
+    workers=None,
+    use_processes=False,
+    config=None,
+    group_size=DEFAULT_GROUP_SIZE,
+    key_types=None,
+    test_id_prefix=None,
+):
+    """Run every test in an AWS Encryption SDK message decryption (0004) manifest
+    on a pool of worker threads or processes.
+
+    :param str manifest_filename: Name of file containing the decrypt manifest
+    :param str handler_spec: ``module:attribute`` identifying a :class:`DecryptHandler` class
+    :param int workers: Number of workers (default: number of CPUs)
+    :param bool use_processes: Use worker processes instead of worker threads
+    :param dict config: Configuration to pass to each handler (optional)
+    :param int group_size: Maximum number of tests with the same master keys to schedule at once
+    :param key_types: Only run tests that reference a key of one of these types (optional)
+    :param str test_id_prefix: Only run tests whose ID starts with this prefix (optional)
+    :returns: Iterator of test results, in order of completion
+    """
+    config = config or {}
+    with ManifestReader(manifest_filename, "awses-decrypt") as reader:
+        result_cache_context = _result_cache_context(
+            handler_spec, config, reader.header, reader.keys
+        )
+        pool_class = multiprocessing.pool.Pool if use_processes else multiprocessing.pool.ThreadPool
+        with pool_class(
+            workers,
+            initializer=_init_worker,
+            initargs=(
+                handler_spec,
+                config,
+                reader.keys,
+                reader.directory,
+                result_cache_context,
+            ),
+        ) as pool:
+            tests = reader.tests(key_types=key_types, test_id_prefix=test_id_prefix)
+            for results in pool.imap_unordered(_run_test_group, group_tests(tests, group_size)):
+                for result in results:
+                    yield result
+
+
+def _percentile(ordered_values, fraction):
+    return ordered_values[min(len(ordered_values) - 1, int(len(ordered_values) * fraction))]
+
+
+def summarize_results(results, elapsed):
+    """Summarize test results.
+
+    Latencies only include tests that were run, not those answered by the result cache.
+
+    :param list results: Test results from :func:`run_tests`
+    :param float elapsed: Wall time in seconds taken to run all tests
+    """
+    latencies = sorted(
+        result["latency"]
+        for result in results
+        if "latency" in result and not result.get("cached", False)
+    )
+    passed = sum(1 for result in results if result["passed"])
+    # Tests with tampered vector descriptors decrypt several vectors each
+    vectors = sum(result.get("vectors", 1) for result in results)
+    summary = {
+        "tests": len(results),
+        "vectors": vectors,
+        "passed": passed,
+        "failed": len(results) - passed,
+        "cached": sum(1 for result in results if result.get("cached", False)),
+        "elapsed-seconds": elapsed,
+        "vectors-per-second": vectors / elapsed if elapsed else 0.0,
+    }
+    if latencies:
+        summary["latency-seconds"] = {
+            "mean": sum(latencies) / len(latencies),
+            "p50": _percentile(latencies, 0.5),
+            "p90": _percentile(latencies, 0.9),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1],
+        }
+    return summary
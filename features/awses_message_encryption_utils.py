@@ -13,9 +13,22 @@
 #
 # Only Python 3.6+ compatibility is guaranteed.
 
+import collections
 import itertools
 import functools
+import json
+import multiprocessing
+import os
 import uuid
+from urllib.parse import urlunparse
+from covering_array_utils import CoverageChecker, covering_array
+from manifest_utils import (
+    FrozenDict,
+    ManifestWriter,
+    canonical_digest,
+    canonical_json,
+    encode_test
+)
 
 # AWS Encryption SDK supported algorithm suites
 # https://docs.aws.amazon.com/encryption-sdk/latest/developer-guide/algorithms-reference.html
@@ -32,6 +45,8 @@ ALGORITHM_SUITES = (
     "0478",
     "0578"
 )
+# Algorithm suites that add an ECDSA signature to every message
+SIGNED_ALGORITHM_SUITES = ("0214", "0346", "0378", "0578")
 
 PLAINTEXTS = {"tiny": 10, "small": 10 * 1024}
 
@@ -43,16 +58,48 @@ FRAME_SIZES = (
     20480,  # frame size larger than plaintext size
 )
 
-EMPTY_ENCRYPTION_CONTEXT = {}
-NON_UNICODE_ENCRYPTION_CONTEXT = {"key1": "val1", "key2": "val2"}
-UNICODE_ENCRYPTION_CONTEXT = {
+# Performance scenarios exercise frame processing at scale, separately from the scenario matrix
+PERFORMANCE_PLAINTEXTS = {
+    "performance-1mib": 1024 * 1024,
+    "performance-64mib": 64 * 1024 * 1024,
+    "performance-1gib": 1024 * 1024 * 1024,
+}
+# Frame sizes for each performance plaintext; every plaintext is encrypted with a frame size
+# that produces over 100k frames, without the tiny frames that would bloat the larger messages
+PERFORMANCE_FRAME_SIZES = {
+    "performance-1mib": (
+        8,  # >100k frames
+        512,
+    ),
+    "performance-64mib": (
+        512,  # >100k frames
+        4096,
+    ),
+    "performance-1gib": (
+        512,  # >100k frames
+        4096,  # >100k frames
+    ),
+}
+PERFORMANCE_ALGORITHM_SUITES = (
+    "0478",  # Committing, unsigned
+    "0578",  # Committing, signed
+)
+# Baseline single-core rates from which to derive the expected throughput of performance scenarios
+PERFORMANCE_BULK_BYTES_PER_SECOND = 512 * 1024 * 1024
+PERFORMANCE_SIGNATURE_BYTES_PER_SECOND = 768 * 1024 * 1024
+PERFORMANCE_FRAME_SECONDS = 0.000002
+
+# Encryption contexts are shared by every test that uses them, so they are frozen
+EMPTY_ENCRYPTION_CONTEXT = FrozenDict()
+NON_UNICODE_ENCRYPTION_CONTEXT = FrozenDict({"key1": "val1", "key2": "val2"})
+UNICODE_ENCRYPTION_CONTEXT = FrozenDict({
     "key1": "val1",
     u"unicode_key_ловие": u"unicode_value_Предисл",
-}
-UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT = {
+})
+UNPRINTABLE_UNICODE_ENCRYPTION_CONTEXT = FrozenDict({
     "key1": "val1",
     b"\x01\x02\x03".decode("utf-8"): b"\x20\x22\x44".decode("utf-8"),
-}
+})
 ENCRYPTION_CONTEXTS = (
     EMPTY_ENCRYPTION_CONTEXT,
     NON_UNICODE_ENCRYPTION_CONTEXT,
@@ -74,46 +121,165 @@ RAW_RSA_BLACKHOLE_ARGUMENTS_OVERRIDE = {
     "padding-hash": "sha256",
 }
 
+# Namespace for test IDs derived from test descriptions
+TEST_ID_NAMESPACE = uuid.UUID("5f3c2a8e-7d0b-4c61-9a2e-0b8d1e6f4c37")
+
+# Number of distinct keys manifests for which to keep enumerated provider sets
+PROVIDER_SET_CACHE_SIZE = 8
+_PROVIDER_SET_CACHE = collections.OrderedDict()
+
+def _load_keys(keys_filename):
+    """Load a keys manifest and build the URI with which other manifests should reference it.
+
+    :param str keys_filename: Name of file containing the keys manifest
+    :returns: Parsed keys manifest and keys manifest URI
+    """
+    with open(keys_filename, "r") as keys_file:
+        keys = json.load(keys_file)
+
+    keys_path = "/".join(keys_filename.split(os.path.sep))
+    keys_uri = urlunparse(("file", keys_path, "", "", "", ""))
+    return keys, keys_uri
+
+
+def _load_profiled_keys(keys, profiler):
+    """Load a keys manifest, recording the time taken to read it and to enumerate its
+    provider sets as phases of their own.
+
+    :param keys: Name of file containing the keys manifest, or :class:`KeysManifest` that
+        is already loaded, in which case nothing is recorded
+    :param profiler: :class:`profile_utils.Profiler`, which may be disabled
+    :rtype: KeysManifest
+    """
+    if isinstance(keys, KeysManifest):
+        return keys
+    with profiler.phase("load-keys"):
+        keys = KeysManifest.load(keys)
+    if profiler.enabled:
+        # Provider sets are cached by keys manifest, so enumerating them up front moves their
+        # cost out of the phase that builds tests without changing the tests
+        with profiler.phase("enumerate-providers"):
+            _provider_sets(keys)
+    return keys
+
+
+class KeysManifest(object):
+    """Parsed keys manifest, indexed once by each key attribute that the generators filter on.
+
+    Index lookups preserve the order in which keys appear in the keys manifest.
+
+    :param dict keys: Parsed keys manifest
+    :param str uri: URI with which other manifests should reference the keys manifest (optional)
+    """
+
+    def __init__(self, keys, uri=None):
+        self.manifest = keys
+        self.uri = uri
+        self._digest = None
+        self._by_algorithm = collections.defaultdict(list)
+        self._by_type = collections.defaultdict(list)
+        self._by_encrypt = collections.defaultdict(list)
+        self._by_decrypt = collections.defaultdict(list)
+        for name, key in keys["keys"].items():
+            self._by_algorithm[key.get("algorithm", None)].append((name, key))
+            self._by_type[key["type"]].append((name, key))
+            self._by_encrypt[key.get("encrypt", None)].append((name, key))
+            self._by_decrypt[key.get("decrypt", None)].append((name, key))
+
+    @classmethod
+    def wrap(cls, keys):
+        """Index a parsed keys manifest, unless it is already indexed.
+
+        :param keys: Parsed keys manifest or :class:`KeysManifest`
+        :rtype: KeysManifest
+        """
+        if isinstance(keys, cls):
+            return keys
+        return cls(keys)
+
+    @classmethod
+    def load(cls, keys):
+        """Load and index a keys manifest, unless it is already loaded.
+
+        :param keys: Name of file containing the keys manifest, or :class:`KeysManifest`
+        :rtype: KeysManifest
+        """
+        if isinstance(keys, cls):
+            return keys
+        manifest, uri = _load_keys(keys)
+        return cls(manifest, uri)
+
+    def __getitem__(self, member):
+        return self.manifest[member]
+
+    @property
+    def digest(self):
+        """SHA-256 hex digest of the canonical serialization of the keys manifest contents."""
+        if self._digest is None:
+            self._digest = canonical_digest(self.manifest)
+        return self._digest
+
+    def keys_for_algorithm(self, algorithm_name):
+        """List ``(name, key)`` pairs for all keys with an algorithm.
+
+        :param str algorithm_name: Key algorithm name
+        """
+        return self._by_algorithm.get(algorithm_name, [])
+
+    def keys_for_type(self, type_name):
+        """List ``(name, key)`` pairs for all keys of a type.
+
+        :param str type_name: Key type name
+        """
+        return self._by_type.get(type_name, [])
+
+    def keys_for_encryptval(self, encrypt_value):
+        """List ``(name, key)`` pairs for all keys with an ``encrypt`` value.
+
+        :param boolean encrypt_value: True/False value of encrypt
+        """
+        return self._by_encrypt.get(encrypt_value, [])
+
+    def keys_for_decryptval(self, decrypt_value):
+        """List ``(name, key)`` pairs for all keys with a ``decrypt`` value.
+
+        :param boolean decrypt_value: True/False value of decrypt
+        """
+        return self._by_decrypt.get(decrypt_value, [])
+
+
 def _keys_for_algorithm(algorithm_name, keys):
     """Filter keys manifest keys by type.
 
     :param str algorithm_name: Key algorithm name for which to filter
-    :param dict keys: Parsed keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
     """
-    for name, key in keys["keys"].items():
-        if key.get("algorithm", None) == algorithm_name:
-            yield name, key
+    return iter(KeysManifest.wrap(keys).keys_for_algorithm(algorithm_name))
 
 
 def _keys_for_type(type_name, keys):
     """Filter keys manifest keys by type.
 
     :param str type_name: Key type name for which to filter
-    :param dict keys: Parsed keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
     """
-    for name, key in keys["keys"].items():
-        if key["type"] == type_name:
-            yield name, key
+    return iter(KeysManifest.wrap(keys).keys_for_type(type_name))
 
 def _keys_for_encryptval(encrypt_value, keys):
     """Filter keys manifest keys by type.
 
     :param boolean encrypt_value: True/False value for which to filter encrypt
-    :param dict keys: Parsed keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
     """
-    for name, key in keys["keys"].items():
-        if key["encrypt"] == encrypt_value:
-            yield name, key
+    return iter(KeysManifest.wrap(keys).keys_for_encryptval(encrypt_value))
 
 def _keys_for_decryptval(decrypt_value, keys):
     """Filter keys manifest keys by type.
 
     :param boolean encrypt_value: True/False value for which to filter decrypt
-    :param dict keys: Parsed keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
     """
-    for name, key in keys["keys"].items():
-        if key["decrypt"] == decrypt_value:
-            yield name, key
+    return iter(KeysManifest.wrap(keys).keys_for_decryptval(decrypt_value))
 
 def _split_on_decryptable(keys, filter_function, key_builder):
     """Filter keys manifest keys of specified type into two groups: those that can both encrypt
@@ -217,22 +383,384 @@ def _providers(keys):
     )
 
 
-def build_tests(keys):
+def _provider_sets(keys):
+    """Build all master key provider configurations to test, enumerating them only once
+    for each distinct keys manifest.
+
+    The result is cached by the content digest of the keys manifest. Master key
+    configurations are frozen and shared between all provider sets and tests that use them,
+    so callers must not modify them.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :returns: Tuple of master key configuration tuples
+    """
+    keys = KeysManifest.wrap(keys)
+    try:
+        return _PROVIDER_SET_CACHE[keys.digest]
+    except KeyError:
+        pass
+
+    frozen = {}
+
+    def _freeze(master_key):
+        # The same configuration object is reused across several provider sets; holding on to
+        # the original keeps its id from being reused while enumeration is in progress
+        if id(master_key) not in frozen:
+            frozen[id(master_key)] = (master_key, FrozenDict(master_key))
+        return frozen[id(master_key)][1]
+
+    provider_sets = tuple(
+        tuple(_freeze(master_key) for master_key in provider_set) for provider_set in _providers(keys)
+    )
+    _PROVIDER_SET_CACHE[keys.digest] = provider_sets
+    while len(_PROVIDER_SET_CACHE) > PROVIDER_SET_CACHE_SIZE:
+        _PROVIDER_SET_CACHE.popitem(last=False)
+    return provider_sets
+
+
+def _random_test_id(test):
+    """Build a random test ID.
+
+    :param dict test: Test description
+    """
+    return str(uuid.uuid4())
+
+
+def _deterministic_test_id(test):
+    """Build a test ID derived from the contents of a test description.
+
+    The same description always results in the same ID, so regenerated manifests are
+    reproducible and previously processed tests can be recognized by their ID alone.
+
+    :param dict test: Test description
+    """
+    return str(uuid.uuid5(TEST_ID_NAMESPACE, canonical_json(test)))
+
+
+TEST_ID_BUILDERS = {"random": _random_test_id, "deterministic": _deterministic_test_id}
+
+
+def _scenario_matrix():
+    """List every (algorithm suite, frame size, encryption context) combination to test,
+    in the order in which tests are generated.
+    """
+    return list(itertools.product(ALGORITHM_SUITES, FRAME_SIZES, ENCRYPTION_CONTEXTS))
+
+
+def _cell_test_descriptions(keys, cell, scenario_member=None):
+    """Build the test descriptions for every provider set in a single cell of the scenario matrix.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param tuple cell: Algorithm suite, frame size and encryption context
+    :param str scenario_member: Name of the member in which to nest each encryption scenario,
+        if the test description is not the encryption scenario itself (optional)
+    """
+    for provider_set in _provider_sets(keys):
+        yield _test_description(cell + (provider_set,), scenario_member)
+
+
+def _test_description(values, scenario_member=None):
+    """Build the test description for a single combination of scenario parameters.
+
+    :param tuple values: Algorithm suite, frame size, encryption context and provider set
+    :param str scenario_member: Name of the member in which to nest the encryption scenario,
+        if the test description is not the encryption scenario itself (optional)
+    """
+    algorithm, frame_size, ec, provider_set = values
+    test = {
+        "plaintext": "small",
+        "algorithm": algorithm,
+        "frame-size": frame_size,
+        "encryption-context": ec,
+        "master-keys": provider_set,
+    }
+    if scenario_member is not None:
+        test = {scenario_member: test}
+    return test
+
+
+def _test_key_kinds(test, keys):
+    """Identify the kinds of key used by a single test, from the algorithm or, for keys
+    without one, the type of each key in the keys manifest.
+
+    :param dict test: Encrypt or decrypt generation test description
+    :param keys: Parsed keys manifest or :class:`KeysManifest` that the test references
+    :returns: Sorted tuple of key kinds (``aes``, ``aws-kms``, ``rsa``)
+    """
+    scenario = test.get("encryption-scenario", test)
+    kinds = set()
+    for master_key in scenario["master-keys"]:
+        key = keys["keys"][master_key["key"]]
+        kinds.add(key.get("algorithm", key["type"]))
+    return tuple(sorted(kinds))
+
+
+def build_tests(keys, test_id_builder=_random_test_id):
     """Build all tests to define in manifest, building from current rules and provided keys manifest.
 
-    :param dict keys: Parsed keys manifest
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    """
+    keys = KeysManifest.wrap(keys)
+    for cell in _scenario_matrix():
+        for test in _cell_test_descriptions(keys, cell):
+            yield test_id_builder(test), test
+
+
+def _coverage_factors(keys):
+    """List the values of each scenario parameter that covering arrays combine:
+    algorithm suites, frame sizes, encryption contexts and provider sets.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    """
+    return (ALGORITHM_SUITES, FRAME_SIZES, ENCRYPTION_CONTEXTS, _provider_sets(keys))
+
+
+def _covering_test_descriptions(keys, strength=2, scenario_member=None):
+    """Build a subset of the scenario matrix test descriptions in which every combination of
+    values of any ``strength`` scenario parameters still appears in at least one test.
+
+    Pairwise coverage (``strength`` 2) needs roughly as many tests as the product of the two
+    largest parameters, rather than the product of all of them.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param int strength: Number of scenario parameters whose combinations must all be covered
+    :param str scenario_member: Name of the member in which to nest each encryption scenario,
+        if the test description is not the encryption scenario itself (optional)
+    """
+    factors = _coverage_factors(KeysManifest.wrap(keys))
+    for row in covering_array([len(values) for values in factors], strength):
+        yield _test_description(
+            tuple(values[index] for values, index in zip(factors, row)), scenario_member
+        )
+
+
+def build_covering_tests(keys, strength=2, test_id_builder=_random_test_id):
+    """Build a covering array of the tests built by :func:`build_tests`.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param int strength: Number of scenario parameters whose combinations must all be covered
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    """
+    for test in _covering_test_descriptions(keys, strength):
+        yield test_id_builder(test), test
+
+
+class CoverageValidator(object):
+    """Validate that a manifest covers every combination of values of any ``strength``
+    scenario parameters, in a single pass and without keeping the tests.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param int strength: Number of scenario parameters whose combinations must all be covered
+    """
+
+    def __init__(self, keys, strength=2):
+        factors = _coverage_factors(KeysManifest.wrap(keys))
+        self._indexes = [
+            {canonical_json(value): index for index, value in enumerate(values)}
+            for values in factors
+        ]
+        self._checker = CoverageChecker([len(values) for values in factors], strength)
+
+    def add(self, test):
+        """Record the combinations covered by a single test.
+
+        :param dict test: Encrypt or decrypt generation test description
+        """
+        scenario = test.get("encryption-scenario", test)
+        values = (
+            scenario["algorithm"],
+            scenario["frame-size"],
+            scenario["encryption-context"],
+            scenario["master-keys"],
+        )
+        self._checker.add(
+            [indexes.get(canonical_json(value)) for indexes, value in zip(self._indexes, values)]
+        )
+
+    def observe(self, tests):
+        """Record tests while passing them through unchanged.
+
+        :param tests: Iterable of ``(test_id, test)`` pairs
+        """
+        for test_id, test in tests:
+            self.add(test)
+            yield test_id, test
+
+    def check(self):
+        """Raise an error if the tests recorded so far leave any combination uncovered."""
+        if self._checker.missing:
+            raise ValueError(
+                "Incomplete {strength}-wise coverage: {missing} of {required} "
+                "combinations of scenario parameters are not covered".format(
+                    strength=self._checker.strength,
+                    missing=self._checker.missing,
+                    required=self._checker.required,
+                )
+            )
+
+
+def _performance_metadata(algorithm, frame_size, plaintext_size):
+    """Describe the expected scale and throughput of a performance scenario.
+
+    :param str algorithm: Algorithm suite ID
+    :param int frame_size: Frame size in bytes
+    :param int plaintext_size: Plaintext size in bytes
+    """
+    # Every framed message ends with a final frame, which may be empty
+    frame_count = plaintext_size // frame_size + 1
+    seconds = plaintext_size / PERFORMANCE_BULK_BYTES_PER_SECOND + frame_count * PERFORMANCE_FRAME_SECONDS
+    if algorithm in SIGNED_ALGORITHM_SUITES:
+        seconds += plaintext_size / PERFORMANCE_SIGNATURE_BYTES_PER_SECOND
+    return {
+        "frame-count": frame_count,
+        "expected-bytes-per-second": int(plaintext_size / seconds),
+    }
+
+
+def build_performance_tests(keys, test_id_builder=_random_test_id, scenario_member=None):
+    """Build the performance scenario family: large plaintexts crossed with small frame sizes,
+    all encrypted with a single raw AES master key.
+
+    Each test carries a ``performance`` member with the number of frames in the message and
+    the expected encrypt or decrypt throughput, so that consumers can detect throughput regressions.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param callable test_id_builder: Function that returns the ID to use for a test description
+    :param str scenario_member: Name of the member in which to nest each encryption scenario,
+        if the test is not the encryption scenario itself (optional)
+    :raises ValueError: if the keys manifest has no AES key
+    """
+    keys = KeysManifest.wrap(keys)
+    provider_set = next(_raw_aes_providers(keys), None)
+    if provider_set is None:
+        raise ValueError("Performance scenarios require an AES key in the keys manifest")
+    for algorithm in PERFORMANCE_ALGORITHM_SUITES:
+        for plaintext, plaintext_size in PERFORMANCE_PLAINTEXTS.items():
+            for frame_size in PERFORMANCE_FRAME_SIZES[plaintext]:
+                scenario = {
+                    "plaintext": plaintext,
+                    "algorithm": algorithm,
+                    "frame-size": frame_size,
+                    "encryption-context": EMPTY_ENCRYPTION_CONTEXT,
+                    "master-keys": provider_set,
+                }
+                if scenario_member is None:
+                    test = scenario
+                else:
+                    test = {scenario_member: scenario}
+                test["performance"] = _performance_metadata(algorithm, frame_size, plaintext_size)
+                yield test_id_builder(test), test
+
+
+_GENERATION_WORKER_STATE = {}
+
+
+def _init_generation_worker(keys, scenario_member, test_id_builder, indent):
+    """Prepare a worker process to build and serialize cells of the scenario matrix."""
+    _GENERATION_WORKER_STATE.update(
+        keys=KeysManifest(keys),
+        scenario_member=scenario_member,
+        test_id_builder=test_id_builder,
+        indent=indent,
+    )
+
+
+def _encode_cell_tests(cell):
+    """Build and serialize the tests for a single cell of the scenario matrix in a worker process.
+
+    :param tuple cell: Algorithm suite, frame size and encryption context
+    :returns: List of test ID, serialized test description and key kinds for each test
+    """
+    state = _GENERATION_WORKER_STATE
+    encoded = []
+    for test in _cell_test_descriptions(state["keys"], cell, state["scenario_member"]):
+        encoded.append(
+            (
+                state["test_id_builder"](test),
+                encode_test(test, state["indent"]),
+                _test_key_kinds(test, state["keys"]),
+            )
+        )
+    return encoded
+
+
+def encode_tests_in_parallel(
+    keys, jobs, indent=None, test_id_builder=_random_test_id, scenario_member=None, ordered=False
+):
+    """Build and serialize the tests for the whole scenario matrix on a pool of worker processes.
+
+    Each worker builds and serializes whole cells of the scenario matrix. By default, cells are
+    yielded as soon as any worker finishes them. If ``ordered`` is set, cells are yielded in the
+    same order in which :func:`build_tests` generates them, so that output is stable between runs
+    that also use deterministic test IDs.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param int jobs: Number of worker processes
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description;
+        must be a module-level function so that it can be sent to worker processes
+    :param str scenario_member: Name of the member in which to nest each encryption scenario,
+        if the test description is not the encryption scenario itself (optional)
+    :param bool ordered: Yield tests in a stable order
+    :returns: Iterator of test ID, serialized test description (see
+        :func:`manifest_utils.encode_test`) and key kinds (see :func:`_test_key_kinds`)
+    """
+    keys = KeysManifest.wrap(keys)
+    with multiprocessing.Pool(
+        jobs,
+        initializer=_init_generation_worker,
+        initargs=(keys.manifest, scenario_member, test_id_builder, indent),
+    ) as pool:
+        pool_map = pool.imap if ordered else pool.imap_unordered
+        for encoded in pool_map(_encode_cell_tests, _scenario_matrix()):
+            for encoded_test in encoded:
+                yield encoded_test
+
+
+def write_tests_in_parallel(
+    stream,
+    manifest,
+    keys,
+    jobs,
+    indent=None,
+    test_id_builder=_random_test_id,
+    scenario_member=None,
+    ordered=False,
+    additional_tests=(),
+    validator=None,
+):
+    """Write a manifest to a stream, building and serializing the scenario matrix on a pool of
+    worker processes with :func:`encode_tests_in_parallel`, followed by any tests that are not
+    part of the scenario matrix, which are built in this process.
+
+    :param stream: Text stream to which to write the manifest
+    :param dict manifest: Manifest members to write before the ``tests`` member
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param int jobs: Number of worker processes
+    :param int indent: Optional indent to use for human-readable JSON
+    :param callable test_id_builder: Function that returns the ID to use for a test description;
+        must be a module-level function so that it can be sent to worker processes
+    :param str scenario_member: Name of the member in which to nest each encryption scenario,
+        if the test description is not the encryption scenario itself (optional)
+    :param bool ordered: Write tests in a stable order
+    :param additional_tests: Test descriptions to write after the scenario matrix
+    :param validator: Validator with ``add``, ``add_key_kinds`` and ``check`` methods with
+        which to check that the manifest is complete (optional)
+    :returns: Number of tests written
     """
-    for algorithm in ALGORITHM_SUITES:
-        for frame_size in FRAME_SIZES:
-            for ec in ENCRYPTION_CONTEXTS:
-                for provider_set in _providers(keys):
-                    yield (
-                        str(uuid.uuid4()),
-                        {
-                            "plaintext": "small",
-                            "algorithm": algorithm,
-                            "frame-size": frame_size,
-                            "encryption-context": ec,
-                            "master-keys": provider_set,
-                        },
-                    )
+    with ManifestWriter(stream, manifest, indent) as writer:
+        for test_id, encoded_test, key_kinds in encode_tests_in_parallel(
+            keys, jobs, indent, test_id_builder, scenario_member, ordered
+        ):
+            if validator is not None:
+                validator.add_key_kinds(key_kinds)
+            writer.add_encoded(test_id, encoded_test)
+
+        for test in additional_tests:
+            if validator is not None:
+                validator.add(test)
+            writer.add(test_id_builder(test), test)
+    if validator is not None:
+        validator.check()
+    return writer.test_count
@@ -0,0 +1,159 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import functools
+from awses_message_decryption_utils import DecryptHandler
+
+try:
+    import aws_encryption_sdk
+    import boto3
+    import botocore.config
+    from aws_encryption_sdk.identifiers import (
+        CommitmentPolicy,
+        EncryptionKeyType,
+        WrappingAlgorithm,
+    )
+    from aws_encryption_sdk.internal.crypto.wrapping_keys import WrappingKey
+    from aws_encryption_sdk.key_providers.kms import KMSMasterKey
+    from aws_encryption_sdk.key_providers.raw import RawMasterKey
+except ImportError as error:
+    raise ImportError(
+        "The AWS Encryption SDK for Python handlers require "
+        "the aws-encryption-sdk and boto3 packages: {}".format(error)
+    )
+
+_AES_WRAPPING_ALGORITHMS = {
+    128: WrappingAlgorithm.AES_128_GCM_IV12_TAG16_NO_PADDING,
+    192: WrappingAlgorithm.AES_192_GCM_IV12_TAG16_NO_PADDING,
+    256: WrappingAlgorithm.AES_256_GCM_IV12_TAG16_NO_PADDING,
+}
+_RSA_WRAPPING_ALGORITHMS = {
+    ("pkcs1", None): WrappingAlgorithm.RSA_PKCS1,
+    ("oaep-mgf1", "sha1"): WrappingAlgorithm.RSA_OAEP_SHA1_MGF1,
+    ("oaep-mgf1", "sha256"): WrappingAlgorithm.RSA_OAEP_SHA256_MGF1,
+    ("oaep-mgf1", "sha384"): WrappingAlgorithm.RSA_OAEP_SHA384_MGF1,
+    ("oaep-mgf1", "sha512"): WrappingAlgorithm.RSA_OAEP_SHA512_MGF1,
+}
+_RSA_KEY_TYPES = {"private": EncryptionKeyType.PRIVATE, "public": EncryptionKeyType.PUBLIC}
+# Placeholder credentials with which to sign requests to a KMS endpoint such as a local stand-in
+_STAND_IN_CREDENTIALS = {
+    "aws_access_key_id": "stand-in-access-key-id",
+    "aws_secret_access_key": "stand-in-secret-access-key",
+}
+
+
+class _ParsedWrappingKey(WrappingKey):
+    """Wrapping key around an RSA key that has already been parsed.
+
+    :class:`WrappingKey` only accepts PEM encoded RSA keys, which it parses every time.
+    """
+
+    def __init__(self, wrapping_algorithm, parsed_key, wrapping_key_type):
+        self.wrapping_algorithm = wrapping_algorithm
+        self.wrapping_key_type = wrapping_key_type
+        self._wrapping_key = parsed_key
+
+
+class _MasterKeyLoader(object):
+    """Loads master keys for the AWS Encryption SDK for Python, shared by its encrypt and
+    decrypt handlers.
+
+    Key material is parsed once per process through the key material cache; each message
+    builds fresh master key objects around the wrapping keys, because combining master keys
+    modifies them. AWS KMS requests are sent to the ``kms-endpoint`` from the configuration,
+    if set, signed with placeholder credentials if no AWS credentials are configured.
+    """
+
+    def __init__(self, config, key_material=None):
+        super(_MasterKeyLoader, self).__init__(config, key_material)
+        self._kms_clients = {}
+
+    def _kms_client(self, region):
+        if region not in self._kms_clients:
+            session = boto3.session.Session()
+            endpoint = self.config.get("kms-endpoint", None)
+            credentials = {}
+            # A local stand-in ignores request signatures, but botocore refuses to send
+            # unsigned requests, so sign them with placeholders when no credentials are set up
+            if endpoint is not None and session.get_credentials() is None:
+                credentials = _STAND_IN_CREDENTIALS
+            self._kms_clients[region] = session.client(
+                "kms",
+                region_name=region,
+                endpoint_url=endpoint,
+                config=botocore.config.Config(tcp_keepalive=True),
+                **credentials
+            )
+        return self._kms_clients[region]
+
+    def client(self):
+        return {"name": "aws/aws-encryption-sdk-python", "version": aws_encryption_sdk.__version__}
+
+    def load_master_key(self, master_key, key):
+        if master_key["type"] == "aws-kms":
+            region = key["key-id"].split(":")[3]
+            return functools.partial(
+                KMSMasterKey, key_id=key["key-id"], client=self._kms_client(region)
+            )
+
+        if master_key["encryption-algorithm"] == "aes":
+            wrapping_key = WrappingKey(
+                wrapping_algorithm=_AES_WRAPPING_ALGORITHMS[key["bits"]],
+                wrapping_key=self.key_material.load(key),
+                wrapping_key_type=EncryptionKeyType.SYMMETRIC,
+            )
+        else:
+            padding = (master_key["padding-algorithm"], master_key.get("padding-hash", None))
+            wrapping_key = _ParsedWrappingKey(
+                wrapping_algorithm=_RSA_WRAPPING_ALGORITHMS[padding],
+                parsed_key=self.key_material.load(key),
+                wrapping_key_type=_RSA_KEY_TYPES[key["type"]],
+            )
+        return functools.partial(
+            RawMasterKey,
+            provider_id=master_key["provider-id"],
+            key_id=key["key-id"].encode("utf-8"),
+            wrapping_key=wrapping_key,
+        )
+
+    @staticmethod
+    def _key_provider(master_keys):
+        """Combine freshly built master keys into one master key provider."""
+        key_provider = master_keys[0]()
+        for build_master_key in master_keys[1:]:
+            key_provider.add_master_key_provider(build_master_key())
+        return key_provider
+
+
+class AwsEncryptionSdkDecryptHandler(_MasterKeyLoader, DecryptHandler):
+    """Decrypt handler for the AWS Encryption SDK for Python."""
+
+    def __init__(self, config, key_material=None):
+        super(AwsEncryptionSdkDecryptHandler, self).__init__(config, key_material)
+        self._client = aws_encryption_sdk.EncryptionSDKClient(
+            commitment_policy=CommitmentPolicy.REQUIRE_ENCRYPT_ALLOW_DECRYPT
+        )
+
+    def decrypt(self, ciphertext, master_keys, decryption_method=None):
+        key_provider = self._key_provider(master_keys)
+
+        if decryption_method == "streaming-unsigned-only":
+            with self._client.stream(
+                mode="decrypt-unsigned", source=ciphertext, key_provider=key_provider
+            ) as decryptor:
+                return b"".join(decryptor)
+
+        plaintext, _header = self._client.decrypt(source=ciphertext, key_provider=key_provider)
+        return plaintext
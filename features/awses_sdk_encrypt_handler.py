@@ -0,0 +1,142 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import copy
+from awses_message_decryption_generation_utils import EncryptHandler
+from awses_sdk_decrypt_handler import _MasterKeyLoader
+
+try:
+    import aws_encryption_sdk
+    from aws_encryption_sdk.identifiers import AlgorithmSuite, CommitmentPolicy
+    from aws_encryption_sdk.materials_managers.base import CryptoMaterialsManager
+    from aws_encryption_sdk.materials_managers.default import DefaultCryptoMaterialsManager
+except ImportError as error:
+    raise ImportError(
+        "The AWS Encryption SDK for Python handlers require "
+        "the aws-encryption-sdk and boto3 packages: {}".format(error)
+    )
+
+# Signing algorithm suite with which half-signed messages are encrypted, for each unsigned one
+_SIGNING_ALGORITHMS = {
+    AlgorithmSuite.AES_256_GCM_HKDF_SHA512_COMMIT_KEY: (
+        AlgorithmSuite.AES_256_GCM_HKDF_SHA512_COMMIT_KEY_ECDSA_P384
+    ),
+}
+
+
+def _algorithm(scenario):
+    return AlgorithmSuite.get_by_id(int(scenario["algorithm"], 16))
+
+
+class _HalfSigningMaterialsManager(CryptoMaterialsManager):
+    """Gets materials for the signing variant of an unsigned algorithm suite, then drops the
+    signing key, so that the message header carries a public key but the message is not signed.
+    """
+
+    def __init__(self, key_provider):
+        self._wrapped = DefaultCryptoMaterialsManager(key_provider)
+
+    def get_encryption_materials(self, request):
+        signing_request = copy.copy(request)
+        signing_request.algorithm = _SIGNING_ALGORITHMS[request.algorithm]
+        materials = self._wrapped.get_encryption_materials(signing_request)
+        materials.algorithm = request.algorithm
+        materials.signing_key = None
+        return materials
+
+    def decrypt_materials(self, request):
+        return self._wrapped.decrypt_materials(request)
+
+
+class _ProviderInfoChangingMaterialsManager(CryptoMaterialsManager):
+    """Replaces the provider info of every encrypted data key with ``provider_info``."""
+
+    def __init__(self, key_provider, provider_info):
+        self._wrapped = DefaultCryptoMaterialsManager(key_provider)
+        self._provider_info = provider_info.encode("utf-8")
+
+    def get_encryption_materials(self, request):
+        materials = self._wrapped.get_encryption_materials(request)
+        for encrypted_data_key in materials.encrypted_data_keys:
+            encrypted_data_key.key_provider.key_info = self._provider_info
+        return materials
+
+    def decrypt_materials(self, request):
+        return self._wrapped.decrypt_materials(request)
+
+
+class AwsEncryptionSdkEncryptHandler(_MasterKeyLoader, EncryptHandler):
+    """Encrypt handler for the AWS Encryption SDK for Python.
+
+    Supports the ``half-sign`` tampering method with committing algorithm suites, and the
+    ``change-edk-provider-info`` tampering method, which produces one message for each
+    replacement provider info. AWS KMS master keys are loaded as by the decrypt handler, so
+    messages can be encrypted against the ``kms-endpoint`` of a local stand-in without AWS
+    credentials.
+    """
+
+    def __init__(self, config, key_material=None):
+        super(AwsEncryptionSdkEncryptHandler, self).__init__(config, key_material)
+        # Only a client that forbids key commitment on encrypt can encrypt with
+        # non-committing algorithm suites
+        self._committing_client = aws_encryption_sdk.EncryptionSDKClient(
+            commitment_policy=CommitmentPolicy.REQUIRE_ENCRYPT_REQUIRE_DECRYPT
+        )
+        self._non_committing_client = aws_encryption_sdk.EncryptionSDKClient(
+            commitment_policy=CommitmentPolicy.FORBID_ENCRYPT_ALLOW_DECRYPT
+        )
+
+    def _encrypt(self, plaintext, scenario, **kwargs):
+        algorithm = _algorithm(scenario)
+        if algorithm.is_committing():
+            client = self._committing_client
+        else:
+            client = self._non_committing_client
+        ciphertext, _header = client.encrypt(
+            source=plaintext,
+            algorithm=algorithm,
+            frame_length=scenario["frame-size"],
+            encryption_context=dict(scenario["encryption-context"]),
+            **kwargs
+        )
+        return ciphertext
+
+    def encrypt(self, plaintext, master_keys, scenario):
+        return self._encrypt(plaintext, scenario, key_provider=self._key_provider(master_keys))
+
+    def tamper(self, plaintext, master_keys, scenario, tampering):
+        if tampering == "half-sign":
+            if _algorithm(scenario) not in _SIGNING_ALGORITHMS:
+                raise NotImplementedError(
+                    "half-sign is not supported with algorithm suite {}".format(
+                        scenario["algorithm"]
+                    )
+                )
+            materials_manager = _HalfSigningMaterialsManager(self._key_provider(master_keys))
+            return [self._encrypt(plaintext, scenario, materials_manager=materials_manager)]
+
+        if isinstance(tampering, dict) and list(tampering) == ["change-edk-provider-info"]:
+            return [
+                self._encrypt(
+                    plaintext,
+                    scenario,
+                    materials_manager=_ProviderInfoChangingMaterialsManager(
+                        self._key_provider(master_keys), provider_info
+                    ),
+                )
+                for provider_info in tampering["change-edk-provider-info"]
+            ]
+
+        raise NotImplementedError
@@ -0,0 +1,247 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import array
+import json
+import struct
+import sys
+import uuid
+
+MAGIC = b"AWSTVC\x00\x01"
+
+# Test members whose own members are interned individually
+_NESTED_MEMBERS = ("encryption-scenario",)
+
+_LENGTH = struct.Struct("<I")
+
+
+def is_compact(stream):
+    """Determine whether a binary stream contains a compact manifest, without consuming it.
+
+    :param stream: Seekable binary stream
+    """
+    position = stream.tell()
+    magic = stream.read(len(MAGIC))
+    stream.seek(position)
+    return magic == MAGIC
+
+
+def _is_uuid(test_id):
+    try:
+        return str(uuid.UUID(test_id)) == test_id
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class CompactManifestWriter(object):
+    """Encode a manifest in the compact binary form, one test at a time.
+
+    Every distinct test member value, such as a list of master keys, an encryption context
+    or an algorithm suite ID, is stored once in a table, as is every distinct set of test
+    members. Members of ``encryption-scenario`` are interned individually. Each test is
+    then a set index followed by one value index per member. Decoding reproduces the JSON
+    manifest exactly, including member order.
+
+    The output is the magic bytes, a length-prefixed JSON header with the other manifest
+    members and the tables, the test IDs (16 bytes each if every ID is a UUID, otherwise
+    listed in the header) and finally the test indexes as little-endian 32-bit integers.
+
+    Only the interned tables and the integer encoding of each test are held in memory;
+    the encoding is written to the stream when the writer is closed.
+
+    :param stream: Binary stream to which to write the manifest
+    :param dict manifest: Manifest members other than ``tests``
+    """
+
+    def __init__(self, stream, manifest):
+        self._stream = stream
+        self._manifest = manifest
+        self._values = []
+        self._value_indexes = {}
+        self._shapes = []
+        self._shape_indexes = {}
+        self._test_ids = []
+        self._indexes = array.array("I")
+        self.test_count = 0
+        self._closed = False
+
+    def _intern_value(self, value):
+        encoded = json.dumps(value)
+        index = self._value_indexes.get(encoded)
+        if index is None:
+            index = self._value_indexes[encoded] = len(self._values)
+            self._values.append(value)
+        return index
+
+    def _intern_shape(self, shape):
+        encoded = json.dumps(shape)
+        index = self._shape_indexes.get(encoded)
+        if index is None:
+            index = self._shape_indexes[encoded] = len(self._shapes)
+            self._shapes.append(shape)
+        return index
+
+    def add(self, test_id, test):
+        """Encode a single test.
+
+        :param str test_id: Test ID
+        :param dict test: Test description
+        """
+        shape = []
+        indexes = []
+        for name, value in test.items():
+            if name in _NESTED_MEMBERS and isinstance(value, dict):
+                shape.append([name, list(value)])
+                indexes.extend(self._intern_value(member) for member in value.values())
+            else:
+                shape.append(name)
+                indexes.append(self._intern_value(value))
+        self._indexes.append(self._intern_shape(shape))
+        self._indexes.extend(indexes)
+        self._test_ids.append(test_id)
+        self.test_count += 1
+
+    def close(self):
+        """Write the encoded manifest. Does not close the underlying stream."""
+        if self._closed:
+            return
+        uuid_test_ids = all(_is_uuid(test_id) for test_id in self._test_ids)
+        header = {
+            "manifest": {
+                name: value for name, value in self._manifest.items() if name != "tests"
+            },
+            "values": self._values,
+            "shapes": self._shapes,
+            "test-count": self.test_count,
+            "uuid-test-ids": uuid_test_ids,
+        }
+        header["manifest"]["tests"] = None
+        if not uuid_test_ids:
+            header["test-ids"] = self._test_ids
+        encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+        self._stream.write(MAGIC)
+        self._stream.write(_LENGTH.pack(len(encoded_header)))
+        self._stream.write(encoded_header)
+        if uuid_test_ids:
+            self._stream.write(b"".join(uuid.UUID(test_id).bytes for test_id in self._test_ids))
+        self._stream.write(_little_endian(self._indexes).tobytes())
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def write_compact_manifest(stream, manifest, tests):
+    """Write a manifest in the compact binary form, consuming tests one at a time.
+
+    :param stream: Binary stream to which to write the manifest
+    :param dict manifest: Manifest members other than ``tests``
+    :param tests: Iterable of ``(test_id, test)`` pairs
+    :returns: Number of tests written
+    :rtype: int
+    """
+    with CompactManifestWriter(stream, manifest) as writer:
+        for test_id, test in tests:
+            writer.add(test_id, test)
+    return writer.test_count
+
+
+def _read_exactly(stream, length):
+    data = stream.read(length)
+    if len(data) != length:
+        raise ValueError("Compact manifest is truncated")
+    return data
+
+
+def iter_compact_tests(stream):
+    """Read a compact manifest, decoding tests one at a time.
+
+    Decoded tests share member values that are equal, so they must be copied before
+    they are modified.
+
+    :param stream: Binary stream containing a compact manifest
+    :returns: Manifest members other than ``tests``, and an iterator of ``(test_id, test)``
+    :raises ValueError: if the stream does not contain a compact manifest
+    """
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Stream does not contain a compact manifest")
+    (header_length,) = _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))
+    header = json.loads(_read_exactly(stream, header_length).decode("utf-8"))
+    test_count = header["test-count"]
+
+    if header["uuid-test-ids"]:
+        hex_ids = _read_exactly(stream, 16 * test_count).hex()
+        test_ids = [
+            "{}-{}-{}-{}-{}".format(
+                hex_ids[offset:offset + 8],
+                hex_ids[offset + 8:offset + 12],
+                hex_ids[offset + 12:offset + 16],
+                hex_ids[offset + 16:offset + 20],
+                hex_ids[offset + 20:offset + 32],
+            )
+            for offset in range(0, len(hex_ids), 32)
+        ]
+    else:
+        test_ids = header["test-ids"]
+    indexes = array.array("I")
+    indexes.frombytes(stream.read())
+    indexes = _little_endian(indexes)
+
+    values = header["values"]
+    shapes = header["shapes"]
+
+    def _tests():
+        position = 0
+        for test_id in test_ids:
+            shape = shapes[indexes[position]]
+            position += 1
+            test = {}
+            for member in shape:
+                if isinstance(member, list):
+                    name, nested_names = member
+                    test[name] = {
+                        nested_name: values[indexes[position + offset]]
+                        for offset, nested_name in enumerate(nested_names)
+                    }
+                    position += len(nested_names)
+                else:
+                    test[member] = values[indexes[position]]
+                    position += 1
+            yield test_id, test
+
+    return header["manifest"], _tests()
+
+
+def load_compact_manifest(stream):
+    """Read a compact manifest in full.
+
+    :param stream: Binary stream containing a compact manifest
+    :returns: Manifest in the same form as the equivalent parsed JSON manifest
+    """
+    manifest, tests = iter_compact_tests(stream)
+    manifest["tests"] = dict(tests)
+    return manifest
@@ -0,0 +1,179 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import collections
+import json
+import mmap
+import os
+import threading
+from urllib.parse import urldefrag
+from manifest_utils import uri_to_path
+
+# Suffix of the file that lists the named ranges in a container
+INDEX_SUFFIX = ".index.json"
+
+
+def container_uri(relative_path, offset, length):
+    """Build a URI that identifies a range of bytes in a container.
+
+    :param str relative_path: Path of the container relative to the referencing manifest
+    :param int offset: Offset of the first byte
+    :param int length: Number of bytes
+    """
+    return "file://{path}#{offset},{length}".format(
+        path=relative_path, offset=offset, length=length
+    )
+
+
+def parse_range(uri):
+    """Split a URI into the URI of the file it identifies and the byte range that it selects.
+
+    :param str uri: URI, optionally with an ``#offset,length`` fragment
+    :returns: URI without the fragment, and ``(offset, length)`` or None for the whole file
+    :raises ValueError: if the fragment is not a byte range
+    """
+    file_uri, fragment = urldefrag(uri)
+    if not fragment:
+        return file_uri, None
+    try:
+        offset, length = (int(value) for value in fragment.split(","))
+    except ValueError:
+        raise ValueError("URI fragment is not a byte range: \"{}\"".format(uri))
+    if offset < 0 or length < 0:
+        raise ValueError("URI fragment is not a byte range: \"{}\"".format(uri))
+    return file_uri, (offset, length)
+
+
+class ContainerWriter(object):
+    """Append resources, such as ciphertexts and plaintexts, to a single container file.
+
+    Each resource is identified by a :func:`container_uri` that selects its byte range.
+    Existing content is never rewritten, so a container can be extended by later runs.
+    If a resource name is given, its range is also listed in the index file next to the
+    container when the writer is closed.
+
+    :param str filename: Name of the container file
+    :param str relative_path: Path of the container relative to the manifests that will
+        reference it (default: the base name of the container)
+    """
+
+    def __init__(self, filename, relative_path=None):
+        self._filename = filename
+        self._relative_path = (
+            relative_path if relative_path is not None else os.path.basename(filename)
+        )
+        self._file = open(filename, "ab")
+        self._offset = self._file.seek(0, os.SEEK_END)
+        self._index_filename = filename + INDEX_SUFFIX
+        try:
+            with open(self._index_filename, "r") as index_file:
+                self.index = json.load(index_file, object_pairs_hook=collections.OrderedDict)
+        except FileNotFoundError:
+            self.index = collections.OrderedDict()
+
+    def add(self, data, name=None):
+        """Append a resource.
+
+        :param data: Resource contents, as a bytes-like object or an iterable of bytes-like parts
+        :param str name: Name under which to list the resource in the index (optional)
+        :returns: URI that identifies the resource
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = (data,)
+        offset = self._offset
+        for part in data:
+            self._file.write(part)
+            self._offset += len(part)
+        if name is not None:
+            self.index[name] = [offset, self._offset - offset]
+        return container_uri(self._relative_path, offset, self._offset - offset)
+
+    def close(self):
+        """Flush the container and write its index."""
+        if self._file.closed:
+            return
+        self._file.close()
+        with open(self._index_filename, "w") as index_file:
+            json.dump(self.index, index_file, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ContainerReader(object):
+    """Read resources identified by URIs, mapping each container file into memory once.
+
+    URIs with an ``#offset,length`` fragment are read from the mapped container without
+    copying. URIs without a fragment are read from their file in full. A reader may be
+    shared by several threads.
+
+    :param str base_directory: Directory that contains the referencing manifest
+    """
+
+    def __init__(self, base_directory):
+        self._base_directory = base_directory
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _map(self, path):
+        try:
+            return self._maps[path]
+        except KeyError:
+            pass
+        with self._lock:
+            if path not in self._maps:
+                with open(path, "rb") as container_file:
+                    self._maps[path] = mmap.mmap(
+                        container_file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+            return self._maps[path]
+
+    def read(self, uri):
+        """Read a resource.
+
+        :param str uri: URI that identifies the resource
+        :returns: Resource contents
+        :rtype: bytes or memoryview
+        :raises ValueError: if the byte range extends past the end of the container
+        """
+        file_uri, byte_range = parse_range(uri)
+        path = uri_to_path(self._base_directory, file_uri)
+        if byte_range is None:
+            with open(path, "rb") as resource:
+                return resource.read()
+
+        offset, length = byte_range
+        if length == 0:
+            return b""
+        container = self._map(path)
+        if offset + length > len(container):
+            raise ValueError("Byte range extends past the end of the container: \"{}\"".format(uri))
+        return memoryview(container)[offset:offset + length]
+
+    def close(self):
+        """Unmap all containers. Memory views returned by :meth:`read` must be released first."""
+        with self._lock:
+            for container in self._maps.values():
+                container.close()
+            self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,271 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import json
+from awses_message_encryption_utils import SIGNED_ALGORITHM_SUITES, KeysManifest
+from manifest_utils import write_report
+from tampering_utils import BULK_TAMPERINGS, tampered_vector_count
+
+# Approximate bytes added to a message by its header, framing and authentication tags
+MESSAGE_OVERHEAD_BYTES = 200
+# Approximate bytes added to a message by each encrypted data key
+ENCRYPTED_DATA_KEY_BYTES = {"aws-kms": 200, "aes": 50, "rsa": 550}
+# Approximate bytes added to a message by the trailing signature of signed suites
+SIGNATURE_BYTES = 105
+
+# Estimated single-core milliseconds for one encrypt plus one decrypt of each operation
+DEFAULT_COST_WEIGHTS = {
+    # Fixed cost of building and parsing any message
+    "message": 0.05,
+    # Bulk encryption and decryption of each KiB of plaintext
+    "kib": 0.002,
+    # Wrapping and unwrapping a data key with a raw AES key
+    "aes": 0.01,
+    # Wrapping and unwrapping a data key with a 2048-bit raw RSA key;
+    # private key operations scale with roughly the cube of the modulus size
+    "rsa-2048": 1.5,
+    # Round trips to AWS KMS to generate or encrypt and to decrypt a data key;
+    # this is network latency, not local processing
+    "aws-kms": 60.0,
+    # Signing and verifying a message with ECDSA
+    "signature": 1.5,
+}
+
+
+# Number of digits after the decimal point to which estimated seconds are rounded
+ESTIMATE_PRECISION = 6
+
+
+def load_cost_weights(filename):
+    """Load cost weights, such as those measured by the calibration benchmark.
+
+    :param str filename: Name of JSON file mapping weight names to milliseconds
+    :raises ValueError: if the file names a weight that is not in :data:`DEFAULT_COST_WEIGHTS`
+    """
+    with open(filename, "r") as weights_file:
+        weights = json.load(weights_file)
+    unknown = sorted(set(weights) - set(DEFAULT_COST_WEIGHTS))
+    if unknown:
+        raise ValueError("Unknown cost weights: {}".format(", ".join(unknown)))
+    return weights
+
+
+class CostModel(object):
+    """Estimate the relative cost of processing encrypt (0003) or decrypt generation (0006) tests.
+
+    :param keys: Parsed keys manifest or :class:`KeysManifest`
+    :param dict plaintexts: Map of plaintext names to size in bytes
+    :param dict weights: Cost weights to use instead of :data:`DEFAULT_COST_WEIGHTS` (optional)
+    """
+
+    def __init__(self, keys, plaintexts, weights=None):
+        self._keys = KeysManifest.wrap(keys)
+        self._plaintexts = plaintexts
+        self.weights = dict(DEFAULT_COST_WEIGHTS)
+        if weights is not None:
+            self.weights.update(weights)
+
+    def master_key_kind(self, master_key):
+        """Identify the kind of key used by a master key description.
+
+        :param dict master_key: Master key description
+        :returns: ``aws-kms``, ``aes`` or ``rsa``
+        """
+        if master_key["type"] == "aws-kms":
+            return "aws-kms"
+        return master_key["encryption-algorithm"]
+
+    def master_key_cost(self, master_key):
+        """Estimate the cost of wrapping and unwrapping a data key with a single master key.
+
+        :param dict master_key: Master key description
+        """
+        kind = self.master_key_kind(master_key)
+        if kind != "rsa":
+            return self.weights[kind]
+        bits = self._keys["keys"][master_key["key"]].get("bits", 2048)
+        return self.weights["rsa-2048"] * (bits / 2048.0) ** 3
+
+    def message_size(self, scenario):
+        """Estimate the size in bytes of the message that an encryption scenario produces.
+
+        :param dict scenario: Encryption scenario
+        """
+        size = MESSAGE_OVERHEAD_BYTES + self._plaintexts[scenario["plaintext"]]
+        for master_key in scenario["master-keys"]:
+            size += ENCRYPTED_DATA_KEY_BYTES[self.master_key_kind(master_key)]
+        if scenario["algorithm"] in SIGNED_ALGORITHM_SUITES:
+            size += SIGNATURE_BYTES
+        return size
+
+    def vector_count(self, test):
+        """Estimate the number of test vectors that a test produces.
+
+        Tampered tests produce one vector per byte (``truncate``) or per bit (``mutate``)
+        of the message.
+
+        :param dict test: Encrypt or decrypt generation test description
+        """
+        tampering = test.get("tampering", None)
+        if tampering in BULK_TAMPERINGS:
+            size = self.message_size(test["encryption-scenario"])
+            return max(1, tampered_vector_count(tampering, size))
+        return 1
+
+    def scenario_cost(self, scenario):
+        """Estimate the cost of encrypting and decrypting a single encryption scenario.
+
+        :param dict scenario: Encryption scenario
+        """
+        cost = self.weights["message"]
+        cost += self.weights["kib"] * self._plaintexts[scenario["plaintext"]] / 1024.0
+        for master_key in scenario["master-keys"]:
+            cost += self.master_key_cost(master_key)
+        if scenario["algorithm"] in SIGNED_ALGORITHM_SUITES:
+            cost += self.weights["signature"]
+        return cost
+
+    def network_call_count(self, scenario):
+        """Estimate the number of AWS KMS requests made to encrypt and decrypt a single
+        encryption scenario: one for each aws-kms master key to encrypt, and one to decrypt.
+
+        :param dict scenario: Encryption scenario
+        """
+        count = sum(
+            1 for master_key in scenario["master-keys"] if master_key["type"] == "aws-kms"
+        )
+        return count + 1 if count else 0
+
+    def test_estimate(self, test):
+        """Estimate the resources needed to process a single test, including every vector
+        it produces.
+
+        :param dict test: Encrypt or decrypt generation test description
+        :returns: Estimated ``cpu-seconds``, ``network-calls`` and total ``seconds``, which
+            include the latency of network calls
+        """
+        scenario = test.get("encryption-scenario", test)
+        vector_count = self.vector_count(test)
+        milliseconds = self.scenario_cost(scenario)
+        network_milliseconds = self.weights["aws-kms"] * sum(
+            1 for master_key in scenario["master-keys"] if master_key["type"] == "aws-kms"
+        )
+        return {
+            "cpu-seconds": round(
+                (milliseconds - network_milliseconds) * vector_count / 1000.0, ESTIMATE_PRECISION
+            ),
+            "network-calls": self.network_call_count(scenario) * vector_count,
+            "seconds": round(milliseconds * vector_count / 1000.0, ESTIMATE_PRECISION),
+        }
+
+    def test_cost(self, test):
+        """Estimate the cost of processing a single test, including every vector it produces.
+
+        :param dict test: Encrypt or decrypt generation test description
+        """
+        scenario = test.get("encryption-scenario", test)
+        return self.scenario_cost(scenario) * self.vector_count(test)
+
+
+def _empty_totals():
+    return {"tests": 0, "cpu-seconds": 0.0, "network-calls": 0, "seconds": 0.0}
+
+
+def _accumulate(totals, estimate):
+    totals["tests"] += 1
+    for name in ("cpu-seconds", "network-calls", "seconds"):
+        totals[name] += estimate[name]
+
+
+class CostReport(object):
+    """Summarize the estimated resources needed to process a manifest, as its tests are built.
+
+    Totals are kept for the whole manifest, for each algorithm suite and for each kind of key.
+    A test that uses several kinds of key is counted under each of them.
+
+    :param cost_model: :class:`CostModel` with which to estimate each test
+    :param bool attach: Also add each estimate to its test as a ``cost-estimate`` member
+    """
+
+    def __init__(self, cost_model, attach=False):
+        self._cost_model = cost_model
+        self._attach = attach
+        self._total = _empty_totals()
+        self._algorithm_suites = {}
+        self._key_types = {}
+
+    def add(self, test):
+        """Estimate a single test and add it to the totals.
+
+        :param dict test: Encrypt or decrypt generation test description
+        :returns: Estimate of the test
+        """
+        estimate = self._cost_model.test_estimate(test)
+        scenario = test.get("encryption-scenario", test)
+        _accumulate(self._total, estimate)
+        _accumulate(
+            self._algorithm_suites.setdefault(scenario["algorithm"], _empty_totals()), estimate
+        )
+        for kind in {
+            self._cost_model.master_key_kind(master_key) for master_key in scenario["master-keys"]
+        }:
+            _accumulate(self._key_types.setdefault(kind, _empty_totals()), estimate)
+        return estimate
+
+    def observe(self, tests):
+        """Estimate tests while passing them through, attaching estimates if requested.
+
+        Estimates are attached after test IDs are built, so recalibrated weights never change
+        deterministic test IDs.
+
+        :param tests: Iterable of ``(test_id, test)`` pairs
+        """
+        for test_id, test in tests:
+            estimate = self.add(test)
+            if self._attach:
+                test["cost-estimate"] = estimate
+            yield test_id, test
+
+    def summary(self):
+        """Build the report of the totals so far.
+
+        :returns: Totals for the whole manifest, by algorithm suite and by key type,
+            with the cost weights that they were estimated with
+        """
+
+        def _rounded(totals):
+            rounded = dict(totals)
+            for name in ("cpu-seconds", "seconds"):
+                rounded[name] = round(rounded[name], ESTIMATE_PRECISION)
+            return rounded
+
+        return {
+            "weights": dict(self._cost_model.weights),
+            "total": _rounded(self._total),
+            "algorithm-suites": {
+                algorithm: _rounded(totals)
+                for algorithm, totals in sorted(self._algorithm_suites.items())
+            },
+            "key-types": {
+                kind: _rounded(totals) for kind, totals in sorted(self._key_types.items())
+            },
+        }
+
+    def write(self, filename="-"):
+        """Write the report as JSON.
+
+        :param str filename: Name of file to which to write the report, or - for stderr
+        """
+        write_report(self.summary(), filename)
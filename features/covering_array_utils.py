@@ -0,0 +1,137 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import itertools
+
+
+def _interactions(factor_sizes, strength):
+    """Count the distinct combinations of values of every ``strength`` factors."""
+    total = 0
+    for combination in itertools.combinations(factor_sizes, strength):
+        count = 1
+        for size in combination:
+            count *= size
+        total += count
+    return total
+
+
+def covering_array(factor_sizes, strength=2):
+    """Build a covering array: a set of rows, each assigning a value to every factor,
+    in which every combination of values of any ``strength`` factors appears at least once.
+
+    Rows are built with the deterministic in-parameter-order (IPOG) strategy: the product of
+    the largest ``strength`` factors is extended one factor at a time, first by choosing the
+    value for each existing row that covers the most missing combinations and then by adding
+    rows for whatever is still missing.
+
+    :param list factor_sizes: Number of values of each factor
+    :param int strength: Number of factors whose combinations must all be covered
+        (2 for pairwise coverage)
+    :returns: Sorted list of rows, each a tuple of value indexes in factor order
+    :raises ValueError: if ``strength`` is less than 1
+    """
+    if strength < 1:
+        raise ValueError("Coverage strength must be at least 1")
+    factor_count = len(factor_sizes)
+    if strength >= factor_count or 0 in factor_sizes:
+        return sorted(itertools.product(*(range(size) for size in factor_sizes)))
+
+    # Extending the largest factors first keeps the array small
+    order = sorted(range(factor_count), key=lambda factor: (-factor_sizes[factor], factor))
+    sizes = [factor_sizes[factor] for factor in order]
+    rows = [list(row) for row in itertools.product(*(range(size) for size in sizes[:strength]))]
+
+    for new_factor in range(strength, factor_count):
+        combinations = list(itertools.combinations(range(new_factor), strength - 1))
+        missing = set(
+            (combination, values, value)
+            for combination in combinations
+            for values in itertools.product(*(range(sizes[factor]) for factor in combination))
+            for value in range(sizes[new_factor])
+        )
+
+        # Horizontal growth: extend each row with its most useful value
+        for row in rows:
+            row_interactions = [
+                (combination, tuple(row[factor] for factor in combination))
+                for combination in combinations
+                if all(row[factor] is not None for factor in combination)
+            ]
+            best_value, best_covered = None, []
+            for value in range(sizes[new_factor]):
+                covered = [
+                    (combination, values, value)
+                    for combination, values in row_interactions
+                    if (combination, values, value) in missing
+                ]
+                if len(covered) > len(best_covered):
+                    best_value, best_covered = value, covered
+            # A row that covers nothing new is left open for vertical growth
+            row.append(best_value)
+            missing.difference_update(best_covered)
+
+        # Vertical growth: fill open values of existing rows, or add rows
+        open_rows = [row for row in rows if None in row]
+        for combination, values, value in sorted(missing):
+            for row in open_rows:
+                if row[new_factor] in (None, value) and all(
+                    row[factor] in (None, factor_value)
+                    for factor, factor_value in zip(combination, values)
+                ):
+                    break
+            else:
+                row = [None] * (new_factor + 1)
+                rows.append(row)
+                open_rows.append(row)
+            row[new_factor] = value
+            for factor, factor_value in zip(combination, values):
+                row[factor] = factor_value
+
+    result = set()
+    for row in rows:
+        original = [0] * factor_count
+        for position, value in enumerate(row):
+            original[order[position]] = 0 if value is None else value
+        result.add(tuple(original))
+    return sorted(result)
+
+
+class CoverageChecker(object):
+    """Track which combinations of factor values a set of rows covers.
+
+    :param list factor_sizes: Number of values of each factor
+    :param int strength: Number of factors whose combinations must all be covered
+    """
+
+    def __init__(self, factor_sizes, strength=2):
+        self.strength = min(strength, len(factor_sizes))
+        self.required = _interactions(factor_sizes, self.strength)
+        self._combinations = list(itertools.combinations(range(len(factor_sizes)), self.strength))
+        self._covered = set()
+
+    def add(self, row):
+        """Record the combinations covered by a single row.
+
+        :param row: Value index of each factor, or None for values that are not factor values
+        """
+        for combination in self._combinations:
+            values = tuple(row[factor] for factor in combination)
+            if None not in values:
+                self._covered.add((combination, values))
+
+    @property
+    def missing(self):
+        """Number of combinations that no row has covered yet."""
+        return self.required - len(self._covered)
@@ -0,0 +1,129 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import base64
+import os
+import threading
+from manifest_utils import atomic_write, canonical_digest
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+except ImportError:
+    serialization = None
+
+# Members of a keys manifest entry that determine its parsed key
+_MATERIAL_MEMBERS = ("algorithm", "type", "encoding", "material")
+
+
+def material_digest(key):
+    """Digest the members of a keys manifest entry that determine its parsed key.
+
+    :param dict key: Keys manifest entry
+    :rtype: str
+    """
+    return canonical_digest({name: key.get(name, None) for name in _MATERIAL_MEMBERS})
+
+
+def _require_cryptography():
+    if serialization is None:
+        raise ImportError("Loading raw RSA keys requires the cryptography package")
+
+
+class KeyMaterialCache(object):
+    """Parse the material of raw keys from a keys manifest at most once.
+
+    AES keys are decoded to bytes. RSA keys are parsed to ``cryptography`` private or public
+    key objects. Parsed keys are held in memory for the life of the cache. If a cache directory
+    is given, RSA keys are also stored there in DER form, named by :func:`material_digest`, so
+    later processes skip PEM decoding entirely. A cache may be shared by several threads.
+
+    :param str cache_directory: Directory in which to store DER encoded keys (optional)
+    """
+
+    def __init__(self, cache_directory=None):
+        self._cache_directory = cache_directory
+        self._keys = {}
+        self._lock = threading.Lock()
+        if cache_directory is not None:
+            os.makedirs(cache_directory, exist_ok=True)
+
+    def load(self, key):
+        """Get the parsed material of a raw key.
+
+        :param dict key: Keys manifest entry with ``material``
+        :returns: Key bytes for AES keys or a ``cryptography`` key object for RSA keys
+        :raises ValueError: if the key is not a raw AES or RSA key
+        """
+        digest = material_digest(key)
+        try:
+            return self._keys[digest]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if digest not in self._keys:
+                self._keys[digest] = self._parse(key, digest)
+            return self._keys[digest]
+
+    def _parse(self, key, digest):
+        if key.get("algorithm", None) == "aes":
+            return base64.b64decode(key["material"])
+        if key.get("algorithm", None) != "rsa":
+            raise ValueError(
+                "Key \"{}\" does not contain raw AES or RSA key material".format(key["key-id"])
+            )
+
+        _require_cryptography()
+        private = key["type"] == "private"
+        der = self._read_der(digest)
+        if der is not None:
+            if private:
+                return serialization.load_der_private_key(der, None, default_backend())
+            return serialization.load_der_public_key(der, default_backend())
+
+        material = key["material"].encode("utf-8")
+        if private:
+            parsed = serialization.load_pem_private_key(material, None, default_backend())
+            der = parsed.private_bytes(
+                serialization.Encoding.DER,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        else:
+            parsed = serialization.load_pem_public_key(material, default_backend())
+            der = parsed.public_bytes(
+                serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+        self._write_der(digest, der)
+        return parsed
+
+    def _der_filename(self, digest):
+        return os.path.join(self._cache_directory, "{}.der".format(digest))
+
+    def _read_der(self, digest):
+        if self._cache_directory is None:
+            return None
+        try:
+            with open(self._der_filename(digest), "rb") as der_file:
+                return der_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_der(self, digest, der):
+        if self._cache_directory is None:
+            return
+        # Concurrent processes must never read a partial key
+        atomic_write(self._der_filename(digest), der)
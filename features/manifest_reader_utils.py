@@ -0,0 +1,244 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import json
+import os
+import re
+from compact_manifest_utils import is_compact, iter_compact_tests
+from manifest_utils import uri_to_path
+
+# Number of characters to read from a manifest at a time
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _scenario(test):
+    """Find the members that describe how a test's message is encrypted."""
+    return test.get("encryption-scenario", test)
+
+
+def test_algorithm(test):
+    """Find the algorithm suite ID of an encrypt (0003) or decrypt generation (0006) test.
+
+    :param dict test: Test description
+    :returns: Algorithm suite ID, or None if the test does not identify one
+    """
+    return _scenario(test).get("algorithm", None)
+
+
+def test_key_names(test):
+    """Find the names of all keys that a test references.
+
+    :param dict test: Test description from a 0003, 0004 or 0006 manifest
+    :rtype: set
+    """
+    master_keys = list(_scenario(test).get("master-keys", []))
+    master_keys.extend(test.get("decryption-master-keys", []))
+    return {master_key["key"] for master_key in master_keys}
+
+
+class ManifestReader(object):
+    """Read a manifest incrementally, yielding tests one at a time as they are parsed.
+
+    The members that precede ``tests`` are parsed when the reader is created; the ``tests``
+    member is then parsed one test at a time, so only a single test and a small read buffer
+    are held in memory. Members that follow ``tests`` are added to :attr:`header` once all
+    tests have been read. Compact binary manifests are also accepted.
+
+    :param str filename: Name of file containing the manifest
+    :param str manifest_type: Manifest type that the manifest must identify itself as (optional)
+    :param int chunk_size: Number of characters to read at a time
+    :raises ValueError: if the manifest is not of the expected type
+    """
+
+    def __init__(self, filename, manifest_type=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._filename = filename
+        self._directory = os.path.dirname(os.path.abspath(filename))
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._keys = None
+        self._compact_tests = None
+        self._tests_requested = False
+
+        with open(filename, "rb") as manifest_file:
+            compact = is_compact(manifest_file)
+            if compact:
+                self.header, self._compact_tests = iter_compact_tests(manifest_file)
+                self.header.pop("tests")
+        if not compact:
+            self._file = open(filename, "r", encoding="utf-8")
+            self._buffer = ""
+            self._position = 0
+            self._eof = False
+            self.header = {}
+            self._read_header()
+
+        if manifest_type is not None and self.header["manifest"]["type"] != manifest_type:
+            raise ValueError(
+                "Manifest \"{filename}\" has type \"{actual}\" "
+                "but \"{expected}\" was expected.".format(
+                    filename=filename,
+                    actual=self.header["manifest"]["type"],
+                    expected=manifest_type,
+                )
+            )
+
+    @property
+    def directory(self):
+        """Directory that contains the manifest, against which its relative URIs are resolved."""
+        return self._directory
+
+    @property
+    def keys(self):
+        """Keys manifest referenced by the ``keys`` member, loaded on first use."""
+        if self._keys is None:
+            with open(uri_to_path(self._directory, self.header["keys"]), "r") as keys_file:
+                self._keys = json.load(keys_file)
+        return self._keys
+
+    def _fill(self):
+        """Read another chunk into the buffer, dropping what has already been parsed."""
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer) or not self._fill():
+                return
+
+    def _expect(self, characters):
+        """Consume one of the expected structural characters and return it."""
+        self._skip_whitespace()
+        if self._position >= len(self._buffer) or self._buffer[self._position] not in characters:
+            raise ValueError(
+                "Manifest \"{filename}\" is not valid JSON: expected one of {expected}".format(
+                    filename=self._filename, expected=", ".join(repr(c) for c in characters)
+                )
+            )
+        self._position += 1
+        return self._buffer[self._position - 1]
+
+    def _value(self):
+        """Decode the next complete JSON value, reading more of the file as needed."""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end < len(self._buffer) or self._eof or not self._fill():
+                self._position = end
+                return value
+
+    def _members(self):
+        """Iterate over the member names of the object that starts at the current position,
+        leaving the position at the start of each member's value."""
+        self._expect("{")
+        self._skip_whitespace()
+        if self._buffer[self._position:self._position + 1] == "}":
+            self._position += 1
+            return
+        while True:
+            name = self._value()
+            self._expect(":")
+            yield name
+            if self._expect(",}") == "}":
+                return
+
+    def _read_header(self):
+        self._top_level = self._members()
+        for name in self._top_level:
+            if name == "tests":
+                return
+            self.header[name] = self._value()
+        self._close_file()
+
+    def _close_file(self):
+        self._file.close()
+        self._top_level = None
+
+    def _iter_json_tests(self):
+        if self._top_level is None:
+            return
+        for test_id in self._members():
+            yield test_id, self._value()
+        for name in self._top_level:
+            self.header[name] = self._value()
+        self._close_file()
+
+    def tests(self, algorithms=None, key_types=None, test_id_prefix=None):
+        """Iterate over the tests in the manifest, optionally only those that match filters.
+        Tests are parsed straight from the file, so they can only be requested once per reader.
+
+        :param algorithms: Only yield tests that use one of these algorithm suite IDs (optional);
+            tests that do not identify an algorithm suite, such as 0004 tests, never match
+        :param key_types: Only yield tests that reference a key of one of these keys manifest
+            types, such as ``aws-kms`` or ``private`` (optional)
+        :param str test_id_prefix: Only yield tests whose ID starts with this prefix (optional)
+        :returns: Iterator of ``(test_id, test)`` pairs
+        :raises ValueError: if tests have already been requested from this reader
+        """
+        if self._tests_requested:
+            raise ValueError(
+                "Tests of manifest \"{}\" can only be read once; "
+                "open another reader to read them again".format(self._filename)
+            )
+        self._tests_requested = True
+        key_type_by_name = None
+        if key_types is not None:
+            key_types = set(key_types)
+            key_type_by_name = {name: key["type"] for name, key in self.keys["keys"].items()}
+        if algorithms is not None:
+            algorithms = set(algorithms)
+
+        if self._compact_tests is not None:
+            tests = self._compact_tests
+        else:
+            tests = self._iter_json_tests()
+        return self._filter_tests(tests, algorithms, key_types, key_type_by_name, test_id_prefix)
+
+    @staticmethod
+    def _filter_tests(tests, algorithms, key_types, key_type_by_name, test_id_prefix):
+        for test_id, test in tests:
+            if test_id_prefix is not None and not test_id.startswith(test_id_prefix):
+                continue
+            if algorithms is not None and test_algorithm(test) not in algorithms:
+                continue
+            if key_types is not None and not any(
+                key_type_by_name.get(name, None) in key_types for name in test_key_names(test)
+            ):
+                continue
+            yield test_id, test
+
+    def close(self):
+        """Stop reading the manifest."""
+        if self._compact_tests is None and not self._file.closed:
+            self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,470 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import array
+import collections
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sys
+import tempfile
+from urllib.parse import urlparse
+from compact_manifest_utils import is_compact, load_compact_manifest
+
+
+def _newline(indent, level):
+    """Build the whitespace that starts a new member at the given nesting level."""
+    if indent is None:
+        return ""
+    return "\n" + " " * (indent * level)
+
+
+def _encode(value, indent, level):
+    """Serialize a value as it would appear at the given nesting level."""
+    encoded = json.dumps(value, indent=indent)
+    if indent is None:
+        return encoded
+    return encoded.replace("\n", _newline(indent, level))
+
+
+def canonical_json(value):
+    """Serialize a value so that equal values always serialize identically, regardless of
+    the order of their members.
+
+    :param value: JSON-serializable value
+    :rtype: str
+    """
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def canonical_digest(value):
+    """Digest the canonical serialization of a value, such as a test description or
+    a keys manifest.
+
+    :param value: JSON-serializable value
+    :returns: SHA-256 hex digest
+    :rtype: str
+    """
+    return hashlib.sha256(canonical_json(value).encode("utf-8")).hexdigest()
+
+
+# Maximum number of serialized values that a fragment encoder caches
+FRAGMENT_CACHE_SIZE = 4096
+
+
+class FrozenDict(dict):
+    """Dictionary that refuses modification, so that a single instance can be safely shared
+    by every test that uses it. The JSON encoder serializes it like any other dictionary.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Shared test description members cannot be modified; copy them first")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+    # In-place union (``|=``), on Python 3.9+
+    __ior__ = _immutable
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FragmentEncoder(object):
+    """Serialize values exactly as ``json.dumps`` would, but splice in cached serializations
+    of the values that many tests share.
+
+    Immutable containers (tuples and :class:`FrozenDict` instances), such as master key
+    configurations, provider sets and encryption contexts, are serialized once for each
+    nesting level at which they appear and then reused by identity. Every other dictionary
+    and list is assembled from the serializations of its members. Strings and member names
+    are cached by value.
+
+    :param int indent: Optional indent to use for human-readable JSON
+    """
+
+    def __init__(self, indent=None):
+        self._indent = indent
+        self._item_separator = ", " if indent is None else ","
+        self._newlines = {}
+        self._fragments = {}
+        self._strings = {}
+        self._names = {}
+
+    def _newline(self, level):
+        try:
+            return self._newlines[level]
+        except KeyError:
+            newline = self._newlines[level] = _newline(self._indent, level)
+            return newline
+
+    def _cache(self, cache, key, fragment):
+        if len(cache) >= FRAGMENT_CACHE_SIZE:
+            cache.clear()
+        cache[key] = fragment
+        return fragment
+
+    def encode(self, value, level=0):
+        """Serialize a value as it would appear at the given nesting level.
+
+        :param value: JSON-serializable value
+        :param int level: Nesting level of the value
+        :rtype: str
+        """
+        value_type = type(value)
+        if value_type is str:
+            fragment = self._strings.get(value)
+            if fragment is None:
+                fragment = self._cache(self._strings, value, json.dumps(value))
+            return fragment
+
+        if value_type is tuple or value_type is FrozenDict:
+            key = (id(value), level)
+            cached = self._fragments.get(key)
+            # Holding on to each cached value keeps its id from being reused by another object
+            if cached is not None and cached[0] is value:
+                return cached[1]
+            fragment = _encode(value, self._indent, level)
+            return self._cache(self._fragments, key, (value, fragment))[1]
+
+        if value_type is dict and value:
+            members = []
+            for name, member in value.items():
+                prefix = self._names.get(name)
+                if prefix is None:
+                    if type(name) is not str:
+                        return _encode(value, self._indent, level)
+                    prefix = self._cache(self._names, name, json.dumps(name) + ": ")
+                members.append(prefix + self.encode(member, level + 1))
+            opening, closing = "{", "}"
+        elif value_type is list and value:
+            members = [self.encode(member, level + 1) for member in value]
+            opening, closing = "[", "]"
+        elif isinstance(value, (dict, list, tuple)):
+            return _encode(value, self._indent, level)
+        else:
+            # Indentation never affects scalars, and the compact encoder is much faster
+            return json.dumps(value)
+
+        newline = self._newline(level + 1)
+        return (
+            opening
+            + newline
+            + (self._item_separator + newline).join(members)
+            + self._newline(level)
+            + closing
+        )
+
+
+# Fragment encoders used by encode_test, one for each indent
+_FRAGMENT_ENCODERS = {}
+
+
+def encode_test(test, indent=None):
+    """Serialize a single test description as it will appear in the ``tests`` member
+    of a manifest written by :class:`ManifestWriter`.
+
+    This can be called in a separate process from the one that writes the manifest.
+
+    :param dict test: Test description
+    :param int indent: Optional indent to use for human-readable JSON
+    :rtype: str
+    """
+    try:
+        encoder = _FRAGMENT_ENCODERS[indent]
+    except KeyError:
+        encoder = _FRAGMENT_ENCODERS[indent] = FragmentEncoder(indent)
+    return encoder.encode(test, 2)
+
+
+class ManifestWriter(object):
+    """Write a manifest to a stream, serializing each test as soon as it is added.
+
+    The output is byte-for-byte identical to ``json.dumps`` of the equivalent manifest
+    dictionary with ``tests`` as its last member, but only one test is held in memory
+    at a time.
+
+    :param stream: Text stream to which to write the manifest
+    :param dict manifest: Manifest members to write before the ``tests`` member
+    :param int indent: Optional indent to use for human-readable JSON
+    """
+
+    def __init__(self, stream, manifest, indent=None):
+        self._stream = stream
+        self._indent = indent
+        self.test_count = 0
+        self._closed = False
+        self._write_header(manifest)
+
+    def _write_header(self, manifest):
+        separator = ", " if self._indent is None else ","
+        members = [
+            "{newline}{name}: {value}".format(
+                newline=_newline(self._indent, 1),
+                name=json.dumps(name),
+                value=_encode(value, self._indent, 1),
+            )
+            for name, value in manifest.items()
+            if name != "tests"
+        ]
+        members.append("{newline}\"tests\": ".format(newline=_newline(self._indent, 1)))
+        self._stream.write("{" + separator.join(members))
+
+    def encode_test(self, test):
+        """Serialize a single test description as it will appear in the ``tests`` member.
+
+        :param dict test: Test description
+        :rtype: str
+        """
+        return encode_test(test, self._indent)
+
+    def add(self, test_id, test):
+        """Serialize and write a single test.
+
+        :param str test_id: Test ID
+        :param dict test: Test description
+        """
+        self.add_encoded(test_id, self.encode_test(test))
+
+    def add_encoded(self, test_id, encoded_test):
+        """Write a single test that has already been serialized by :meth:`encode_test`,
+        or by :func:`encode_test` with the same indent.
+
+        :param str test_id: Test ID
+        :param str encoded_test: Serialized test description
+        """
+        if self.test_count == 0:
+            opening = "{"
+        else:
+            opening = ", " if self._indent is None else ","
+        self._stream.write(
+            "{opening}{newline}{test_id}: {test}".format(
+                opening=opening,
+                newline=_newline(self._indent, 2),
+                test_id=json.dumps(test_id),
+                test=encoded_test,
+            )
+        )
+        self.test_count += 1
+
+    def close(self):
+        """Finish writing the manifest. Does not close the underlying stream."""
+        if self._closed:
+            return
+        if self.test_count == 0:
+            self._stream.write("{}")
+        else:
+            self._stream.write(_newline(self._indent, 1) + "}")
+        self._stream.write(_newline(self._indent, 0) + "}")
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leave the output visibly truncated rather than closing a partial manifest
+        if exc_type is None:
+            self.close()
+
+
+def write_manifest(stream, manifest, tests, indent=None):
+    """Write a manifest to a stream, consuming tests one at a time.
+
+    :param stream: Text stream to which to write the manifest
+    :param dict manifest: Manifest members to write before the ``tests`` member
+    :param tests: Iterable of ``(test_id, test)`` pairs
+    :param int indent: Optional indent to use for human-readable JSON
+    :returns: Number of tests written
+    :rtype: int
+    """
+    with ManifestWriter(stream, manifest, indent) as writer:
+        for test_id, test in tests:
+            writer.add(test_id, test)
+    return writer.test_count
+
+
+@contextlib.contextmanager
+def output_stream(filename, binary=False):
+    """Open an output destination for writing a manifest.
+
+    :param str filename: Name of file to write, or ``-`` for stdout
+    :param bool binary: Open a binary stream instead of a text stream
+    """
+    if filename == "-":
+        yield sys.stdout.buffer if binary else sys.stdout
+        return
+    if binary:
+        with open(filename, "wb") as stream:
+            yield stream
+        return
+    with open(filename, "w", encoding="utf-8") as stream:
+        yield stream
+
+
+def atomic_write(filename, data):
+    """Write a file so that concurrent readers, in this or any other process, see either
+    the previous contents or all of the new contents, never a partial file.
+
+    :param str filename: Name of file to write
+    :param bytes data: Contents of the file
+    """
+    handle, temporary_filename = tempfile.mkstemp(
+        dir=os.path.dirname(filename) or ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(handle, "wb") as temporary_file:
+            temporary_file.write(data)
+        os.replace(temporary_filename, filename)
+    except BaseException:
+        os.unlink(temporary_filename)
+        raise
+
+
+def write_report(report, filename="-"):
+    """Write a report about a run, such as a cost estimate or profile, as human-readable JSON.
+
+    :param dict report: Report to write
+    :param str filename: Name of file to which to write the report, or - for stderr
+    """
+    encoded = json.dumps(report, indent=4) + "\n"
+    if filename == "-":
+        sys.stderr.write(encoded)
+    else:
+        with open(filename, "w") as report_file:
+            report_file.write(encoded)
+
+
+def shard_filenames(filename, shard_count):
+    """Build the names of the files to which to write each shard of a manifest.
+
+    :param str filename: Name of the file that would contain the whole manifest
+    :param int shard_count: Number of shards
+    """
+    root, extension = os.path.splitext(filename)
+    return [
+        "{root}.shard-{index}-of-{count}{extension}".format(
+            root=root, index=index, count=shard_count, extension=extension
+        )
+        for index in range(1, shard_count + 1)
+    ]
+
+
+def write_sharded_manifests(streams, manifest, build_tests, test_cost, indent=None):
+    """Partition tests across several manifests so that every manifest has roughly the same
+    total estimated cost.
+
+    Tests are built twice: once to estimate their costs and assign them to shards, largest
+    first, and once more to write them. Only the per-test costs and shard assignments are
+    held in memory. Every manifest gets the same members other than ``tests``, so all
+    shards reference the same keys manifest and plaintexts.
+
+    :param list streams: Text streams to which to write each shard
+    :param dict manifest: Manifest members to write before the ``tests`` member
+    :param callable build_tests: Function that returns an iterable of ``(test_id, test)`` pairs,
+        building the same tests in the same order every time it is called
+    :param callable test_cost: Function that returns the estimated cost of a test
+    :param int indent: Optional indent to use for human-readable JSON
+    :returns: Total estimated cost of each shard
+    """
+    costs = array.array("d", (test_cost(test) for _test_id, test in build_tests()))
+
+    loads = [(0.0, index) for index in range(len(streams))]
+    assignments = array.array("L", bytes(len(costs) * array.array("L").itemsize))
+    for position in sorted(range(len(costs)), key=lambda position: -costs[position]):
+        load, index = heapq.heappop(loads)
+        assignments[position] = index
+        heapq.heappush(loads, (load + costs[position], index))
+
+    writers = [ManifestWriter(stream, manifest, indent) for stream in streams]
+    for position, (test_id, test) in enumerate(build_tests()):
+        writers[assignments[position]].add(test_id, test)
+    for writer in writers:
+        writer.close()
+    return [load for load, _index in sorted(loads, key=lambda item: item[1])]
+
+
+def load_manifest(filename, manifest_type=None):
+    """Load a manifest from a file, in either JSON or compact binary form.
+
+    :param str filename: Name of file containing the manifest
+    :param str manifest_type: Manifest type that the manifest must identify itself as (optional)
+    :raises ValueError: if the manifest is not of the expected type
+    """
+    with open(filename, "rb") as manifest_file:
+        if is_compact(manifest_file):
+            manifest = load_compact_manifest(manifest_file)
+        else:
+            manifest = json.loads(manifest_file.read().decode("utf-8"))
+
+    if manifest_type is not None and manifest["manifest"]["type"] != manifest_type:
+        raise ValueError(
+            "Manifest \"{filename}\" has type \"{actual}\" but \"{expected}\" was expected.".format(
+                filename=filename, actual=manifest["manifest"]["type"], expected=manifest_type
+            )
+        )
+    return manifest
+
+
+def diff_tests(tests, baseline_tests):
+    """Compare tests against the tests of an existing manifest, matching them by their
+    descriptions rather than by their IDs.
+
+    Only the added tests and digests of the baseline tests are held in memory while
+    ``tests`` is consumed.
+
+    :param tests: Iterable of ``(test_id, test)`` pairs
+    :param dict baseline_tests: Tests from an existing manifest
+    :returns: List of ``(test_id, test)`` pairs that are not in the baseline and map of
+        baseline test IDs to tests that are no longer present, in baseline order
+    """
+    unmatched = collections.defaultdict(list)
+    for test_id, test in baseline_tests.items():
+        unmatched[canonical_digest(test)].append(test_id)
+
+    added = []
+    for test_id, test in tests:
+        matches = unmatched.get(canonical_digest(test))
+        if matches:
+            matches.pop()
+            continue
+        added.append((test_id, test))
+
+    removed_ids = set(itertools.chain.from_iterable(unmatched.values()))
+    removed = {
+        test_id: test for test_id, test in baseline_tests.items() if test_id in removed_ids
+    }
+    return added, removed
+
+
+def uri_to_path(base_directory, uri):
+    """Resolve a ``file`` URI from a manifest to a local path.
+
+    Relative URIs (such as ``file://relative/file/path.json``) are relative to the
+    directory that contains the manifest that references them.
+
+    :param str base_directory: Directory that contains the referencing manifest
+    :param str uri: URI to resolve
+    :raises ValueError: if the URI does not identify a local file
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme != "file":
+        raise ValueError("Only file URIs are supported: \"{}\"".format(uri))
+    if parsed.netloc:
+        return os.path.join(base_directory, *(parsed.netloc + parsed.path).split("/"))
+    return parsed.path
@@ -0,0 +1,168 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import json
+import mmap
+import os
+import random
+from manifest_utils import atomic_write
+
+# Plaintext content is generated and written in chunks of this many bytes
+CHUNK_SIZE = 1024 * 1024
+
+# Name of the file in a plaintext store directory that records how each plaintext was generated
+INDEX_FILENAME = ".plaintexts.json"
+
+
+def _plaintext_chunk(seed, name, index, length):
+    """Generate one chunk of plaintext content.
+
+    Every chunk is seeded independently from the store seed, plaintext name and chunk index,
+    so the same chunk is always generated with the same content, in any process.
+
+    :param seed: Plaintext store seed
+    :param str name: Plaintext name
+    :param int index: Chunk index
+    :param int length: Number of bytes to generate
+    :rtype: bytes
+    """
+    generator = random.Random("{seed}:{name}:{index}".format(seed=seed, name=name, index=index))
+    return generator.getrandbits(length * 8).to_bytes(length, "little")
+
+
+class PlaintextStore(object):
+    """Reproducible plaintexts, as described by the ``plaintexts`` section of a manifest,
+    written to files in a directory and read through memory maps.
+
+    Plaintext content is pseudo-random but fully determined by the store seed, so every
+    handler that uses the same seed works with the same plaintexts. Plaintexts are generated
+    one chunk at a time and are never held in memory, so they can be far larger than RAM.
+    Files that were already generated with the same seed and size are reused.
+
+    Memory views returned by the store must be released before the store is closed.
+
+    :param str directory: Directory in which to store plaintext files
+    :param seed: JSON-serializable seed from which to generate plaintext content
+    """
+
+    def __init__(self, directory, seed=0):
+        self._directory = directory
+        self._seed = seed
+        self._maps = {}
+        os.makedirs(directory, exist_ok=True)
+        self._index_filename = os.path.join(directory, INDEX_FILENAME)
+        try:
+            with open(self._index_filename, "r") as index_file:
+                self._index = json.load(index_file)
+        except FileNotFoundError:
+            self._index = {}
+
+    @classmethod
+    def from_manifest(cls, manifest, directory, seed=0):
+        """Build a store containing every plaintext described by a manifest.
+
+        :param dict manifest: Parsed manifest with a ``plaintexts`` section
+        :param str directory: Directory in which to store plaintext files
+        :param seed: Seed from which to generate plaintext content
+        """
+        store = cls(directory, seed)
+        for name, size in manifest["plaintexts"].items():
+            store.add(name, size)
+        return store
+
+    def filename(self, name):
+        """Build the name of the file that contains a plaintext.
+
+        :param str name: Plaintext name
+        """
+        return os.path.join(self._directory, name)
+
+    def add(self, name, size):
+        """Make a plaintext available, generating its file only if it does not already exist
+        with the same seed and size.
+
+        :param str name: Plaintext name
+        :param int size: Plaintext size in bytes
+        """
+        if self._maps.get(name) is not None:
+            self._maps.pop(name).close()
+
+        entry = {"seed": self._seed, "size": size}
+        filename = self.filename(name)
+        if (
+            self._index.get(name) != entry
+            or not os.path.isfile(filename)
+            or os.path.getsize(filename) != size
+        ):
+            self._generate(name, size)
+            self._index[name] = entry
+            atomic_write(
+                self._index_filename, json.dumps(self._index, indent=4).encode("utf-8")
+            )
+
+        if size == 0:
+            # Empty files cannot be memory mapped
+            self._maps[name] = None
+            return
+        with open(filename, "rb") as plaintext_file:
+            self._maps[name] = mmap.mmap(plaintext_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _generate(self, name, size):
+        with open(self.filename(name), "w+b") as plaintext_file:
+            plaintext_file.truncate(size)
+            if size == 0:
+                return
+            with mmap.mmap(plaintext_file.fileno(), size, access=mmap.ACCESS_WRITE) as output:
+                for index, offset in enumerate(range(0, size, CHUNK_SIZE)):
+                    length = min(CHUNK_SIZE, size - offset)
+                    output[offset:offset + length] = _plaintext_chunk(self._seed, name, index, length)
+                output.flush()
+
+    def __contains__(self, name):
+        return name in self._maps
+
+    def __getitem__(self, name):
+        """Get the full contents of a plaintext without copying it.
+
+        :param str name: Plaintext name
+        :rtype: memoryview
+        """
+        plaintext = self._maps[name]
+        if plaintext is None:
+            return memoryview(b"")
+        return memoryview(plaintext)
+
+    def slice(self, name, offset, length):
+        """Get part of a plaintext without copying it.
+
+        :param str name: Plaintext name
+        :param int offset: Offset of the first byte
+        :param int length: Number of bytes
+        :rtype: memoryview
+        """
+        return self[name][offset:offset + length]
+
+    def close(self):
+        """Unmap all plaintexts."""
+        for plaintext in self._maps.values():
+            if plaintext is not None:
+                plaintext.close()
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
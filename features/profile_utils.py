@@ -0,0 +1,238 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import contextlib
+import functools
+import sys
+import time
+import tracemalloc
+from manifest_utils import write_report
+
+# Name of the section that covers the whole profiled run
+_TOTAL = "total"
+
+
+class _Frame(object):
+    """A section of a profiled run that is in progress."""
+
+    def __init__(self, name, traced_bytes):
+        self.name = name
+        self.start = time.perf_counter()
+        self.child_seconds = 0.0
+        self.traced_bytes = traced_bytes
+        self.peak_bytes = traced_bytes
+        self.blocks = sys.getallocatedblocks()
+
+
+def _empty_phase():
+    return {
+        "calls": 0,
+        "wall-seconds": 0.0,
+        "self-seconds": 0.0,
+        "allocated-bytes": 0,
+        "allocated-blocks": 0,
+        "peak-bytes": 0,
+    }
+
+
+class Profiler(object):
+    """Record where a generator run spends its time and memory, and what it emits.
+
+    Each named phase records its number of calls, its wall time, its wall time outside any
+    phase nested in it (``self-seconds``), the net number of bytes and memory blocks that it
+    left allocated, and the most memory that it had allocated at once (``peak-bytes``), as
+    traced by :mod:`tracemalloc`. Per-phase peaks are only exact on Python 3.9+; on earlier
+    versions they can include the peak of an earlier phase.
+
+    Emitted items, such as tests, are counted in total and by provider type.
+
+    :param str item_name: Name of the emitted items in the report, such as ``tests``
+    :param callable kinds: Function that returns the provider types of an emitted item
+    :param bool enabled: Record anything at all; a disabled profiler has no overhead
+    """
+
+    def __init__(self, item_name="tests", kinds=None, enabled=True):
+        self.enabled = enabled
+        self._item_name = item_name
+        self._kinds = kinds
+        self._phases = {}
+        self._stack = []
+        self._items = 0
+        self._items_by_kind = {}
+        self._started_tracing = False
+
+    @classmethod
+    def wrap(cls, profiler):
+        """Use a profiler if one is given, or a disabled profiler otherwise.
+
+        :param profiler: :class:`Profiler` or None
+        :rtype: Profiler
+        """
+        if profiler is None:
+            return cls(enabled=False)
+        return profiler
+
+    def start(self):
+        """Start tracing memory allocations and timing the whole run.
+
+        :returns: This profiler
+        """
+        if self.enabled and not self._stack:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._enter(_TOTAL)
+        return self
+
+    def stop(self):
+        """Finish timing the whole run and stop tracing memory allocations."""
+        if self.enabled and self._stack:
+            while self._stack:
+                self._exit()
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def _fold_peak(self):
+        """Fold the peak traced memory since the last reset into every open section."""
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._stack:
+            frame.peak_bytes = max(frame.peak_bytes, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return current
+
+    def _enter(self, name):
+        self._stack.append(_Frame(name, self._fold_peak()))
+
+    def _exit(self):
+        current = self._fold_peak()
+        frame = self._stack.pop()
+        elapsed = time.perf_counter() - frame.start
+        if self._stack:
+            self._stack[-1].child_seconds += elapsed
+        phase = self._phases.setdefault(frame.name, _empty_phase())
+        phase["calls"] += 1
+        phase["wall-seconds"] += elapsed
+        phase["self-seconds"] += elapsed - frame.child_seconds
+        phase["allocated-bytes"] += current - frame.traced_bytes
+        phase["allocated-blocks"] += sys.getallocatedblocks() - frame.blocks
+        phase["peak-bytes"] = max(phase["peak-bytes"], frame.peak_bytes - frame.traced_bytes)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record a phase of the run for as long as the context is active.
+
+        :param str name: Name of the phase
+        """
+        if not self.enabled:
+            yield
+            return
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def timed(self, function, name):
+        """Record every call of a function as a phase.
+
+        :param callable function: Function to record
+        :param str name: Name of the phase
+        :returns: Function that records each call, or ``function`` itself if disabled
+        """
+        if not self.enabled:
+            return function
+
+        @functools.wraps(function)
+        def _timed(*args, **kwargs):
+            self._enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit()
+
+        return _timed
+
+    def iterate(self, items, name):
+        """Record the work done to produce each item of a lazily built iterable as a phase.
+
+        :param items: Iterable to record
+        :param str name: Name of the phase
+        """
+        if not self.enabled:
+            return items
+        return self._iterate(iter(items), name)
+
+    def _iterate(self, iterator, name):
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def add(self, item):
+        """Count a single emitted item.
+
+        :param item: Emitted item, such as a test description
+        """
+        if not self.enabled:
+            return
+        self._items += 1
+        for kind in self._kinds(item) if self._kinds is not None else ():
+            self._items_by_kind[kind] = self._items_by_kind.get(kind, 0) + 1
+
+    def observe(self, items):
+        """Count emitted items while passing them through unchanged.
+
+        :param items: Iterable of ``(name, item)`` pairs, such as ``(test_id, test)``
+        """
+        if not self.enabled:
+            return items
+        return self._observe(items)
+
+    def _observe(self, items):
+        for name, item in items:
+            self.add(item)
+            yield name, item
+
+    def summary(self):
+        """Build the report of everything recorded so far.
+
+        :rtype: dict
+        """
+        phases = dict(self._phases)
+        total = phases.pop(_TOTAL, _empty_phase())
+        return {
+            "elapsed-seconds": total["wall-seconds"],
+            "peak-bytes": total["peak-bytes"],
+            "phases": phases,
+            self._item_name: self._items,
+            "{}-by-provider-type".format(self._item_name): dict(
+                sorted(self._items_by_kind.items())
+            ),
+        }
+
+    def write(self, filename="-"):
+        """Stop profiling and write the report as JSON.
+
+        :param str filename: Name of file to which to write the report, or - for stderr
+        """
+        self.stop()
+        write_report(self.summary(), filename)
@@ -0,0 +1,163 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import hashlib
+import json
+import os
+import time
+from manifest_utils import atomic_write, canonical_digest
+
+# Suffix of the files that hold cached results
+_ENTRY_SUFFIX = ".json"
+
+# Test members that do not affect the result of decrypting a vector
+_UNCACHED_MEMBERS = ("description", "ciphertext")
+
+
+def data_digest(data):
+    """Digest the contents of a resource, such as a ciphertext or plaintext.
+
+    :param data: Bytes-like object
+    :rtype: str
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def scenario_digest(test, plaintext_digest=None, descriptors_digest=None):
+    """Digest everything about a decrypt test other than its ciphertext that determines
+    its result: master keys, decryption method, tampered vectors and expected result.
+
+    URIs do not identify content, so the expected plaintext and tampered vector descriptors
+    are included by their digests.
+
+    :param dict test: Decrypt (0004) test description
+    :param str plaintext_digest: Digest of the expected plaintext from :func:`data_digest`,
+        for tests that must succeed
+    :param str descriptors_digest: Digest of the tampered vector descriptors from
+        :func:`data_digest`, for tests with a ``tampered-vectors`` member
+    :rtype: str
+    """
+    scenario = {name: value for name, value in test.items() if name not in _UNCACHED_MEMBERS}
+    if "output" in scenario["result"]:
+        scenario["result"] = {"output": {"plaintext": plaintext_digest}}
+    if "tampered-vectors" in scenario:
+        scenario["tampered-vectors"] = descriptors_digest
+    return canonical_digest(scenario)
+
+
+def cache_key(context, scenario, ciphertext):
+    """Build the key under which the result of a single vector is cached.
+
+    :param str context: Digest from :func:`cache_context`
+    :param str scenario: Digest from :func:`scenario_digest`
+    :param str ciphertext: Digest of the ciphertext from :func:`data_digest`
+    :rtype: str
+    """
+    return hashlib.sha256(
+        "{}:{}:{}".format(context, scenario, ciphertext).encode("utf-8")
+    ).hexdigest()
+
+
+def cache_context(generating_client, decrypting_client, keys_digest):
+    """Digest what is shared by every vector in a run and determines its results.
+
+    :param dict generating_client: ``client`` member of the decrypt manifest
+    :param decrypting_client: ``name`` and ``version`` of the client that decrypts the vectors
+    :param str keys_digest: Digest of the keys manifest
+    :rtype: str
+    """
+    return canonical_digest([generating_client, decrypting_client, keys_digest])
+
+
+class ResultCache(object):
+    """Results of previously processed vectors, stored as one small file per vector in a
+    directory, named by the vector's :func:`cache_key`.
+
+    Entries are written atomically, so a cache may be shared by several threads and processes.
+    Reading an entry refreshes its modification time, so eviction removes the entries that
+    have gone unused the longest.
+
+    :param str directory: Directory in which to store cached results
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _filename(self, key):
+        return os.path.join(self._directory, key[:2], key + _ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Look up a cached result.
+
+        :param str key: Key from :func:`cache_key`
+        :returns: ``passed``, ``latency`` and, for failures, ``error``; or None on a miss
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, "r") as entry_file:
+                entry = json.load(entry_file)
+            os.utime(filename)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, result):
+        """Cache the result of a vector.
+
+        :param str key: Key from :func:`cache_key`
+        :param dict result: Test result with ``passed``, ``latency`` and optionally ``error``
+        """
+        entry = {name: result[name] for name in ("passed", "latency", "error") if name in result}
+        filename = self._filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        atomic_write(filename, json.dumps(entry).encode("utf-8"))
+
+    def _entries(self):
+        for shard in os.scandir(self._directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(_ENTRY_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    def evict(self, max_age=None, max_bytes=None):
+        """Remove entries that have not been used for too long, then the least recently used
+        entries until the cache fits in a size limit.
+
+        :param float max_age: Maximum number of seconds since an entry was last used (optional)
+        :param int max_bytes: Maximum total size of all entries in bytes (optional)
+        :returns: Number of entries removed
+        """
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda entry: entry[1], reverse=True)
+        total_bytes = 0
+        removed = 0
+        for path, modified, size in entries:
+            too_old = max_age is not None and now - modified > max_age
+            too_large = max_bytes is not None and total_bytes + size > max_bytes
+            if too_old or too_large:
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            else:
+                total_bytes += size
+        return removed
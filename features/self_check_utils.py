@@ -0,0 +1,290 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import io
+import json
+import os
+import tempfile
+import time
+from compact_manifest_utils import write_compact_manifest
+from covering_array_utils import CoverageChecker, covering_array
+from manifest_reader_utils import ManifestReader, test_algorithm, test_key_names
+from manifest_utils import FragmentEncoder, ManifestWriter, load_manifest
+from result_cache_utils import ResultCache
+from tampering_utils import (
+    BULK_TAMPERINGS,
+    TRUNCATED,
+    TamperedVectors,
+    read_descriptors,
+    tampered_descriptors,
+    write_descriptors
+)
+
+# Indents with which manifests are written: compact and human-readable
+_INDENTS = (None, 4)
+
+# Factor sizes of covering arrays to check besides those of the scenario matrix: uniform,
+# mixed, with a single-valued factor and with many factors
+COVERING_ARRAY_FACTOR_SIZES = ((2, 2, 2), (3, 3, 3, 3), (5, 1, 4, 2, 3), (2,) * 10)
+
+# Small read size for the manifest reader, so that values straddle many chunk boundaries
+_SMALL_CHUNK_SIZE = 97
+
+
+def _plain(value):
+    """Convert a manifest to the plain JSON types it is read back as."""
+    return json.loads(json.dumps(value))
+
+
+def check_compact_round_trip(manifest):
+    """Check that a manifest reads back unchanged from the compact binary encoding.
+
+    :param dict manifest: Manifest to encode
+    :raises ValueError: if the manifest read back differs
+    """
+    header = {name: value for name, value in manifest.items() if name != "tests"}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "manifest.bin")
+        with open(filename, "wb") as stream:
+            write_compact_manifest(stream, header, manifest["tests"].items())
+        loaded = load_manifest(filename)
+    if loaded != _plain(manifest):
+        raise ValueError("Compact manifest does not read back as the manifest that was written")
+
+
+def _reader_filters(tests, key_type_by_name):
+    """List the filter arguments with which to read a manifest: none, each algorithm suite,
+    each key type and each first character of a test ID."""
+    filters = [{}]
+    algorithms = {test_algorithm(test) for test in tests.values()} - {None}
+    filters.extend({"algorithms": [algorithm]} for algorithm in sorted(algorithms))
+    key_types = set(key_type_by_name.values())
+    filters.extend({"key_types": [key_type]} for key_type in sorted(key_types))
+    prefixes = {test_id[:1] for test_id in tests}
+    filters.extend({"test_id_prefix": prefix} for prefix in sorted(prefixes))
+    return filters
+
+
+def _filtered(tests, key_type_by_name, algorithms=None, key_types=None, test_id_prefix=None):
+    return [
+        (test_id, test)
+        for test_id, test in tests.items()
+        if (test_id_prefix is None or test_id.startswith(test_id_prefix))
+        and (algorithms is None or test_algorithm(test) in algorithms)
+        and (
+            key_types is None
+            or any(key_type_by_name.get(name) in key_types for name in test_key_names(test))
+        )
+    ]
+
+
+def check_reader_filters(manifest, keys):
+    """Check that the manifest reader yields the same tests as filtering the fully loaded
+    manifest, with each kind of filter and with reads that split values across chunks.
+
+    :param dict manifest: Manifest to read
+    :param dict keys: Parsed keys manifest that the manifest references
+    :raises ValueError: if the reader yields different tests
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "manifest.json")
+        with open(filename, "w") as manifest_file:
+            json.dump(dict(manifest, keys="file://keys.json"), manifest_file)
+        with open(os.path.join(directory, "keys.json"), "w") as keys_file:
+            json.dump(keys, keys_file)
+        with open(filename, "r") as manifest_file:
+            tests = json.load(manifest_file)["tests"]
+
+        key_type_by_name = {name: key["type"] for name, key in keys["keys"].items()}
+        reads = [({}, _SMALL_CHUNK_SIZE)]
+        reads.extend((filters, None) for filters in _reader_filters(tests, key_type_by_name))
+        for filters, chunk_size in reads:
+            options = {} if chunk_size is None else {"chunk_size": chunk_size}
+            with ManifestReader(filename, **options) as reader:
+                read = list(reader.tests(**filters))
+                try:
+                    reader.tests()
+                except ValueError:
+                    pass
+                else:
+                    raise ValueError("Manifest reader allows its tests to be read twice")
+            if read != _filtered(tests, key_type_by_name, **filters):
+                raise ValueError(
+                    "Manifest reader with {filters} and {chunk_size} chunks does not yield "
+                    "the tests of the loaded manifest".format(
+                        filters=json.dumps(filters) if filters else "no filters",
+                        chunk_size=chunk_size or "default",
+                    )
+                )
+
+
+def check_fragment_encoder(manifest):
+    """Check that the fragment encoder and the manifest writer serialize a manifest exactly
+    as ``json.dumps`` does, both compact and indented.
+
+    :param dict manifest: Manifest to serialize, with ``tests`` as its last member
+    :raises ValueError: if any serialization differs
+    """
+    for indent in _INDENTS:
+        encoder = FragmentEncoder(indent)
+        for test_id, test in manifest["tests"].items():
+            if encoder.encode(test) != json.dumps(test, indent=indent):
+                raise ValueError(
+                    "Fragment encoder with indent {indent} serializes test {test_id} "
+                    "differently from json.dumps".format(indent=indent, test_id=test_id)
+                )
+
+        stream = io.StringIO()
+        with ManifestWriter(stream, manifest, indent) as writer:
+            for test_id, test in manifest["tests"].items():
+                writer.add(test_id, test)
+        if stream.getvalue() != json.dumps(manifest, indent=indent):
+            raise ValueError(
+                "Manifest writer with indent {} serializes the manifest differently "
+                "from json.dumps".format(indent)
+            )
+
+
+def check_covering_arrays(factor_sizes):
+    """Check that covering arrays of every strength cover every combination of values of
+    that many factors, using only valid values.
+
+    :param list factor_sizes: Number of values of each factor
+    :raises ValueError: if a covering array misses a combination or has an invalid row
+    """
+    for strength in range(1, len(factor_sizes) + 1):
+        checker = CoverageChecker(factor_sizes, strength)
+        for row in covering_array(factor_sizes, strength):
+            if len(row) != len(factor_sizes) or any(
+                not 0 <= value < size for value, size in zip(row, factor_sizes)
+            ):
+                raise ValueError(
+                    "Covering array of factor sizes {sizes} has an invalid row {row}".format(
+                        sizes=list(factor_sizes), row=list(row)
+                    )
+                )
+            checker.add(row)
+        if checker.missing:
+            raise ValueError(
+                "Covering array of strength {strength} for factor sizes {sizes} misses "
+                "{missing} combinations".format(
+                    strength=strength, sizes=list(factor_sizes), missing=checker.missing
+                )
+            )
+
+
+def check_result_cache_eviction():
+    """Check that the result cache evicts entries that have gone unused for too long, and then
+    the least recently used entries, where looking up an entry counts as using it.
+
+    :raises ValueError: if the wrong entries are evicted
+    """
+    result = {"passed": True, "latency": 0.5}
+    keys = ["{:02x}{}".format(index, "0" * 62) for index in range(5)]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory)
+        # Entries are last used in key order, an hour apart, and the first is too old to keep
+        long_ago = time.time() - 10 * 3600
+        for index, key in enumerate(keys):
+            cache.put(key, result)
+            used = long_ago + index * 3600
+            os.utime(cache._filename(key), (used, used))
+        if cache.get(keys[1]) is None:
+            raise ValueError("Result cache lost an entry before eviction")
+        entry_size = os.path.getsize(cache._filename(keys[1]))
+
+        # Age eviction removes the first entry; size eviction then removes the least recently
+        # used of the rest, the third, since looking up the second made it the most recent
+        removed = cache.evict(max_age=9.5 * 3600, max_bytes=3 * entry_size)
+        kept = [key for key in keys if cache.get(key) is not None]
+        if removed != 2 or kept != [keys[1], keys[3], keys[4]]:
+            raise ValueError(
+                "Result cache evicted {removed} entries and kept entries {kept} "
+                "instead of entries 1, 3 and 4".format(
+                    removed=removed, kept=[keys.index(key) for key in kept]
+                )
+            )
+
+
+def _tampered_vector(base, offset, bit):
+    """Build a tampered vector directly, independently of :mod:`tampering_utils`."""
+    if bit == TRUNCATED:
+        return base[:offset]
+    vector = bytearray(base)
+    vector[offset] ^= 1 << bit
+    return bytes(vector)
+
+
+def check_tampered_vectors():
+    """Check that tampered vector descriptors read back as they were written, and that the
+    vectors packed from a base ciphertext are the vectors that its descriptors describe.
+
+    :raises ValueError: if descriptors or vectors differ
+    """
+    bases = [bytes(range(7, 30)), b"\xff\x00"]
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "base")
+        with open(filename, "wb") as base_file:
+            base_file.write(bases[0])
+        with TamperedVectors(filename) as vectors:
+            for tampering in BULK_TAMPERINGS:
+                expected = [
+                    (base_index, offset, bit)
+                    for base_index, base in enumerate(bases)
+                    for offset, bit in tampered_descriptors(tampering, len(base))
+                ]
+                encoded = io.BytesIO()
+                count = write_descriptors(encoded, [(tampering, len(base)) for base in bases])
+                encoded.seek(0)
+                if count != len(expected) or list(read_descriptors(encoded)) != expected:
+                    raise ValueError(
+                        "{} descriptors do not read back as written".format(tampering)
+                    )
+
+                packed = io.BytesIO()
+                index = vectors.write_packed(packed, tampering)
+                packed_vectors = [
+                    packed.getvalue()[start:end] for start, end in zip(index, index[1:])
+                ]
+                if packed_vectors != [
+                    _tampered_vector(bases[0], offset, bit)
+                    for base_index, offset, bit in expected
+                    if base_index == 0
+                ]:
+                    raise ValueError(
+                        "Packed {} vectors differ from the vectors that their descriptors "
+                        "describe".format(tampering)
+                    )
+
+
+def run_checks(checks):
+    """Run named checks, reporting each outcome on a line of its own.
+
+    :param checks: Iterable of ``(name, check)`` pairs, where each check is a callable
+        that raises ValueError on failure
+    :returns: Report lines and whether every check passed
+    :rtype: tuple
+    """
+    lines = []
+    passed = True
+    for name, check in checks:
+        try:
+            check()
+        except ValueError as error:
+            lines.append("FAILED {name}: {error}".format(name=name, error=error))
+            passed = False
+        else:
+            lines.append("passed {}".format(name))
+    return lines, passed
@@ -0,0 +1,247 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import hashlib
+import json
+import multiprocessing
+import os
+from manifest_utils import atomic_write, canonical_digest
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:
+    rsa = None
+
+DEFAULT_SEED = "0"
+
+ENCRYPT_DECRYPT = "encrypt-decrypt"
+ENCRYPT_ONLY = "encrypt-only"
+ROLES = (ENCRYPT_DECRYPT, ENCRYPT_ONLY)
+
+AES_KEY_BITS = (128, 192, 256)
+RSA_KEY_BITS = (2048, 3072, 4096)
+RSA_PUBLIC_EXPONENT = 65537
+
+# ARN of synthetic AWS KMS keys, which can be served by a local AWS KMS stand-in
+SYNTHETIC_KMS_KEY_ARN = "arn:aws:kms:us-west-2:111122223333:key/synthetic-{}"
+
+# Roles that each algorithm supports: encrypt-only AES keys would not be counted
+# consistently by the encrypt manifest generators, since they are not black-hole keys
+_ALGORITHM_ROLES = {
+    "aes": (ENCRYPT_DECRYPT,),
+    "rsa": ROLES,
+    "aws-kms": ROLES,
+}
+
+
+class SyntheticKey(object):
+    """A key to add to a synthetic keys manifest.
+
+    :param str name: Name of the key in the keys manifest
+    :param str algorithm: ``aes``, ``rsa`` or ``aws-kms``
+    :param int bits: Key size in bits, or None for AWS KMS keys
+    :param str role: ``encrypt-decrypt`` or ``encrypt-only``
+    :param material: Key bytes for AES keys, PEM encoded key for RSA keys or ARN for AWS KMS keys
+    """
+
+    def __init__(self, name, algorithm, bits, role, material):
+        self.name = name
+        self.algorithm = algorithm
+        self.bits = bits
+        self.role = role
+        self.material = material
+
+
+def _check_spec_entry(entry):
+    algorithm = entry.get("algorithm", None)
+    if algorithm not in _ALGORITHM_ROLES:
+        raise ValueError(
+            "Invalid key spec entry {}: algorithm must be one of {}".format(
+                json.dumps(entry), ", ".join(sorted(_ALGORITHM_ROLES))
+            )
+        )
+    if entry.get("role", ENCRYPT_DECRYPT) not in _ALGORITHM_ROLES[algorithm]:
+        raise ValueError(
+            "Invalid key spec entry {}: {} keys support the roles {}".format(
+                json.dumps(entry), algorithm, ", ".join(_ALGORITHM_ROLES[algorithm])
+            )
+        )
+    allowed_bits = {"aes": AES_KEY_BITS, "rsa": RSA_KEY_BITS}.get(algorithm, (None,))
+    if entry.get("bits", None) not in allowed_bits:
+        raise ValueError(
+            "Invalid key spec entry {}: {} keys {}".format(
+                json.dumps(entry),
+                algorithm,
+                "do not have a size"
+                if allowed_bits == (None,)
+                else "must have bits of {}".format(", ".join(str(bits) for bits in allowed_bits)),
+            )
+        )
+    if not isinstance(entry.get("count", None), int) or entry["count"] < 0:
+        raise ValueError(
+            "Invalid key spec entry {}: count must be a non-negative integer".format(
+                json.dumps(entry)
+            )
+        )
+
+
+def load_key_spec(filename):
+    """Load a key spec, which lists how many keys of each algorithm, size and role to generate::
+
+        {
+            "keys": [
+                {"algorithm": "rsa", "bits": 2048, "role": "encrypt-decrypt", "count": 100},
+                {"algorithm": "rsa", "bits": 4096, "role": "encrypt-only", "count": 10},
+                {"algorithm": "aes", "bits": 256, "count": 20},
+                {"algorithm": "aws-kms", "role": "encrypt-only", "count": 5}
+            ]
+        }
+
+    ``role`` defaults to ``encrypt-decrypt``. Encrypt-only RSA keys are public keys and
+    encrypt-only AWS KMS keys cannot be decrypted with; AES keys are always encrypt-decrypt.
+
+    :param str filename: Name of file containing the key spec
+    :returns: Key spec entries
+    :rtype: list of dict
+    :raises ValueError: if the key spec is invalid
+    """
+    with open(filename, "r") as spec_file:
+        spec = json.load(spec_file)
+    if not isinstance(spec, dict) or not isinstance(spec.get("keys", None), list):
+        raise ValueError("Invalid key spec: must be an object with a \"keys\" list")
+    for entry in spec["keys"]:
+        _check_spec_entry(entry)
+    return spec["keys"]
+
+
+def _key_name(algorithm, bits, role, index):
+    # Names start with the algorithm, which is how the generators identify the kind of key
+    if algorithm == "aes":
+        return "aes-{}-{}".format(bits, index)
+    if algorithm == "rsa":
+        key_type = "private" if role == ENCRYPT_DECRYPT else "public"
+        return "rsa-{}-{}-{}".format(bits, key_type, index)
+    if role == ENCRYPT_DECRYPT:
+        return "aws-kms-{}".format(index)
+    return "aws-kms-encrypt-only-{}".format(index)
+
+
+def _material_digest(seed, algorithm, bits, role, index):
+    """Digest that identifies the material of a synthetic key for a seed."""
+    return canonical_digest([str(seed), algorithm, bits, role, index])
+
+
+def _derive_aes_material(digest, bits):
+    return hashlib.sha256(digest.encode("utf-8")).digest()[: bits // 8]
+
+
+def _cache_filename(cache_directory, digest):
+    if cache_directory is None:
+        return None
+    return os.path.join(cache_directory, "{}.pem".format(digest))
+
+
+def _read_cached_pem(filename):
+    if filename is None:
+        return None
+    try:
+        with open(filename, "r") as pem_file:
+            return pem_file.read()
+    except FileNotFoundError:
+        return None
+
+
+def _generate_rsa_material(task):
+    """Generate a PEM encoded RSA key in a worker process, storing it in the cache if there is one.
+
+    :param tuple task: Key size in bits, role and cache filename or None
+    :rtype: str
+    """
+    bits, role, filename = task
+    private_key = rsa.generate_private_key(
+        public_exponent=RSA_PUBLIC_EXPONENT, key_size=bits, backend=default_backend()
+    )
+    if role == ENCRYPT_DECRYPT:
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    else:
+        pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+    pem = pem.decode("utf-8").strip()
+
+    if filename is not None:
+        # Concurrent runs must never read a partial key
+        atomic_write(filename, pem.encode("utf-8"))
+    return pem
+
+
+def generate_synthetic_keys(spec, seed=DEFAULT_SEED, jobs=None, cache_directory=None):
+    """Generate the keys described by a key spec.
+
+    AES key material is derived from the seed, so it is the same in every run. RSA keys are
+    generated at random on a pool of worker processes; with a cache directory, each RSA key is
+    stored there under a digest of the seed and its position in the spec, so later runs with the
+    same seed reuse it instead of generating it again. AWS KMS keys get synthetic ARNs.
+
+    :param list spec: Key spec entries, as returned by :func:`load_key_spec`
+    :param seed: Seed that identifies the generated key material
+    :param int jobs: Number of worker processes for RSA key generation (default: number of CPUs)
+    :param str cache_directory: Directory in which to cache generated RSA keys (optional)
+    :returns: Generated keys, in the order of the key spec
+    :rtype: list of :class:`SyntheticKey`
+    :raises ImportError: if RSA keys must be generated and cryptography is not installed
+    """
+    if cache_directory is not None:
+        os.makedirs(cache_directory, exist_ok=True)
+
+    keys = []
+    rsa_tasks = []
+    next_index = {}
+    for entry in spec:
+        algorithm = entry["algorithm"]
+        bits = entry.get("bits", None)
+        role = entry.get("role", ENCRYPT_DECRYPT)
+        for _ in range(entry["count"]):
+            index = next_index.get((algorithm, bits, role), 0)
+            next_index[(algorithm, bits, role)] = index + 1
+            name = _key_name(algorithm, bits, role, index)
+            digest = _material_digest(seed, algorithm, bits, role, index)
+
+            if algorithm == "aes":
+                material = _derive_aes_material(digest, bits)
+            elif algorithm == "rsa":
+                filename = _cache_filename(cache_directory, digest)
+                material = _read_cached_pem(filename)
+                if material is None:
+                    rsa_tasks.append((len(keys), (bits, role, filename)))
+            else:
+                material = SYNTHETIC_KMS_KEY_ARN.format(name)
+            keys.append(SyntheticKey(name, algorithm, bits, role, material))
+
+    if rsa_tasks:
+        if rsa is None:
+            raise ImportError("Generating RSA keys requires the cryptography package")
+        workers = min(jobs or multiprocessing.cpu_count(), len(rsa_tasks))
+        with multiprocessing.Pool(workers) as pool:
+            generated = pool.imap(_generate_rsa_material, [task for _, task in rsa_tasks])
+            for (position, _task), pem in zip(rsa_tasks, generated):
+                keys[position].material = pem
+    return keys
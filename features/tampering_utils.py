@@ -0,0 +1,192 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+# Only Python 3.6+ compatibility is guaranteed.
+
+import array
+import mmap
+import struct
+
+# Tampering methods that derive one vector per byte or per bit of a message
+BULK_TAMPERINGS = ("truncate", "mutate")
+
+# Each descriptor is the base ciphertext index, byte offset and bit index, little-endian.
+# Truncated vectors have a bit index of -1 and end before the byte at the offset.
+DESCRIPTOR = struct.Struct("<IQb")
+TRUNCATED = -1
+
+_DESCRIPTORS_MAGIC = b"TVD1"
+
+
+def tampered_vector_count(tampering, length):
+    """Count the vectors that a bulk tampering method derives from a message.
+
+    :param str tampering: ``truncate`` or ``mutate``
+    :param int length: Length of the message in bytes
+    """
+    if tampering == "truncate":
+        return max(0, length - 1)
+    if tampering == "mutate":
+        return length * 8
+    raise ValueError("Unknown bulk tampering method: \"{}\"".format(tampering))
+
+
+def tampered_descriptors(tampering, length):
+    """Describe every vector that a bulk tampering method derives from a message.
+
+    ``truncate`` keeps the first N bytes, for every N from 1 to one less than the message length.
+    ``mutate`` flips bit N, for every N from 0 to one less than the number of bits in the message,
+    counting from the least significant bit of the first byte.
+
+    :param str tampering: ``truncate`` or ``mutate``
+    :param int length: Length of the message in bytes
+    :returns: Iterator of ``(offset, bit)`` pairs
+    """
+    if tampering == "truncate":
+        return ((offset, TRUNCATED) for offset in range(1, length))
+    if tampering == "mutate":
+        return ((offset, bit) for offset in range(length) for bit in range(8))
+    raise ValueError("Unknown bulk tampering method: \"{}\"".format(tampering))
+
+
+def tampered_parts(base, offset, bit):
+    """Get the parts that make up a single tampered variant of a message, in order,
+    without copying the message.
+
+    :param memoryview base: Message from which the variant is derived
+    :param int offset: Byte offset from a descriptor
+    :param int bit: Bit index from a descriptor
+    :rtype: tuple
+    """
+    if bit == TRUNCATED:
+        return (base[:offset],)
+    flipped = bytes((base[offset] ^ (1 << bit),))
+    return (base[:offset], flipped, base[offset + 1:])
+
+
+class TamperedVectors(object):
+    """Tampered variants of a base ciphertext, read through a memory map.
+
+    Variants are never built in full: each one is exposed as a few memory views into the
+    base ciphertext, plus a single changed byte for mutated variants.
+
+    :param str filename: Name of file containing the base ciphertext
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as base_file:
+            self._map = mmap.mmap(base_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._base = memoryview(self._map)
+
+    def __len__(self):
+        return len(self._base)
+
+    def descriptors(self, tampering):
+        """Describe every vector that a bulk tampering method derives from the base ciphertext.
+
+        :param str tampering: ``truncate`` or ``mutate``
+        """
+        return tampered_descriptors(tampering, len(self._base))
+
+    def parts(self, offset, bit):
+        """Get the parts that make up a single variant, in order, without copying the base.
+
+        :param int offset: Byte offset from a descriptor
+        :param int bit: Bit index from a descriptor
+        :rtype: tuple
+        """
+        return tampered_parts(self._base, offset, bit)
+
+    def vector(self, offset, bit):
+        """Build a single variant.
+
+        :param int offset: Byte offset from a descriptor
+        :param int bit: Bit index from a descriptor
+        :rtype: bytes
+        """
+        return b"".join(self.parts(offset, bit))
+
+    def write_vector(self, stream, offset, bit):
+        """Write a single variant to a binary stream.
+
+        :param stream: Binary stream
+        :param int offset: Byte offset from a descriptor
+        :param int bit: Bit index from a descriptor
+        :returns: Number of bytes written
+        """
+        written = 0
+        for part in self.parts(offset, bit):
+            stream.write(part)
+            written += len(part)
+        return written
+
+    def write_packed(self, stream, tampering):
+        """Write every variant derived by a bulk tampering method back to back to a binary stream.
+
+        :param stream: Binary stream
+        :param str tampering: ``truncate`` or ``mutate``
+        :returns: Index of the stream offset at which each variant starts, followed by the
+            offset of the end of the last variant
+        :rtype: array.array
+        """
+        index = array.array("Q", [stream.tell()])
+        for offset, bit in self.descriptors(tampering):
+            index.append(index[-1] + self.write_vector(stream, offset, bit))
+        return index
+
+    def close(self):
+        """Unmap the base ciphertext. Memory views returned by :meth:`parts` must be released first."""
+        self._base.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_descriptors(stream, bases):
+    """Write compact descriptors for every vector derived from several base ciphertexts.
+
+    :param stream: Binary stream
+    :param bases: Iterable of ``(tampering, length)`` pairs, one per base ciphertext; base
+        ciphertext indexes in the descriptors count from zero in this order
+    :returns: Number of descriptors written
+    """
+    stream.write(_DESCRIPTORS_MAGIC)
+    count = 0
+    for base_index, (tampering, length) in enumerate(bases):
+        for offset, bit in tampered_descriptors(tampering, length):
+            stream.write(DESCRIPTOR.pack(base_index, offset, bit))
+            count += 1
+    return count
+
+
+def read_descriptors(stream):
+    """Read descriptors written by :func:`write_descriptors`.
+
+    :param stream: Binary stream
+    :returns: Iterator of ``(base_index, offset, bit)`` tuples
+    :raises ValueError: if the stream does not contain descriptors
+    """
+    if stream.read(len(_DESCRIPTORS_MAGIC)) != _DESCRIPTORS_MAGIC:
+        raise ValueError("Stream does not contain tampered vector descriptors")
+    while True:
+        chunk = stream.read(DESCRIPTOR.size * 4096)
+        if not chunk:
+            return
+        if len(chunk) % DESCRIPTOR.size:
+            raise ValueError("Tampered vector descriptors are truncated")
+        for descriptor in DESCRIPTOR.iter_unpack(chunk):
+            yield descriptor